@@ -60,7 +60,9 @@ app_configs = [
     },
     {
         "conf_title": "Art of Rally (Multi)",
-        "directory": "~/Games/art_of_rally$i/game",
+        # Each instance gets a private copy-on-write view of one install.
+        "directory": "~/Games/art_of_rally/game",
+        "overlays": [{"src": "~/Games/art_of_rally"}],
         "command": "./artofrally.x64",
         "window_title": "art of rally",
         "x_res": 1920,
@@ -107,6 +109,25 @@ app_configs = [
         "disable_time_control": False,
         "command": "./bounce_rl/configs/run_noita.sh",
         "directory": "$PROJECT_ROOT",
+        # Gives each instance a private copy of Noita's wine prefix, which
+        # run_noita.sh would otherwise copy on every launch. It still does when
+        # bwrap is too old to mount overlays, see container.overlay_args.
+        "overlays": [
+            {
+                "src": "~/.steam/steam/steamapps/compatdata/881100",
+                "dest": "$ENV_PREFIX/compatdata",
+            },
+            # Each instance starts from its own copy-on-write view of the save
+            # snapshot.
+            {
+                "src": "$SAVE_SNAPSHOT/save00",
+                "dest": "$ENV_PREFIX/compatdata/pfx/drive_c/users/steamuser/AppData/LocalLow/Nolla_Games_Noita/save00",
+            },
+            {
+                "src": "$SAVE_SNAPSHOT/save_shared",
+                "dest": "$ENV_PREFIX/compatdata/pfx/drive_c/users/steamuser/AppData/LocalLow/Nolla_Games_Noita/save_shared",
+            },
+        ],
         "window_title": "Noita.*",
         "keyboard_config": {
             "sequence_keydown_time": 0.08,
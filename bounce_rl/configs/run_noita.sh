@@ -11,16 +11,25 @@ export RUN_COMPAT_DATA="$ENV_PREFIX/compatdata"
 export PROTON_ROOT="$ENV_PREFIX/compatdata/pfx"
 
 log "Setting up Noita game files at: $PROTON_ROOT"
-rm -rf $PROTON_ROOT
-mkdir -p $(dirname $PROTON_ROOT)
-cp -r $GAME_COMPAT_DATA $RUN_COMPAT_DATA 
-
-mkdir -p $PROTON_ROOT/drive_c/users/steamuser/AppData/LocalLow/Nolla_Games_Noita/save_shared
-rm -rf $PROTON_ROOT/drive_c/users/steamuser/AppData/LocalLow/Nolla_Games_Noita/save0*
-cp -f bounce_rl/environments/noita/mod/golden_config.xml \
-  $PROTON_ROOT/drive_c/users/steamuser/AppData/LocalLow/Nolla_Games_Noita/save_shared/config.xml
-cp -r bounce_rl/environments/noita/initial_save00 \
-      $PROTON_ROOT/drive_c/users/steamuser/AppData/LocalLow/Nolla_Games_Noita/save00
+if mountpoint -q "$RUN_COMPAT_DATA"; then
+    # The launcher mounted a private overlay of the game's compat data.
+    log "Using compat data overlay"
+else
+    rm -rf $PROTON_ROOT
+    mkdir -p $(dirname $PROTON_ROOT)
+    cp -r $GAME_COMPAT_DATA $RUN_COMPAT_DATA 
+fi
+
+SAVE_ROOT="$PROTON_ROOT/drive_c/users/steamuser/AppData/LocalLow/Nolla_Games_Noita"
+if mountpoint -q "$SAVE_ROOT/save00"; then
+    # The launcher mounted overlays of the save snapshot.
+    log "Using save snapshot overlay"
+else
+    mkdir -p $SAVE_ROOT/save_shared
+    rm -rf $SAVE_ROOT/save0*
+    cp -f $SAVE_SNAPSHOT/save_shared/config.xml $SAVE_ROOT/save_shared/config.xml
+    cp -r $SAVE_SNAPSHOT/save00 $SAVE_ROOT/save00
+fi
 rm -rf $HOME/.steam/steam/steamapps/common/Noita/mods/rl_mod
 ln -s $(pwd)/bounce_rl/environments/noita/mod $HOME/.steam/steam/steamapps/common/Noita/mods/rl_mod
 
@@ -2,12 +2,12 @@ import atexit
 import json
 import logging
 import os
-import shlex
 import signal
 import string
 import subprocess
 import sys
 import time
+import xmlrpc.client
 from typing import Any, Dict, List, Optional
 
 import numpy as np
@@ -18,9 +18,10 @@ from Xlib import display
 
 from bounce_rl.core.image_capture import image_capture
 from bounce_rl.core.keyboard import keyboard
-from bounce_rl.core.launcher.launcher import Launcher
+from bounce_rl.core.launcher import launcher_client, placement
 from bounce_rl.utilities import fps_helper, util
 from bounce_rl.utilities.paths import project_root
+from bounce_rl.x_proxy import proxy_control
 
 logging.basicConfig(level=logging.DEBUG, format="%(asctime)s %(levelname)s %(message)s")
 
@@ -125,17 +126,43 @@ class Harness(object):
         self.keyboard = None
         self.full_window_capture = None
         self.ready = False
-        self.proxy_subproc: Optional[Any] = None
-        self.launcher = Launcher()
+        self.proxy_control: Optional[proxy_control.ProxyControl] = None
+        self.proxy_display: Optional[int] = None
+        # All instances share one launcher daemon, which is started on first use.
+        self.launcher = launcher_client.connect(
+            pin_cpus=self.run_config.get("pin_cpus", False)
+        )
+        self.service_cpus = None
+        if self.run_config.get("pin_cpus", False):
+            self._pin_cpus()
 
         atexit.register(self._kill_subprocesses)
         self._launch_app()
 
+    def _pin_cpus(self):
+        """Pins this process to the instance's env CPUs. The game and the proxy are
+        pinned when they're launched."""
+        cpu_placement = self.launcher.placement(self.instance + 1)
+        env_cpus = cpu_placement["instances"][str(self.instance)]["env"]
+        placement.pin(os.getpid(), set(env_cpus))
+        self.service_cpus = cpu_placement["service"]
+        logging.info("Instance %d CPU placement: %s", self.instance, cpu_placement)
+
     def _kill_subprocesses(self):
-        self.launcher.kill_instance(self.instance)
-        if self.proxy_subproc is not None:
-            self.proxy_subproc.kill()
-            self.proxy_subproc = None
+        try:
+            self.launcher.kill_instance(self.instance)
+        except (OSError, xmlrpc.client.Error):
+            logging.warning("Couldn't kill instance %d", self.instance)
+        if self.proxy_control is not None:
+            try:
+                self.proxy_control.remove_display(self.proxy_display)
+            except (OSError, RuntimeError):
+                logging.warning(
+                    "Couldn't remove X proxy display %s", self.proxy_display
+                )
+            self.proxy_control.close()
+            self.proxy_control = None
+            self.proxy_display = None
 
     def _launch_x_proxy(self) -> int:
         host_x_display = os.environ.get("DISPLAY", ":0")
@@ -147,18 +174,15 @@ class Harness(object):
         )
         subprocess.run(command, shell=True)
 
-        subprocess.run(shlex.split(f"rm -f /tmp/.X11-unix/X{proxy_x_display}"))
-        self.proxy_subproc = subprocess.Popen(
-            [
-                "python",
-                f"{project_root()}/bounce_rl/x_multiseat/proxy.py",
-                "--proxy_display",
-                f"{proxy_x_display}",
-                "--real_display",
-                host_x_display,
-            ]
-        )
-        time.sleep(0.1)
+        # All instances share one proxy service, which is started on first use.
+        self.proxy_control = proxy_control.connect(cpus=self.service_cpus)
+        self.proxy_control.add_display(proxy_x_display, host_x_display)
+        self.proxy_display = proxy_x_display
+        # Clients see the real pointer until input moves it, unless the run config
+        # pins it somewhere.
+        pointer = self.run_config.get("x_proxy_pointer")
+        if pointer is not None:
+            self.proxy_control.set_pointer(proxy_x_display, *pointer)
         return proxy_x_display
 
     def _launch_app(self):
@@ -188,6 +212,9 @@ class Harness(object):
             directory,
             json.dumps(env),
             self.app_config["window_title"],
+            self.run_config.get("pin_cpus", False),
+            self._overlays(env),
+            self.run_config.get("window_timeout", 120),
         )
 
         if len(windows) == 0:
@@ -205,6 +232,15 @@ class Harness(object):
 
         self._attach(windows[0])
 
+    def _overlays(self, env: Dict[str, str]) -> List[Dict[str, str]]:
+        """Returns the app's overlays with $i, $PROJECT_ROOT and the app's
+        environment variables substituted into their paths."""
+        mapping = dict(env, i=self.instance, PROJECT_ROOT=project_root())
+        return [
+            {k: string.Template(v).safe_substitute(mapping) for k, v in o.items()}
+            for o in self.app_config.get("overlays", [])
+        ]
+
     def _attach(self, window_id):
         window = self.display.create_resource_object("window", window_id)
         x = 100 + int(self.run_config["scale"] * self.run_config["x_res"] * self.x_pos)
@@ -229,6 +265,8 @@ class Harness(object):
             y,
             self.app_config.get("keyboard_config", {}),
             instance=self.instance,
+            proxy=self.proxy_control,
+            proxy_display=self.proxy_display,
         )
         # Noita environment can't have mouse over a menu item at launch.
         # The enviroment would like to configure this mouse move at launch,
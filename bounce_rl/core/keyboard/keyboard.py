@@ -11,7 +11,7 @@ import subprocess
 import threading
 import time
 from enum import Enum
-from typing import Set, Union
+from typing import Any, Dict, Iterable, List, Optional, Set, Union
 
 import numpy as np
 import Xlib.display
@@ -22,6 +22,7 @@ import Xlib.xobject
 from Xlib.ext import xinput
 
 from bounce_rl.core.keyboard import lib_mpx_input
+from bounce_rl.x_proxy import proxy_control
 
 
 def keysym_for_key_name(key_name):
@@ -59,7 +60,12 @@ class Keyboard(object):
         window_y: int = 0,
         keyboard_config: dict = {},
         instance: int = 0,
+        proxy: Optional[proxy_control.ProxyControl] = None,
+        proxy_display: Optional[int] = None,
     ):
+        """If proxy is given, input is injected by the X proxy into the window's
+        connection on proxy_display instead of going through the instance's MPX
+        cursor."""
         self.last_keymap = np.zeros(84)
         self.window = window
         print("Keyboard win:", window)
@@ -69,11 +75,21 @@ class Keyboard(object):
         self.window_w = 640
         self.window_h = 360
         self.py_xlib_display = display
-        self.lib_mpx_input, self.lib_mpx_input_ffi = lib_mpx_input.make_lib_mpx_input()
-        self.display = self.lib_mpx_input.open_display("".encode())
-        self.lib_mpx_input.assign_cursor(
-            self.display, self.window.id, lib_mpx_input.cursor_name(instance).encode()
-        )
+        self.proxy = proxy
+        self.proxy_display = proxy_display
+        # Window relative pointer position and button state for proxy input.
+        self.pointer = (0, 0)
+        self.button_state = 0
+        if self.proxy is None:
+            self.lib_mpx_input, self.lib_mpx_input_ffi = (
+                lib_mpx_input.make_lib_mpx_input()
+            )
+            self.display = self.lib_mpx_input.open_display("".encode())
+            self.lib_mpx_input.assign_cursor(
+                self.display,
+                self.window.id,
+                lib_mpx_input.cursor_name(instance).encode(),
+            )
 
         self.sequence_keydown_time = keyboard_config.get("sequence_keydown_time", 0.25)
 
@@ -163,11 +179,9 @@ class Keyboard(object):
     # error prone.
     def set_held_keys(self, key_set):
         # Implements re-press key mode.
-        for key in self.held_keys:
-            self.release_key(key)
+        self._change_keys(self.held_keys, Keyboard.RELEASE)
         time.sleep(0.01)
-        for key in key_set:
-            self.press_key(key)
+        self._change_keys(key_set, Keyboard.PRESS)
         self.held_keys = key_set
 
         # Implements delta key mode.
@@ -224,30 +238,103 @@ class Keyboard(object):
         keycode = display.keysym_to_keycode(keysym)
         return keycode
 
+    def _proxy_event(
+        self, event_type: str, detail: int = 0, state: int = 0
+    ) -> Dict[str, Any]:
+        x, y = self.pointer
+        return {
+            "type": event_type,
+            "detail": detail,
+            "x": x,
+            "y": y,
+            "root_x": x + self.window_x,
+            "root_y": y + self.window_y,
+            "state": state | self.button_state,
+        }
+
+    def _send_proxy_events(self, events: List[Dict[str, Any]]):
+        if events:
+            self.proxy.send_input(self.proxy_display, self.window.id, events)
+
+    def _send_proxy_event(self, event_type: str, detail: int = 0, state: int = 0):
+        self._send_proxy_events([self._proxy_event(event_type, detail, state)])
+
+    def _key_proxy_event(
+        self, key_name: str, direction: int, modifier=0
+    ) -> Dict[str, Any]:
+        keycode = self.key_name_to_keycode(self.py_xlib_display, key_name)
+        event_type = "key_press" if direction == Keyboard.PRESS else "key_release"
+        return self._proxy_event(event_type, keycode, int(modifier))
+
     def _change_key(self, key_name: str, direction: int, modifier=0):
+        if self.proxy is not None:
+            self._send_proxy_events(
+                [self._key_proxy_event(key_name, direction, modifier)]
+            )
+            return
         keycode = self.key_name_to_keycode(self.py_xlib_display, key_name)
         self.lib_mpx_input.key_event(self.display, keycode, direction)
 
+    def _change_keys(self, key_names: Iterable[str], direction: int):
+        """Presses or releases the keys. Through the proxy, the whole chord is
+        sent in one call."""
+        if self.proxy is not None:
+            self._send_proxy_events(
+                [self._key_proxy_event(key, direction) for key in key_names]
+            )
+            return
+        for key in key_names:
+            self._change_key(key, direction)
+
     def move_mouse(self, x: Union[int, float], y: Union[int, float]) -> None:
         x = min(max(int(x), 1), self.window_w - 1)
         y = min(max(int(y), 1), self.window_h - 1)
+        if self.proxy is not None:
+            self.pointer = (x, y)
+            self._send_proxy_event("motion")
+            return
         x = x + self.window_x
         y = y + self.window_y
         self.lib_mpx_input.move_mouse(self.display, x, y)
 
+    def _button_proxy_event(
+        self, button: MouseButton, direction: int
+    ) -> Dict[str, Any]:
+        # Each event's state holds the buttons down before it, so update the state
+        # after building the event.
+        mask = Xlib.X.Button1Mask << (button.value - 1)
+        if direction == Keyboard.PRESS:
+            event = self._proxy_event("button_press", button.value)
+            self.button_state |= mask
+        else:
+            event = self._proxy_event("button_release", button.value)
+            self.button_state &= ~mask
+        return event
+
     def set_mouse_button(self, button: MouseButton, direction: int) -> None:
+        if self.proxy is not None:
+            self._send_proxy_events([self._button_proxy_event(button, direction)])
+            return
         self.lib_mpx_input.button_event(self.display, button.value, direction)
 
+    def _set_mouse_buttons(self, buttons: Iterable[MouseButton], direction: int):
+        if self.proxy is not None:
+            self._send_proxy_events(
+                [self._button_proxy_event(button, direction) for button in buttons]
+            )
+            return
+        for button in buttons:
+            self.set_mouse_button(button, direction)
+
     def set_held_mouse_buttons(self, mouse_buttons: Set[MouseButton]):
         # Implements re-press mouse mode.
-        for button in self.held_mouse_buttons:
-            self.set_mouse_button(button, Keyboard.RELEASE)
+        self._set_mouse_buttons(self.held_mouse_buttons, Keyboard.RELEASE)
         time.sleep(0.01)
-        for button in mouse_buttons:
-            self.set_mouse_button(button, Keyboard.PRESS)
+        self._set_mouse_buttons(mouse_buttons, Keyboard.PRESS)
         self.held_mouse_buttons = mouse_buttons
 
     def cleanup(self):
-        self.lib_mpx_input.close_display(self.display)
+        if self.proxy is None:
+            self.lib_mpx_input.close_display(self.display)
         self.should_run_failsafe = False
         self.failsafe_thread.join()
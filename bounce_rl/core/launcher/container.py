@@ -1,66 +1,121 @@
+import functools
+import logging
 import os
+import re
 import shlex
 import subprocess
-from typing import Dict, Optional, Tuple
+import time
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+
+def _children(pid: int) -> List[int]:
+    """Returns the pids of pid's child processes, or [] if it has exited."""
+    children = []
+    try:
+        tasks = os.listdir(f"/proc/{pid}/task")
+    except FileNotFoundError:
+        return []
+    for tid in tasks:
+        try:
+            with open(f"/proc/{pid}/task/{tid}/children") as f:
+                children.extend(int(c) for c in f.read().split())
+        except FileNotFoundError:
+            # Either the thread exited or the kernel lacks CONFIG_PROC_CHILDREN.
+            if not os.path.exists(f"/proc/{pid}/task/{tid}"):
+                continue
+            return [c for c, ppid in _all_parents().items() if ppid == pid]
+    return children
 
 
-def _run_cmd(cmd: str, stderr_devnull=False) -> str:
-    stderr = None
-    if stderr_devnull:
-        stderr = subprocess.DEVNULL
-    p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=stderr)
-    out, _ = p.communicate()
-    return out.decode().strip()
+def _all_parents() -> Dict[int, int]:
+    """Returns a map from every host pid to its parent's pid."""
+    parents = {}
+    with os.scandir("/proc") as entries:
+        for entry in entries:
+            if not entry.name.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry.name}/stat") as f:
+                    stat = f.read()
+            except (FileNotFoundError, ProcessLookupError):
+                continue
+            # The command name can contain spaces and parens, so split after it.
+            parents[int(entry.name)] = int(stat[stat.rindex(")") + 2 :].split()[1])
+    return parents
+
+
+def _descendants(pid: int) -> Set[int]:
+    descendants = set()
+    to_visit = [pid]
+    while to_visit:
+        for child in _children(to_visit.pop()):
+            if child not in descendants:
+                descendants.add(child)
+                to_visit.append(child)
+    return descendants
+
+
+def _ns_pid(pid: int) -> Optional[int]:
+    """Returns pid's pid in its innermost namespace."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("NSpid:"):
+                    return int(line.split()[-1])
+    except (FileNotFoundError, ProcessLookupError):
+        pass
+    return None
 
 
 def get_child_pid(parent_pid: int) -> Optional[int]:
-    pids = _run_cmd(rf"ps -A -o ppid,pid | grep '^\s*{parent_pid}'")
-    if not pids:
+    children = _children(parent_pid)
+    if not children:
         return None
-
-    for line in pids.split("\n"):
-        child_pid = line.strip().split()[1]
-        return int(child_pid)
-    return None
+    return min(children)
 
 
 def get_pid_ns(pid: int) -> int:
-    pidns = _run_cmd(f"ls -Li /proc/{pid}/ns/pid | awk '{{print $1}}'")
-    return int(pidns)
+    return os.stat(f"/proc/{pid}/ns/pid").st_ino
 
 
 # Maps from container pid to host pids.
 # Note: Containers can have overlapping pid spaces. If you're getting an abitrary PID, you can't know
 # which container it might be from.
 class PIDMapper:
-    def __init__(self, pidns: int):
+    def __init__(self, pidns: int, root_pid: Optional[int] = None):
+        """If root_pid is given, only root_pid's descendants are searched, otherwise
+        every process on the host is."""
         self.pidns = pidns
+        self.root_pid = root_pid
         self._pid_map: Dict[int, int] = {}
+        # Host pids that have already been looked at, mapped to their container pid
+        # or None if they're in another namespace.
+        self._seen: Dict[int, Optional[int]] = {}
+
+    def _candidates(self) -> Set[int]:
+        if self.root_pid is not None:
+            return _descendants(self.root_pid)
+        with os.scandir("/proc") as entries:
+            return {int(e.name) for e in entries if e.name.isdigit()}
 
     def _refresh(self):
-        self._pid_map = {}
-
-        lines = _run_cmd(
-            "cat /proc/*/status | grep 'NSpid' | awk '{print $2, $NF}'"
-        ).split("\n")
-        host_to_container = {int(v.split()[0]): int(v.split()[1]) for v in lines}
-
-        lines = _run_cmd(
-            "ls -Li /proc/*/ns/pid | awk -F'[ /]' '{print $1, $4}'", stderr_devnull=True
-        ).split("\n")
-        host_to_ns = {}
-        for v in lines:
+        """Reads the namespace of processes that weren't seen by earlier refreshes
+        and forgets processes that have exited."""
+        pids = self._candidates()
+        for pid in self._seen.keys() - pids:
+            container_pid = self._seen.pop(pid)
+            if self._pid_map.get(container_pid) == pid:
+                del self._pid_map[container_pid]
+
+        for pid in pids - self._seen.keys():
             try:
-                host_to_ns[int(v.split()[1])] = int(v.split()[0])
-            except ValueError:
-                pass
-
-        for pid, container_pid in host_to_container.items():
-            if pid not in host_to_ns:
+                in_ns = get_pid_ns(pid) == self.pidns
+            except (FileNotFoundError, ProcessLookupError, PermissionError):
                 continue
-            if host_to_ns[pid] != self.pidns:
-                continue
-            self._pid_map[container_pid] = pid
+            container_pid = _ns_pid(pid) if in_ns else None
+            self._seen[pid] = container_pid
+            if container_pid is not None:
+                self._pid_map[container_pid] = pid
 
     def get(self, container_pid: int) -> Optional[int]:
         if container_pid not in self._pid_map:
@@ -70,19 +125,76 @@ class PIDMapper:
         return self._pid_map[container_pid]
 
 
+# The first bwrap release with --overlay-src and --tmp-overlay.
+OVERLAY_BWRAP_VERSION = (0, 10)
+
+
+@functools.lru_cache(maxsize=None)
+def _bwrap_version() -> Optional[Tuple[int, ...]]:
+    """Returns the installed bwrap's version or None if it can't be found."""
+    try:
+        output = subprocess.run(
+            ["bwrap", "--version"], capture_output=True, text=True
+        ).stdout
+    except FileNotFoundError:
+        return None
+    match = re.search(r"(\d+(?:\.\d+)+)", output)
+    return tuple(int(n) for n in match.group(1).split(".")) if match else None
+
+
+def supports_overlays() -> bool:
+    version = _bwrap_version()
+    return version is not None and version >= OVERLAY_BWRAP_VERSION
+
+
+def overlay_args(overlays: Sequence[Dict[str, str]]) -> List[str]:
+    """Returns bwrap arguments that mount a private, writable copy of each overlay's
+    "src" directory at its "dest", by default over src itself.
+
+    Writes go to a tmpfs that's discarded with the container, the source is never
+    modified. Bwrap older than 0.10 can't mount overlays, so none are mounted and
+    apps fall back to their own per instance copies, as run_noita.sh does."""
+    if overlays and not supports_overlays():
+        logging.warning(
+            "bwrap %s can't mount overlays, launching without them.",
+            ".".join(str(n) for n in _bwrap_version() or ()) or "version unknown",
+        )
+        return []
+    args = []
+    for overlay in overlays:
+        src = os.path.expanduser(overlay["src"])
+        dest = os.path.expanduser(overlay.get("dest", src))
+        args += ["--overlay-src", src, "--tmp-overlay", dest]
+    return args
+
+
 def launch_process_container(
-    cmd: str, directory: str, env: Dict[str, str]
+    cmd: str,
+    directory: str,
+    env: Dict[str, str],
+    cpus: Optional[Set[int]] = None,
+    overlays: Sequence[Dict[str, str]] = (),
 ) -> Tuple[int, int, PIDMapper]:
     """Starts the given commands in a new pid namespace.
 
     When the returned process exits or is killed, all programs in the
-    namespace will be killed."""
-
-    launch_cmd = shlex.split(
-        f"bwrap --unshare-pid --bind / / "
+    namespace will be killed. If cpus is given, the programs only run on those
+    CPUs. Overlays are mounted in the namespace, see overlay_args."""
+
+    launch_cmd = ["bwrap", "--unshare-pid", "--bind", "/", "/"]
+    overlay = overlay_args(overlays)
+    launch_cmd += overlay
+    if overlay and directory:
+        # Start in the overlay if one covers the working directory.
+        launch_cmd += ["--chdir", directory]
+    launch_cmd += shlex.split(
         "--proc /proc --dev-bind /dev /dev "
         f"--unshare-user --uid {os.getuid()} --gid {os.getgid()} {cmd}"
     )
+    if cpus:
+        launch_cmd = ["taskset", "-c", ",".join(str(c) for c in sorted(cpus))] + (
+            launch_cmd
+        )
     print("Parsed popen command: ", launch_cmd, flush=True)
     p = subprocess.Popen(launch_cmd, cwd=directory, env=env, stderr=subprocess.PIPE)
     _ = subprocess.Popen(
@@ -91,11 +203,16 @@ def launch_process_container(
         stderr=subprocess.STDOUT,
     )
     unshare_pid = p.pid
+    # bwrap forks the command after setting up the namespaces.
     cmd_pid = get_child_pid(unshare_pid)
+    deadline = time.monotonic() + 5
+    while cmd_pid is None and p.poll() is None and time.monotonic() < deadline:
+        time.sleep(0.005)
+        cmd_pid = get_child_pid(unshare_pid)
 
     print("Root pid:", p.pid, "unshare_pid:", unshare_pid, "cmd_pid:", cmd_pid)
 
     if cmd_pid is None:
         return -1, -1, PIDMapper(-1)
     pidns = get_pid_ns(cmd_pid)
-    return unshare_pid, cmd_pid, PIDMapper(pidns)
+    return unshare_pid, cmd_pid, PIDMapper(pidns, unshare_pid)
@@ -0,0 +1,88 @@
+import os
+import subprocess
+import unittest
+from unittest import mock
+
+from bounce_rl.core.launcher import container
+
+
+class TestPIDMapper(unittest.TestCase):
+    def setUp(self):
+        self.child = subprocess.Popen(["sleep", "10"])
+
+    def tearDown(self):
+        self.child.kill()
+        self.child.wait()
+
+    def test_get_child_pid(self):
+        self.assertEqual(container.get_child_pid(os.getpid()), self.child.pid)
+        self.assertIsNone(container.get_child_pid(self.child.pid))
+
+    def test_maps_descendants(self):
+        pidns = container.get_pid_ns(os.getpid())
+        self.assertEqual(pidns, os.stat("/proc/self/ns/pid").st_ino)
+
+        mapper = container.PIDMapper(pidns, os.getpid())
+        self.assertEqual(mapper.get(self.child.pid), self.child.pid)
+        self.assertIsNone(mapper.get(os.getpid()))
+
+        # Processes started after the first lookup are found by the next one.
+        grandchild = subprocess.Popen(["sleep", "10"])
+        try:
+            self.assertEqual(mapper.get(grandchild.pid), grandchild.pid)
+        finally:
+            grandchild.kill()
+            grandchild.wait()
+
+        # Exited processes are forgotten by the next refresh.
+        self.child.kill()
+        self.child.wait()
+        self.assertIsNone(mapper.get(-1))
+        self.assertNotIn(self.child.pid, mapper._pid_map)
+
+
+class TestOverlayArgs(unittest.TestCase):
+    OVERLAYS = [{"src": "~/game"}, {"src": "/data", "dest": "/tmp/env_0/data"}]
+
+    @mock.patch.object(container, "_bwrap_version", return_value=(0, 10, 0))
+    def test_overlay_args(self, _):
+        self.assertEqual(
+            container.overlay_args(self.OVERLAYS),
+            ["--overlay-src", os.path.expanduser("~/game")]
+            + ["--tmp-overlay", os.path.expanduser("~/game")]
+            + ["--overlay-src", "/data", "--tmp-overlay", "/tmp/env_0/data"],
+        )
+
+    def test_old_bwrap_gets_no_overlays(self):
+        for version in [(0, 8, 0), None]:
+            with mock.patch.object(container, "_bwrap_version", return_value=version):
+                self.assertFalse(container.supports_overlays())
+                with self.assertLogs(level="WARNING"):
+                    self.assertEqual(container.overlay_args(self.OVERLAYS), [])
+                # Nothing to warn about without overlays.
+                self.assertEqual(container.overlay_args([]), [])
+
+    @mock.patch.object(container, "_bwrap_version", return_value=(0, 8, 0))
+    @mock.patch.object(subprocess, "Popen", side_effect=OSError("not launched"))
+    def test_old_bwrap_launches_without_overlays(self, popen, _):
+        with self.assertLogs(level="WARNING"), self.assertRaises(OSError):
+            container.launch_process_container(
+                "./game", "/tmp", {}, overlays=self.OVERLAYS
+            )
+        command = popen.call_args[0][0]
+        self.assertNotIn("--overlay-src", command)
+        self.assertNotIn("--chdir", command)
+
+    def test_bwrap_version(self):
+        container._bwrap_version.cache_clear()
+        run = mock.Mock(return_value=mock.Mock(stdout="bubblewrap 0.10.0\n"))
+        with mock.patch.object(subprocess, "run", run):
+            self.assertEqual(container._bwrap_version(), (0, 10, 0))
+            self.assertEqual(container._bwrap_version(), (0, 10, 0))
+        # The version is only checked once.
+        run.assert_called_once()
+        container._bwrap_version.cache_clear()
+
+
+if __name__ == "__main__":
+    unittest.main()
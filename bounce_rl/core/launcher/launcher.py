@@ -1,27 +1,79 @@
+import argparse
+import atexit
 import json
 import logging
+import os
+import signal
+import socket
+import sys
+import threading
 import time
 from socketserver import ThreadingMixIn
-from typing import Any, List
+from typing import Any, Dict, List, Optional, Tuple
 from xmlrpc.server import SimpleXMLRPCRequestHandler, SimpleXMLRPCServer
 
 import Xlib.display
 
-from bounce_rl.core.launcher import container, x_search
+from bounce_rl.core.launcher import container, placement, x_search
+from bounce_rl.core.launcher.launcher_client import LAUNCHER_SOCKET
 
 logging.basicConfig(level=logging.DEBUG, format="%(asctime)s %(levelname)s %(message)s")
 
 
+class _Instance:
+    """A launched app and what's needed to relaunch it."""
+
+    def __init__(self, launch_args: Tuple, unshare_pid: int, init_pid: int):
+        self.launch_args = launch_args
+        self.unshare_pid = unshare_pid
+        self.init_pid = init_pid
+        self.windows: List[int] = []
+        self.launch_time = time.time()
+        self.exit_status: Optional[int] = None
+        self.cpus: List[int] = []
+
+    def poll(self) -> Optional[int]:
+        """Reaps the instance's container process if it has exited and returns its
+        exit status."""
+        if self.exit_status is None and self.unshare_pid > 0:
+            try:
+                pid, status = os.waitpid(self.unshare_pid, os.WNOHANG)
+            except ChildProcessError:
+                # Already reaped by subprocess, the exit status is lost.
+                self.exit_status = -1
+                return self.exit_status
+            if pid != 0 and os.WIFEXITED(status):
+                self.exit_status = os.WEXITSTATUS(status)
+            elif pid != 0:
+                self.exit_status = -os.WTERMSIG(status)
+        return self.exit_status
+
+
 class Launcher:
+    """Launches apps into containers and tracks them by instance number.
+
+    Usable in process or, through launcher_client, as a daemon shared by every
+    Harness on the machine."""
+
+    def __init__(self, cpu_placement: Optional[placement.Placement] = None):
+        self.instances: Dict[int, _Instance] = {}
+        self.lock = threading.Lock()
+        if cpu_placement is None:
+            cpu_placement = placement.Placement()
+        self.cpu_placement = cpu_placement
+
     def _find_windows(
         self,
         window_title: str,
         pid_mapper: container.PIDMapper,
         root_pid: int,
+        timeout: Optional[float] = None,
     ) -> List[int]:
         windows: List[Any] = []
-        lookup = x_search.WindowLookup(Xlib.display.Display(), pid_mapper, root_pid)
-        windows = lookup.get_owned_windows_with_name(window_title)
+        display = Xlib.display.Display()
+        lookup = x_search.WindowLookup(display, pid_mapper, root_pid)
+        windows = lookup.get_owned_windows_with_name(window_title, timeout)
+        display.close()
         return [w.id for w in windows]
 
     def launch_app(
@@ -31,20 +83,201 @@ class Launcher:
         directory: str,
         env_str: str,  # A json encoded Dict[str, str]
         window_title: str,
+        pin_cpus: bool = False,
+        overlays: Optional[List[Dict[str, str]]] = None,
+        window_timeout: float = 120,
     ) -> List[int]:
+        """Launches the app as the given instance, killing whatever was running as
+        that instance, and returns the app's windows. With pin_cpus, the app runs
+        on the instance's game CPUs. Overlays give the instance private copies of
+        directories, see container.overlay_args. If the app shows no window within
+        window_timeout seconds, the instance is killed and [] is returned."""
+        self.kill_instance(instance)
         env = json.loads(env_str)
+        cpus = self.cpu_placement.game(instance) if pin_cpus else None
         # TODO: Catch launch errors.
         unshare_pid, init_pid, pid_mapper = container.launch_process_container(
             command,
             directory,
             env,
+            cpus,
+            overlays or (),
         )
         logging.debug("Started unshare subprocess: %s", unshare_pid)
-        self.subprocess_pid = unshare_pid
-        self.pid_mapper = pid_mapper
-        windows = self._find_windows(window_title, pid_mapper, self.subprocess_pid)
-        print("Returning", windows)
-        return windows
+        launched = _Instance(
+            (
+                instance,
+                command,
+                directory,
+                env_str,
+                window_title,
+                pin_cpus,
+                overlays,
+                window_timeout,
+            ),
+            unshare_pid,
+            init_pid,
+        )
+        launched.cpus = sorted(cpus) if cpus else []
+        with self.lock:
+            self.instances[instance] = launched
+        launched.windows = self._find_windows(
+            window_title, pid_mapper, unshare_pid, window_timeout
+        )
+        if not launched.windows:
+            logging.error(
+                "Instance %d showed no window titled %r within %ss, killing it.",
+                instance,
+                window_title,
+                window_timeout,
+            )
+            with self.lock:
+                # Unless a concurrent launch already replaced it.
+                timed_out = self.instances.get(instance) is launched
+            if timed_out:
+                self.kill_instance(instance)
+            return []
+        logging.debug("Instance %d windows: %s", instance, launched.windows)
+        return launched.windows
+
+    def kill_instance(self, instance: int, timeout: float = 5) -> None:
+        """Kills the instance's container and everything in it. Does nothing if the
+        instance isn't running."""
+        with self.lock:
+            launched = self.instances.pop(instance, None)
+        if launched is None or launched.unshare_pid <= 0:
+            return
+        # Killing the container's root process takes down its whole pid namespace.
+        for sig, wait in ((signal.SIGTERM, timeout), (signal.SIGKILL, None)):
+            if launched.poll() is not None:
+                return
+            try:
+                os.kill(launched.unshare_pid, sig)
+            except ProcessLookupError:
+                return
+            deadline = time.monotonic() + (wait or timeout)
+            while launched.poll() is None and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+    def restart_instance(self, instance: int) -> List[int]:
+        """Kills and relaunches the instance with its original arguments."""
+        with self.lock:
+            launch_args = self.instances[instance].launch_args
+        return self.launch_app(*launch_args)
+
+    def instance_status(self, instance: int) -> Dict[str, Any]:
+        with self.lock:
+            launched = self.instances.get(instance)
+        if launched is None:
+            return {"running": False}
+        exit_status = launched.poll()
+        status = {
+            "running": exit_status is None,
+            "unshare_pid": launched.unshare_pid,
+            "init_pid": launched.init_pid,
+            "windows": launched.windows,
+            "cpus": launched.cpus,
+            "uptime": time.time() - launched.launch_time,
+        }
+        if exit_status is not None:
+            status["exit_status"] = exit_status
+        return status
+
+    def placement(self, n_instances: int) -> Dict[str, Any]:
+        """Returns the CPUs assigned to the learner, the shared services and the
+        first n_instances instances, see placement.Placement."""
+        return self.cpu_placement.report(n_instances)
+
+    def list_instances(self) -> List[int]:
+        with self.lock:
+            return sorted(self.instances)
+
+    def shutdown(self) -> None:
+        for instance in self.list_instances():
+            self.kill_instance(instance)
 
-    def kill_instance(self, instance: int) -> None:
+
+class LauncherServer(ThreadingMixIn, SimpleXMLRPCServer):
+    """Serves a Launcher over XML-RPC on a unix socket, one thread per request so
+    instances launch concurrently."""
+
+    address_family = socket.AF_UNIX
+    daemon_threads = True
+
+    def __init__(self, path: str, launcher: Launcher):
+        super().__init__(
+            path,
+            requestHandler=_UnixRequestHandler,
+            logRequests=False,
+            allow_none=True,
+        )
+        self.register_instance(launcher)
+
+
+class _UnixRequestHandler(SimpleXMLRPCRequestHandler):
+    # TCP_NODELAY doesn't apply to unix sockets.
+    disable_nagle_algorithm = False
+
+    def address_string(self) -> str:
+        # Unix socket clients have no address.
+        return "local"
+
+
+def _remove_socket(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
         pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--socket",
+        type=str,
+        default=LAUNCHER_SOCKET,
+        help="Path of the unix socket to serve the launcher on.",
+    )
+    parser.add_argument(
+        "--learner_cores",
+        type=int,
+        default=2,
+        help="Physical cores reserved for the learner when pinning CPUs.",
+    )
+    parser.add_argument(
+        "--service_cores",
+        type=int,
+        default=1,
+        help="Physical cores reserved for the X proxy and launcher when pinning CPUs.",
+    )
+    parser.add_argument(
+        "--pin_cpus",
+        action="store_true",
+        help="Run the daemon on the service cores.",
+    )
+    parser.add_argument(
+        "--game_cpus",
+        type=int,
+        default=None,
+        help="Logical CPUs per game when pinning CPUs. Defaults to a physical core.",
+    )
+    args = parser.parse_args()
+
+    launcher = Launcher(
+        placement.Placement(args.learner_cores, args.service_cores, args.game_cpus)
+    )
+    if args.pin_cpus and launcher.cpu_placement.service:
+        # Before the server starts, so its request threads inherit the affinity.
+        # Games are started under taskset, so they're free of it when pinned.
+        placement.pin(os.getpid(), launcher.cpu_placement.service)
+    _remove_socket(args.socket)
+    server = LauncherServer(args.socket, launcher)
+
+    def on_exit():
+        launcher.shutdown()
+        _remove_socket(args.socket)
+
+    atexit.register(on_exit)
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(signum, lambda signum, frame: sys.exit(0))
+    server.serve_forever()
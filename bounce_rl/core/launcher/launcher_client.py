@@ -0,0 +1,90 @@
+import fcntl
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import time
+import xmlrpc.client
+from typing import List
+
+from bounce_rl.core.launcher import placement
+from bounce_rl.utilities.paths import project_root
+
+LAUNCHER_SOCKET = "/tmp/bounce_rl_launcher"
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+class _UnixTransport(xmlrpc.client.Transport):
+    def __init__(self, path: str, timeout: float):
+        super().__init__()
+        self.path = path
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        return _UnixConnection(self.path, self.timeout)
+
+
+def server_proxy(
+    path: str = LAUNCHER_SOCKET, timeout: float = 600
+) -> xmlrpc.client.ServerProxy:
+    """Returns an XML-RPC proxy for the launcher daemon on path. Calls block until
+    the daemon answers, launches wait for the app's window."""
+    return xmlrpc.client.ServerProxy(
+        "http://localhost/", transport=_UnixTransport(path, timeout), allow_none=True
+    )
+
+
+def _is_running(path: str) -> bool:
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+        return True
+    except (FileNotFoundError, ConnectionRefusedError):
+        return False
+    finally:
+        probe.close()
+
+
+def connect(
+    path: str = LAUNCHER_SOCKET, startup_timeout: float = 10, pin_cpus: bool = False
+) -> xmlrpc.client.ServerProxy:
+    """Connects to the launcher daemon, starting it if it isn't running. With
+    pin_cpus, a daemon started by this call only runs on its service cores."""
+    # Serialize startup across processes so only one daemon gets started.
+    with open(path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not _is_running(path):
+            subprocess.Popen(
+                [sys.executable, "-m", "bounce_rl.core.launcher.launcher"]
+                + ["--socket", path]
+                + (["--pin_cpus"] if pin_cpus else []),
+                cwd=project_root(),
+                start_new_session=True,
+            )
+            start = time.monotonic()
+            while not _is_running(path):
+                if time.monotonic() - start > startup_timeout:
+                    raise TimeoutError(f"Launcher daemon didn't start on {path}")
+                time.sleep(0.005)
+    return server_proxy(path)
+
+
+def pin_learner(path: str = LAUNCHER_SOCKET) -> List[int]:
+    """Pins this process to the learner cores reserved by the launcher daemon and
+    returns them. Threads and processes started afterwards inherit the pinning,
+    and instances started with pin_cpus move themselves to their own CPUs."""
+    cpus = connect(path, pin_cpus=True).placement(0)["learner"]
+    if cpus:
+        placement.pin(os.getpid(), set(cpus))
+    return cpus
@@ -0,0 +1,192 @@
+import json
+import os
+import shlex
+import signal
+import socket
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from bounce_rl.core.launcher import container, launcher_client, placement, x_search
+from bounce_rl.core.launcher.launcher import Launcher, LauncherServer
+
+ENV = json.dumps({"PATH": os.environ.get("PATH", os.defpath)})
+
+
+class TestLauncherServer(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "launcher")
+        self.server = LauncherServer(self.path, Launcher())
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.launcher = launcher_client.server_proxy(self.path)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.tmp_dir.cleanup()
+
+    def test_unknown_instance(self):
+        self.assertEqual(self.launcher.list_instances(), [])
+        self.assertEqual(self.launcher.instance_status(3), {"running": False})
+        # Killing an instance that isn't running is a no-op.
+        self.launcher.kill_instance(3)
+
+
+class TestLauncherDaemon(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "launcher")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _daemon_pid(self) -> int:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        try:
+            creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, 12)
+        finally:
+            sock.close()
+        return struct.unpack("3i", creds)[0]
+
+    def test_pinned_daemon_runs_on_service_cores(self):
+        launcher = launcher_client.connect(self.path, pin_cpus=True)
+        service = set(launcher.placement(0)["service"])
+        pid = self._daemon_pid()
+        try:
+            # Machines too small to reserve service cores leave it unpinned.
+            self.assertEqual(
+                os.sched_getaffinity(pid), service or os.sched_getaffinity(0)
+            )
+        finally:
+            os.kill(pid, signal.SIGTERM)
+            deadline = time.monotonic() + 5
+            while os.path.exists(self.path) and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+
+class TestWindowLookup(unittest.TestCase):
+    def test_timeout(self):
+        # A display on which no window ever shows up.
+        read_fd, write_fd = os.pipe()
+        self.addCleanup(os.close, read_fd)
+        self.addCleanup(os.close, write_fd)
+        display = mock.Mock()
+        display.screen().root.query_tree().children = []
+        display.pending_events.return_value = 0
+        display.fileno.return_value = read_fd
+
+        lookup = x_search.WindowLookup(display, container.PIDMapper(-1), -1)
+        start = time.monotonic()
+        self.assertEqual(lookup.get_owned_windows_with_name("Title", 0.2), [])
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+
+class TestLauncher(unittest.TestCase):
+    """Covers the launcher's instance bookkeeping. Commands run directly rather
+    than in a container, and no windows are looked up."""
+
+    def setUp(self):
+        self.processes = []
+        self.launched = []
+        patches = [
+            mock.patch.object(
+                container, "launch_process_container", side_effect=self._launch
+            ),
+            mock.patch.object(Launcher, "_find_windows", return_value=[7]),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        cores = [[0, 4], [1, 5], [2, 6], [3, 7]]
+        self.launcher = Launcher(placement.Placement(1, 1, cores=cores))
+
+    def tearDown(self):
+        self.launcher.shutdown()
+        for p in self.processes:
+            if p.poll() is None:
+                p.kill()
+                p.wait()
+
+    def _launch(self, cmd, directory, env, cpus=None, overlays=()):
+        # Popen objects are kept so they aren't reaped behind the launcher's back.
+        p = subprocess.Popen(shlex.split(cmd), cwd=directory, env=env)
+        self.processes.append(p)
+        self.launched.append((cmd, cpus))
+        return p.pid, p.pid, container.PIDMapper(-1)
+
+    def _wait_for_exit(self, instance):
+        deadline = time.monotonic() + 5
+        while self.launcher.instance_status(instance)["running"]:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_launch_kill_restart(self):
+        windows = self.launcher.launch_app(2, "sleep 30", "/", ENV, "Title")
+        self.assertEqual(windows, [7])
+        self.assertEqual(self.launcher.list_instances(), [2])
+        status = self.launcher.instance_status(2)
+        self.assertTrue(status["running"])
+        self.assertEqual(status["unshare_pid"], self.processes[0].pid)
+        self.assertEqual(status["windows"], [7])
+        self.assertEqual(status["cpus"], [])
+
+        self.assertEqual(self.launcher.restart_instance(2), [7])
+        self.assertEqual(self.launched, [("sleep 30", None)] * 2)
+        # The first process was killed and reaped before the relaunch.
+        self.assertIsNotNone(self.processes[0].poll())
+        status = self.launcher.instance_status(2)
+        self.assertTrue(status["running"])
+        self.assertEqual(status["unshare_pid"], self.processes[1].pid)
+
+        self.launcher.kill_instance(2)
+        self.assertEqual(self.launcher.list_instances(), [])
+        self.assertEqual(self.launcher.instance_status(2), {"running": False})
+        self.assertIsNotNone(self.processes[1].poll())
+
+    def test_launch_replaces_running_instance(self):
+        self.launcher.launch_app(0, "sleep 30", "/", ENV, "Title")
+        self.launcher.launch_app(0, "sleep 20", "/", ENV, "Title")
+        self.assertEqual(self.launcher.list_instances(), [0])
+        self.assertIsNotNone(self.processes[0].poll())
+        self.assertTrue(self.launcher.instance_status(0)["running"])
+
+    def test_exited_instance_status(self):
+        self.launcher.launch_app(1, "sh -c 'exit 3'", "/", ENV, "Title")
+        self._wait_for_exit(1)
+        status = self.launcher.instance_status(1)
+        self.assertEqual(status["exit_status"], 3)
+        # Exited instances stay listed until they're killed or relaunched.
+        self.assertEqual(self.launcher.list_instances(), [1])
+
+    def test_window_timeout(self):
+        with mock.patch.object(Launcher, "_find_windows", return_value=[]) as find:
+            with self.assertLogs(level="ERROR"):
+                windows = self.launcher.launch_app(
+                    3, "sleep 30", "/", ENV, "Title", window_timeout=0.5
+                )
+        self.assertEqual(find.call_args[0][-1], 0.5)
+        self.assertEqual(windows, [])
+        # The instance whose window never showed up is killed.
+        self.assertEqual(self.launcher.list_instances(), [])
+        self.assertIsNotNone(self.processes[0].poll())
+
+    def test_pinned_instances(self):
+        self.launcher.launch_app(1, "sleep 30", "/", ENV, "Title", True)
+        self.assertEqual(self.launched, [("sleep 30", {3, 7})])
+        self.assertEqual(self.launcher.instance_status(1)["cpus"], [3, 7])
+        self.assertEqual(
+            self.launcher.placement(2)["instances"]["1"],
+            {"game": [3, 7], "env": [2]},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
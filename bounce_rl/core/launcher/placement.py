@@ -0,0 +1,110 @@
+"""Assigns CPU cores to the learner, the shared services and each instance.
+
+Whole physical cores are reserved for the learner and for the shared services
+(the X proxy and the launcher). Of the remaining cores, each instance's game gets
+a whole physical core, or a given number of logical CPUs, counting from the first
+core. Each env worker gets one logical CPU counting from the last core, using the
+first thread of every core before any SMT sibling. Games and env workers only
+share CPUs once there are more of them than the instance cores hold."""
+
+import os
+from typing import Any, Dict, List, Optional, Set
+
+
+def _parse_cpu_list(cpu_list: str) -> Set[int]:
+    """Parses a sysfs cpu list like "0-3,8"."""
+    cpus: Set[int] = set()
+    for part in cpu_list.strip().split(","):
+        if "-" in part:
+            first, last = part.split("-")
+            cpus.update(range(int(first), int(last) + 1))
+        elif part:
+            cpus.add(int(part))
+    return cpus
+
+
+def physical_cores(cpus: Optional[Set[int]] = None) -> List[List[int]]:
+    """Groups the given logical CPUs, by default the ones this process may run on,
+    into physical cores. Cores and their threads are sorted by CPU number."""
+    if cpus is None:
+        cpus = os.sched_getaffinity(0)
+    cores = {}
+    for cpu in sorted(cpus):
+        try:
+            with open(
+                f"/sys/devices/system/cpu/cpu{cpu}/topology/thread_siblings_list"
+            ) as f:
+                siblings = _parse_cpu_list(f.read()) & cpus
+        except FileNotFoundError:
+            siblings = {cpu}
+        cores[min(siblings)] = sorted(siblings)
+    return [cores[c] for c in sorted(cores)]
+
+
+def pin(pid: int, cpus: Set[int]) -> None:
+    """Sets the affinity of every thread of pid. Children started afterwards
+    inherit it."""
+    try:
+        tids = [int(t) for t in os.listdir(f"/proc/{pid}/task")]
+    except FileNotFoundError:
+        return
+    for tid in tids:
+        try:
+            os.sched_setaffinity(tid, cpus)
+        except ProcessLookupError:
+            pass
+
+
+class Placement:
+    def __init__(
+        self,
+        learner_cores: int = 2,
+        service_cores: int = 1,
+        game_cpus: Optional[int] = None,
+        cores: Optional[List[List[int]]] = None,
+    ):
+        """Reserves learner_cores and then service_cores physical cores. Both are
+        reduced if needed to leave a core for the instances. Games get a whole
+        physical core each, or game_cpus logical CPUs if it's given."""
+        if cores is None:
+            cores = physical_cores()
+        learner_cores = min(learner_cores, max(len(cores) - 1, 0))
+        service_cores = min(service_cores, max(len(cores) - learner_cores - 1, 0))
+
+        self.learner = {c for core in cores[:learner_cores] for c in core}
+        reserved = learner_cores + service_cores
+        self.service = {c for core in cores[learner_cores:reserved] for c in core}
+        self.instance_cores = cores[reserved:] or cores
+        self.game_cpus = game_cpus
+        # Logical CPUs in the order they're assigned to games, siblings together,
+        # and to env workers, siblings last.
+        self.game_slots = [c for core in self.instance_cores for c in core]
+        max_threads = max(len(core) for core in self.instance_cores)
+        self.env_slots = [
+            core[i]
+            for i in range(max_threads)
+            for core in reversed(self.instance_cores)
+            if i < len(core)
+        ]
+
+    def game(self, instance: int) -> Set[int]:
+        if self.game_cpus is None:
+            return set(self.instance_cores[instance % len(self.instance_cores)])
+        first = instance * self.game_cpus
+        return {
+            self.game_slots[i % len(self.game_slots)]
+            for i in range(first, first + self.game_cpus)
+        }
+
+    def env(self, instance: int) -> Set[int]:
+        return {self.env_slots[instance % len(self.env_slots)]}
+
+    def report(self, n_instances: int) -> Dict[str, Any]:
+        return {
+            "learner": sorted(self.learner),
+            "service": sorted(self.service),
+            "instances": {
+                str(i): {"game": sorted(self.game(i)), "env": sorted(self.env(i))}
+                for i in range(n_instances)
+            },
+        }
@@ -0,0 +1,48 @@
+import os
+import unittest
+
+from bounce_rl.core.launcher import placement
+
+# 4 physical cores with 2 threads each.
+CORES = [[0, 4], [1, 5], [2, 6], [3, 7]]
+
+
+class TestPlacement(unittest.TestCase):
+    def test_parse_cpu_list(self):
+        self.assertEqual(placement._parse_cpu_list("0-2,8\n"), {0, 1, 2, 8})
+
+    def test_games_get_whole_cores(self):
+        p = placement.Placement(learner_cores=1, service_cores=1, cores=CORES)
+        self.assertEqual(p.learner, {0, 4})
+        self.assertEqual(p.service, {1, 5})
+        self.assertEqual([p.game(0), p.game(1)], [{2, 6}, {3, 7}])
+        # Env workers use first threads from the other end before siblings.
+        self.assertEqual([p.env(0), p.env(1), p.env(2)], [{3}, {2}, {7}])
+        # Instances share CPUs once they run out.
+        self.assertEqual(p.game(2), {2, 6})
+
+    def test_game_cpus(self):
+        p = placement.Placement(
+            learner_cores=0, service_cores=0, game_cpus=1, cores=CORES
+        )
+        self.assertEqual([p.game(i) for i in range(3)], [{0}, {4}, {1}])
+        self.assertEqual(p.env(0), {3})
+        p = placement.Placement(
+            learner_cores=1, service_cores=0, game_cpus=3, cores=CORES
+        )
+        self.assertEqual([p.game(0), p.game(1)], [{1, 5, 2}, {6, 3, 7}])
+
+    def test_reservations_leave_a_core_for_instances(self):
+        p = placement.Placement(learner_cores=2, service_cores=1, cores=CORES[:2])
+        self.assertEqual(p.learner, {0, 4})
+        self.assertEqual(p.service, set())
+        self.assertEqual(p.game(0), {1, 5})
+        self.assertEqual(p.env(0), {1})
+
+    def test_physical_cores_cover_affinity(self):
+        cores = placement.physical_cores()
+        self.assertEqual({c for core in cores for c in core}, os.sched_getaffinity(0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+"""Immutable snapshots of game state directories kept in tmpfs.
+
+A snapshot is built once per distinct content and is never modified afterwards, so
+any number of instances can restore from it concurrently. Instances restore a
+snapshot by mounting it as an overlay (see container.overlay_args), which gives
+each of them a private, copy-on-write view of it. Files aren't hardlinked out of
+a snapshot instead since games rewrite their saves in place."""
+
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import Dict, Tuple
+
+SNAPSHOT_DIR = (
+    "/dev/shm/bounce_rl_snapshots"
+    if os.path.isdir("/dev/shm")
+    else os.path.join(tempfile.gettempdir(), "bounce_rl_snapshots")
+)
+
+
+def _files(path: str):
+    """Yields the path of every file under path, or path itself if it's a file."""
+    if not os.path.isdir(path):
+        yield path
+        return
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for f in sorted(files):
+            yield os.path.join(root, f)
+
+
+# Each file's digest with the mtime and size it was computed at.
+_file_digests: Dict[str, Tuple[int, int, bytes]] = {}
+
+
+def _file_digest(path: str) -> bytes:
+    """Returns the hash of a file's contents, rereading it only if its mtime or
+    size changed since it was last hashed."""
+    stat = os.stat(path)
+    cached = _file_digests.get(path)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+    with open(path, "rb") as f:
+        digest = hashlib.sha1(f.read()).digest()
+    _file_digests[path] = (stat.st_mtime_ns, stat.st_size, digest)
+    return digest
+
+
+def content_key(sources: Dict[str, str]) -> str:
+    """Returns a hash of the names and contents of the snapshot's sources."""
+    digest = hashlib.sha1()
+    for name in sorted(sources):
+        for path in _files(sources[name]):
+            rel = os.path.join(name, os.path.relpath(path, sources[name]))
+            digest.update(os.path.normpath(rel).encode() + b"\0")
+            digest.update(_file_digest(path))
+    return digest.hexdigest()[:16]
+
+
+def snapshot(sources: Dict[str, str], root: str = SNAPSHOT_DIR) -> str:
+    """Returns the path of a snapshot holding a copy of each source file or
+    directory at its key's relative path, building it if it doesn't exist yet.
+
+    Snapshots are built in a temporary directory and then renamed into place, so
+    they're either complete or absent. When two processes build the same snapshot,
+    one rename fails and its copy is discarded."""
+    path = os.path.join(root, content_key(sources))
+    if os.path.isdir(path):
+        return path
+
+    os.makedirs(root, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=root, prefix=".build-")
+    try:
+        for name, src in sources.items():
+            dest = os.path.join(tmp, name)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            if os.path.isdir(src):
+                shutil.copytree(src, dest)
+            else:
+                shutil.copy2(src, dest)
+        os.chmod(tmp, 0o755)
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+    finally:
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp)
+    return path
@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+
+from bounce_rl.core.launcher import snapshot
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.dir.name, "src")
+        os.makedirs(os.path.join(self.src, "save", "stats"))
+        with open(os.path.join(self.src, "save", "stats", "a"), "w") as f:
+            f.write("a")
+        with open(os.path.join(self.src, "config.xml"), "w") as f:
+            f.write("<Config/>")
+        self.root = os.path.join(self.dir.name, "snapshots")
+        self.sources = {
+            "save00": os.path.join(self.src, "save"),
+            "shared/config.xml": os.path.join(self.src, "config.xml"),
+        }
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_snapshot_is_built_once_per_content(self):
+        path = snapshot.snapshot(self.sources, root=self.root)
+        with open(os.path.join(path, "save00", "stats", "a")) as f:
+            self.assertEqual(f.read(), "a")
+        self.assertTrue(os.path.isfile(os.path.join(path, "shared", "config.xml")))
+        self.assertEqual(snapshot.snapshot(self.sources, root=self.root), path)
+
+        with open(os.path.join(self.src, "config.xml"), "w") as f:
+            f.write("<Config b='1'/>")
+        changed = snapshot.snapshot(self.sources, root=self.root)
+        self.assertNotEqual(changed, path)
+        # No build directories are left behind.
+        self.assertEqual(
+            sorted(os.listdir(self.root)),
+            sorted(os.path.basename(p) for p in (path, changed)),
+        )
+
+    def test_content_key_rereads_only_changed_files(self):
+        key = snapshot.content_key(self.sources)
+        config = os.path.join(self.src, "config.xml")
+        stat = os.stat(config)
+        # Same size and mtime, so the file is not reread.
+        with open(config, "w") as f:
+            f.write("<Other!/>")
+        os.utime(config, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertEqual(snapshot.content_key(self.sources), key)
+
+        os.utime(config, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.assertNotEqual(snapshot.content_key(self.sources), key)
+
+
+if __name__ == "__main__":
+    unittest.main()
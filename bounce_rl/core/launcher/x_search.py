@@ -5,11 +5,13 @@
 
 import logging
 import re
+import select
 import time
-from typing import List
+from typing import List, Optional
 
 import psutil
 import Xlib
+import Xlib.error
 from Xlib.display import Display
 from Xlib.xobject.drawable import Window
 
@@ -34,25 +36,41 @@ def query_window_property(
 
 
 def get_all_windows_with_name(name: str, parent: Window, matches: list) -> list:
+    pattern = re.compile(name)
     try:
         for child in parent.query_tree().children:
-            wm_name = child.get_wm_name()
-            if wm_name is not None:
-                if isinstance(wm_name, bytes):
-                    wm_name = wm_name.decode("utf-8")
-            if wm_name is not None and re.match(name, wm_name):
+            if _name_matches(pattern, child):
                 matches.append(child)
             matches = get_all_windows_with_name(name, child, matches)
         return matches
-    except:
+    except Xlib.error.XError:
         return matches
 
 
+def _name_matches(pattern: re.Pattern, window: Window) -> bool:
+    try:
+        wm_name = window.get_wm_name()
+    except Xlib.error.XError:
+        return False
+    if isinstance(wm_name, bytes):
+        wm_name = wm_name.decode("utf-8", errors="replace")
+    return wm_name is not None and pattern.match(wm_name) is not None
+
+
 class WindowLookup:
+    """Finds the windows of a launched app.
+
+    Windows are found as they're created, mapped and named by watching the root
+    window, after a single scan of the windows that already exist."""
+
     def __init__(self, display, pid_mapper, root_pid):
         self.display = display
         self.pid_mapper = pid_mapper
         self.root_pid = root_pid
+        self.root = self.display.screen().root
+        self.watched_atoms = {
+            self.display.get_atom(a) for a in ("WM_NAME", "_NET_WM_NAME", "_NET_WM_PID")
+        }
 
     # Return True if the window's process is a descendant of any of the child_pids.
     def _is_owned(self, window: Window):
@@ -60,41 +78,89 @@ class WindowLookup:
         window_pid_result = query_window_property(
             self.display, window, "_NET_WM_PID", Xlib.Xatom.CARDINAL
         )
-        assert (
-            window_pid_result is not None
-        ), "Harness requires the running window manager to implement _NET_WM_PID annotations."
+        if not window_pid_result or window_pid_result[0] == -1:
+            # Either the window is gone or its pid hasn't been set yet.
+            return False
         window_pid = window_pid_result[0]
         logging.debug("Got window pid: %s", window_pid)
         # The _NET_WM_PID will be a pid in the container namespace. We need to map it
         # back to the host pid namespace.
         host_pid = self.pid_mapper.get(window_pid)
-        window_ps = psutil.Process(host_pid)
-
-        is_owned = False
-        ancestor = window_ps
-        while ancestor is not None:
-            if ancestor.pid == self.root_pid:
-                is_owned = True
-                break
-            ancestor = ancestor.parent()
-
-        # logging.debug(
-        #     "Is owned query: window: %s, window_pid: %s, mapped_pid: %s, is_owned: %s",
-        #     window.id,
-        #     window_pid,
-        #     host_pid,
-        #     is_owned,
-        # )
-        return is_owned
-
-    def get_owned_windows_with_name(self, name: str) -> List[Window]:
-        windows: List[Window] = []
-        while len(windows) == 0:
-            time.sleep(0.5)
-            logging.debug("Looking for windows with name: %s", name)
-            all_windows = get_all_windows_with_name(
-                name, self.display.screen().root, []
+        if host_pid is None:
+            return False
+        try:
+            ancestor = psutil.Process(host_pid)
+            while ancestor is not None:
+                if ancestor.pid == self.root_pid:
+                    return True
+                ancestor = ancestor.parent()
+        except psutil.NoSuchProcess:
+            pass
+        return False
+
+    def _watch(self, window: Window) -> None:
+        try:
+            window.change_attributes(
+                event_mask=Xlib.X.PropertyChangeMask | Xlib.X.StructureNotifyMask
             )
-            windows = [w for w in all_windows if self._is_owned(w)]
-        logging.debug("Found windows!")
+        except Xlib.error.XError:
+            pass
+
+    def _existing_windows(self) -> List[Window]:
+        """Returns every window below the root, listing each level of the tree with
+        one round trip per window."""
+        windows: List[Window] = []
+        to_visit = [self.root]
+        while to_visit:
+            try:
+                children = to_visit.pop().query_tree().children
+            except Xlib.error.XError:
+                continue
+            windows.extend(children)
+            to_visit.extend(children)
         return windows
+
+    def _windows_to_check(self, event) -> List[Window]:
+        if event.type == Xlib.X.CreateNotify:
+            self._watch(event.window)
+            return [event.window]
+        elif event.type == Xlib.X.MapNotify:
+            return [event.window]
+        elif event.type == Xlib.X.PropertyNotify and event.atom in self.watched_atoms:
+            return [event.window]
+        return []
+
+    def get_owned_windows_with_name(
+        self, name: str, timeout: Optional[float] = None
+    ) -> List[Window]:
+        """Returns the app's windows whose name matches the name regex, waiting
+        until there's at least one. Returns [] if none show up within timeout
+        seconds."""
+        logging.debug("Looking for windows with name: %s", name)
+        pattern = re.compile(name)
+        # Subscribe before scanning so that no window falls between the two.
+        self.root.change_attributes(event_mask=Xlib.X.SubstructureNotifyMask)
+        candidates = self._existing_windows()
+        for window in candidates:
+            self._watch(window)
+        self.display.flush()
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            windows = [
+                w for w in candidates if _name_matches(pattern, w) and self._is_owned(w)
+            ]
+            if windows:
+                logging.debug("Found windows!")
+                return windows
+
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+            if self.display.pending_events() == 0:
+                select.select([self.display.fileno()], [], [], remaining)
+            candidates = []
+            for _ in range(self.display.pending_events()):
+                candidates.extend(self._windows_to_check(self.display.next_event()))
@@ -15,6 +15,7 @@ import pathlib
 import gin
 from profiler import Profiler
 import multiprocessing
+from bounce_rl.utilities.util import WindowedStats
 from src.keyboard import controller
 from functools import partial
 
@@ -33,16 +34,17 @@ class ResetDecision:
     def __init__(self, steps_per_second):
         self.stuck_seconds = 25
         self.min_average = 3
-        self.buf_length = self.stuck_seconds * steps_per_second
-        self.vel_buffer = [100] * int(self.buf_length)
+        self.buf_length = int(self.stuck_seconds * steps_per_second)
+        self.reset()
 
     def reset(self):
-        self.vel_buffer = [100] * int(self.buf_length)
+        self.vel_buffer = WindowedStats(self.buf_length)
+        for _ in range(self.buf_length):
+            self.vel_buffer.push(100)
 
     def should_reset(self, vel):
-        self.vel_buffer = self.vel_buffer[1:]
-        self.vel_buffer.append(vel)
-        avr = sum(self.vel_buffer) / self.buf_length
+        self.vel_buffer.push(vel)
+        avr = self.vel_buffer.mean()
         if avr < self.min_average:
             return True
         return False
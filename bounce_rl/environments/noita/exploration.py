@@ -0,0 +1,167 @@
+"""The set of map blocks a player has visited, and its rendering onto the screen.
+
+Visited blocks are kept in a bitmap split into square chunks, which are allocated
+when a block in them is first visited, so the map grows with the explored area
+rather than the size of the world.
+
+Noita's camera shows a SCREEN_WIDTH_COORD x SCREEN_HEIGHT_COORD region of the
+world centered on the player at SCREEN_WIDTH_PIX x SCREEN_HEIGHT_PIX pixels."""
+
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+SCREEN_WIDTH_COORD = 440
+SCREEN_HEIGHT_COORD = 248
+SCREEN_WIDTH_PIX = 640
+SCREEN_HEIGHT_PIX = 360
+
+
+class ExplorationMap:
+    def __init__(self, chunk_blocks: int = 64):
+        """Chunks hold chunk_blocks x chunk_blocks blocks."""
+        self.chunk_blocks = chunk_blocks
+        self._chunks: Dict[Tuple[int, int], np.ndarray] = {}
+        self.n_visited = 0
+
+    def __len__(self) -> int:
+        return self.n_visited
+
+    def visit(self, block_x: int, block_y: int) -> bool:
+        """Marks a block visited and returns whether it's newly visited."""
+        n = self.chunk_blocks
+        key = (block_x // n, block_y // n)
+        chunk = self._chunks.get(key)
+        if chunk is None:
+            chunk = self._chunks[key] = np.zeros((n, n), dtype=bool)
+        y, x = block_y % n, block_x % n
+        if chunk[y, x]:
+            return False
+        chunk[y, x] = True
+        self.n_visited += 1
+        return True
+
+    def is_visited(self, block_x: int, block_y: int) -> bool:
+        n = self.chunk_blocks
+        chunk = self._chunks.get((block_x // n, block_y // n))
+        return chunk is not None and bool(chunk[block_y % n, block_x % n])
+
+    def visit_many(self, block_x: Sequence[int], block_y: Sequence[int]) -> int:
+        """Marks blocks visited and returns how many are newly visited. Blocks
+        repeated in the arguments are counted once."""
+        n = self.chunk_blocks
+        block_x = np.asarray(block_x, dtype=np.int64)
+        block_y = np.asarray(block_y, dtype=np.int64)
+        chunk_x, chunk_y = block_x // n, block_y // n
+        # Index of each block within its chunk.
+        cells = (block_y % n) * n + block_x % n
+        n_new = 0
+        chunk_keys = np.stack([chunk_x, chunk_y], axis=1)
+        for key in np.unique(chunk_keys, axis=0):
+            cx, cy = int(key[0]), int(key[1])
+            chunk = self._chunks.get((cx, cy))
+            if chunk is None:
+                chunk = self._chunks[(cx, cy)] = np.zeros((n, n), dtype=bool)
+            in_chunk = np.unique(cells[(chunk_x == cx) & (chunk_y == cy)])
+            flat = chunk.reshape(-1)
+            n_new += int(np.count_nonzero(~flat[in_chunk]))
+            flat[in_chunk] = True
+        self.n_visited += n_new
+        return n_new
+
+    def window(self, block_x: int, block_y: int, width: int, height: int) -> np.ndarray:
+        """Returns the height x width mask of visited blocks whose top left block
+        is (block_x, block_y)."""
+        n = self.chunk_blocks
+        mask = np.zeros((height, width), dtype=bool)
+        for cy in range(block_y // n, (block_y + height - 1) // n + 1):
+            for cx in range(block_x // n, (block_x + width - 1) // n + 1):
+                chunk = self._chunks.get((cx, cy))
+                if chunk is None:
+                    continue
+                # The chunk's overlap with the window, in block coordinates.
+                x0, x1 = max(block_x, cx * n), min(block_x + width, (cx + 1) * n)
+                y0, y1 = max(block_y, cy * n), min(block_y + height, (cy + 1) * n)
+                mask[y0 - block_y : y1 - block_y, x0 - block_x : x1 - block_x] = chunk[
+                    y0 - cy * n : y1 - cy * n, x0 - cx * n : x1 - cx * n
+                ]
+        return mask
+
+    def _screen_blocks(
+        self,
+        x: float,
+        y: float,
+        block_size: int,
+        shape: Tuple[int, int],
+        view: Tuple[float, float],
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns the visited mask of the blocks on the screen and the number of
+        pixel rows and columns each row and column of blocks covers."""
+        height, width = shape
+        # The block under the center of each pixel column and row.
+        cols = np.floor(
+            (x - view[0] / 2 + (np.arange(width) + 0.5) * (view[0] / width))
+            / block_size
+        ).astype(np.int64)
+        rows = np.floor(
+            (y - view[1] / 2 + (np.arange(height) + 0.5) * (view[1] / height))
+            / block_size
+        ).astype(np.int64)
+        window = self.window(
+            int(cols[0]),
+            int(rows[0]),
+            int(cols[-1] - cols[0]) + 1,
+            int(rows[-1] - rows[0]) + 1,
+        )
+        return window, np.bincount(rows - rows[0]), np.bincount(cols - cols[0])
+
+    def render(
+        self,
+        x: float,
+        y: float,
+        block_size: int,
+        shape: Tuple[int, int] = (SCREEN_HEIGHT_PIX, SCREEN_WIDTH_PIX),
+        view: Tuple[float, float] = (SCREEN_WIDTH_COORD, SCREEN_HEIGHT_COORD),
+    ) -> np.ndarray:
+        """Returns a uint8 height x width image that's 255 where the screen shows a
+        visited block and 0 elsewhere, for a player at world coordinates (x, y).
+        View is the width and height of the world region shown on the screen."""
+        window, row_counts, col_counts = self._screen_blocks(
+            x, y, block_size, shape, view
+        )
+        # Blocks span many pixels, so scale the window up by repeating each block
+        # over its run of pixels rather than indexing per pixel.
+        window = window.astype(np.uint8) * np.uint8(255)
+        window = np.repeat(window, row_counts, axis=0)
+        return np.repeat(window, col_counts, axis=1)
+
+    def blend(
+        self,
+        pixels: np.ndarray,
+        x: float,
+        y: float,
+        block_size: int,
+        color: Sequence[int] = (255, 255, 255),
+        shift: int = 2,
+        view: Tuple[float, float] = (SCREEN_WIDTH_COORD, SCREEN_HEIGHT_COORD),
+    ) -> np.ndarray:
+        """Returns a copy of the H x W x C uint8 pixels tinted towards color where
+        the screen shows a visited block. Tinted pixels are 1 / 2**shift color.
+        See render."""
+        window, row_counts, col_counts = self._screen_blocks(
+            x, y, block_size, pixels.shape[:2], view
+        )
+        row_ends, col_ends = np.cumsum(row_counts), np.cumsum(col_counts)
+        out = pixels.copy()
+        # Work on rows of interleaved channels, which is much faster than
+        # broadcasting the tint over a short channel axis.
+        height, width, channels = out.shape
+        rows = out.reshape((height, width * channels))
+        tint = np.tile(np.asarray(color, dtype=np.uint8) >> shift, width)
+        for by, bx in zip(*np.nonzero(window)):
+            r0, c0 = row_ends[by] - row_counts[by], col_ends[bx] - col_counts[bx]
+            region = rows[r0 : row_ends[by], c0 * channels : col_ends[bx] * channels]
+            # Shifts keep the blend in uint8 without overflowing.
+            region -= region >> shift
+            region += tint[: region.shape[1]]
+        return out
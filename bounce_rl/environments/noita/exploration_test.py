@@ -0,0 +1,56 @@
+import unittest
+
+import numpy as np
+
+from bounce_rl.environments.noita.exploration import ExplorationMap
+
+
+class TestExplorationMap(unittest.TestCase):
+    def test_visit(self):
+        exploration = ExplorationMap(chunk_blocks=4)
+        self.assertTrue(exploration.visit(-1, 5))
+        self.assertFalse(exploration.visit(-1, 5))
+        self.assertTrue(exploration.is_visited(-1, 5))
+        self.assertFalse(exploration.is_visited(3, 5))
+        self.assertFalse(exploration.is_visited(100, 100))
+        self.assertEqual(len(exploration), 1)
+
+    def test_visit_many(self):
+        exploration = ExplorationMap(chunk_blocks=4)
+        exploration.visit(0, 0)
+        n_new = exploration.visit_many([0, 1, 1, -9, 7], [0, 0, 0, -2, 3])
+        self.assertEqual(n_new, 3)
+        self.assertEqual(len(exploration), 4)
+        for block in [(0, 0), (1, 0), (-9, -2), (7, 3)]:
+            self.assertTrue(exploration.is_visited(*block))
+
+    def test_window(self):
+        exploration = ExplorationMap(chunk_blocks=4)
+        exploration.visit_many([-1, 3, 4], [-1, 2, 2])
+        window = exploration.window(-2, -2, 8, 5)
+        expected = np.zeros((5, 8), dtype=bool)
+        expected[1, 1] = expected[4, 5] = expected[4, 6] = True
+        np.testing.assert_array_equal(window, expected)
+
+    def test_render(self):
+        exploration = ExplorationMap()
+        exploration.visit(0, 0)
+        # A 40 x 20 world region at 4 pixels per world unit, starting at (-20, -10).
+        mask = exploration.render(0, 0, block_size=10, shape=(80, 160), view=(40, 20))
+        expected = np.zeros((80, 160), dtype=np.uint8)
+        expected[40:, 80:120] = 255
+        np.testing.assert_array_equal(mask, expected)
+
+    def test_blend(self):
+        exploration = ExplorationMap()
+        exploration.visit(0, 0)
+        pixels = np.random.default_rng(0).integers(0, 256, (80, 160, 3), np.uint8)
+        blended = exploration.blend(pixels, 0, 0, block_size=10, view=(40, 20))
+        mask = exploration.render(0, 0, 10, (80, 160), (40, 20)) > 0
+        tinted = pixels - (pixels >> 2) + np.uint8(63)
+        np.testing.assert_array_equal(blended[mask], tinted[mask])
+        np.testing.assert_array_equal(blended[~mask], pixels[~mask])
+
+
+if __name__ == "__main__":
+    unittest.main()
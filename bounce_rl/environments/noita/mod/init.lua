@@ -8,18 +8,57 @@ Note: Even though this project is Linux only, this mod is running under Wine.
 This means lua os.execute calls don't work as expected.
 
 Logged files are:
-  /tmp/.../noita_stats.txt - Contains: biome, hp, max_hp, gold, x, y logged at the configured rate
+  /tmp/.../noita_stats.tsv - Contains: biome, hp, max_hp, gold, x, y, tick, polymorphed
+      logged at the configured rate
+  /tmp/.../noita_stats.bin - The same stats as fixed width binary records, if configured
   /tmp/.../noita_notifications.txt - Updated each time the player dies
-]]
 
--- TODO: Make the config loadable from the pipe directory. This would allow configuration from
--- the Gym env.
+The mod is configured by /tmp/.../rl_mod_config.txt, which has a key=value line for each
+setting in CONFIG that differs from its default.
+]]
 
 math.randomseed(os.time())
 PIPE_DIR = os.getenv("ENV_PREFIX")
-STATS_EVERY_N_FRAMES = 2
+
+CONFIG = {
+    stats_every_n_frames = 2,
+    -- Stats are buffered and written together every n frames.
+    flush_every_n_frames = 2,
+    -- "tsv" or "binary"
+    stats_format = "tsv",
+    -- Print a line each time stats are logged.
+    verbose = 0,
+    -- The stats file is re-opened after this many bytes are written to it, so
+    -- writes follow the Gym env's rotation of the file. Keep in sync with
+    -- NoitaInfo's max_stats_bytes.
+    reopen_after_bytes = 1048576,
+}
+
+function LoadConfig()
+    local file = io.open(PIPE_DIR .. "/rl_mod_config.txt", "r")
+    if file == nil then return end
+    for line in file:lines() do
+        local key, value = string.match(line, "^([%w_]+)=(.*)$")
+        if key ~= nil then
+            CONFIG[key] = tonumber(value) or value
+        end
+    end
+    file:close()
+end
+
+LoadConfig()
 print(" ======== Piping output to: " .. PIPE_DIR .. " ========")
 
+if CONFIG.stats_format == "binary" then
+    STATS_FILE = PIPE_DIR .. "/noita_stats.bin"
+else
+    STATS_FILE = PIPE_DIR .. "/noita_stats.tsv"
+end
+STATS_BUFFER = {}
+STATS_HANDLE = nil
+-- Bytes written through STATS_HANDLE.
+STATS_HANDLE_BYTES = 0
+
 function GetPlayer()
     local players = EntityGetWithTag("player_unit")
     if #players == 0 then return end
@@ -68,22 +107,74 @@ function LogStats()
         end
     end
 
-    -- Write to file
-    local file = io.open(PIPE_DIR .. "/noita_stats.tsv", "a")
     -- Keep in sync with noita_info.py.
-    file:write(string.format("%s\t%d\t%d\t%d\t%d\t%d\t%d\t%d\n", biome, hp, max_hp, gold, x, y, tick_id, polymorphed))
-    file:close()
+    local record
+    if CONFIG.stats_format == "binary" then
+        record = table.concat({
+            PackString(biome, 32), PackInt(hp, 4), PackInt(max_hp, 4), PackInt(gold, 4),
+            PackInt(x, 4), PackInt(y, 4), PackInt(tick_id, 8), PackInt(polymorphed, 4),
+        })
+    else
+        record = string.format("%s\t%d\t%d\t%d\t%d\t%d\t%d\t%d\n", biome, hp, max_hp, gold, x, y, tick_id, polymorphed)
+    end
+    STATS_BUFFER[#STATS_BUFFER + 1] = record
+end
+
+-- Returns n truncated to an integer as an n_bytes little endian two's complement string.
+function PackInt(n, n_bytes)
+    if n < 0 then n = math.ceil(n) else n = math.floor(n) end
+    local bytes = {}
+    for i = 1, n_bytes do
+        -- Lua's modulo is floored, which gives the two's complement bytes of negatives.
+        bytes[i] = n % 256
+        n = math.floor(n / 256)
+    end
+    return string.char(unpack(bytes))
+end
+
+-- Returns str truncated or zero padded to n_bytes.
+function PackString(str, n_bytes)
+    str = string.sub(str, 1, n_bytes)
+    return str .. string.rep("\0", n_bytes - #str)
+end
+
+function FlushStats()
+    if #STATS_BUFFER == 0 then return end
+    -- The Gym env rotates the file by renaming it once it has read more than
+    -- reopen_after_bytes from it, and keeps reading the renamed file until its
+    -- next rotation. Re-opening after writing that many bytes moves writes to
+    -- the new file before the renamed one stops being read.
+    if STATS_HANDLE ~= nil and STATS_HANDLE_BYTES > CONFIG.reopen_after_bytes then
+        STATS_HANDLE:close()
+        STATS_HANDLE = nil
+    end
+    if STATS_HANDLE == nil then
+        STATS_HANDLE = io.open(STATS_FILE, "ab")
+        STATS_HANDLE_BYTES = 0
+    end
+    local data = table.concat(STATS_BUFFER)
+    STATS_HANDLE:write(data)
+    STATS_HANDLE:flush()
+    STATS_HANDLE_BYTES = STATS_HANDLE_BYTES + #data
+    STATS_BUFFER = {}
 end
 
 function OnWorldPostUpdate()
     local frame = GameGetFrameNum()
-    if frame % STATS_EVERY_N_FRAMES == 0 then
-        print("====== Stat log ======")
+    if frame % CONFIG.stats_every_n_frames == 0 then
+        if CONFIG.verbose ~= 0 then
+            print("====== Stat log ======")
+        end
         LogStats()
     end
+    if frame % CONFIG.flush_every_n_frames == 0 then
+        FlushStats()
+    end
 end
 
 function OnPlayerDied(player)
+    -- Write the buffered stats before the death notification.
+    FlushStats()
     -- Log player death signal. The Gym env will recieve the signal and end the run.
     local file = io.open(PIPE_DIR .. "/noita_notifications.txt", "a")
     file:write("died\n")
@@ -96,9 +187,16 @@ function LogStr(str)
     file:close()
 end
 
-local file = io.open(PIPE_DIR .. "/noita_stats.tsv", "a")
+local file = io.open(STATS_FILE, "ab")
 -- The noita mod assumes every line is a values line.
 -- file:write("biome, hp, max_hp, gold, x, y\n")
 file:close()
 
-ModMagicNumbersFileAdd( "mods/rl_mod/files/magic_numbers.xml" )
+-- The Gym env renders each instance's magic numbers, like its world seed, into
+-- the pipe directory.
+local magic_numbers = io.open(PIPE_DIR .. "/magic_numbers.xml", "r")
+if magic_numbers ~= nil then
+    ModTextFileSetContent("mods/rl_mod/files/magic_numbers.xml", magic_numbers:read("*a"))
+    magic_numbers:close()
+    ModMagicNumbersFileAdd( "mods/rl_mod/files/magic_numbers.xml" )
+end
@@ -0,0 +1,47 @@
+"""Renders rl_mod's per-instance config files.
+
+Each instance's files are written to its ENV_PREFIX, where the mod reads them at
+startup, so concurrent instances never share a config."""
+
+import functools
+import os
+import string
+from typing import Any, Dict
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), "mod", "files")
+
+
+@functools.lru_cache(maxsize=None)
+def _template(name: str) -> string.Template:
+    with open(os.path.join(TEMPLATE_DIR, name)) as f:
+        return string.Template(f.read())
+
+
+@functools.lru_cache(maxsize=64)
+def magic_numbers(seed: int) -> str:
+    """Returns the magic numbers file for a run with the given world seed."""
+    return _template("magic_numbers_template.xml").substitute(seed=seed)
+
+
+def _write_atomic(path: str, text: str) -> None:
+    """Replaces the file at path, so a starting game never reads a partial file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def write_magic_numbers(env_prefix: str, seed: int) -> str:
+    """Writes the magic numbers file into env_prefix and returns its path."""
+    path = os.path.join(env_prefix, "magic_numbers.xml")
+    _write_atomic(path, magic_numbers(seed))
+    return path
+
+
+def write_mod_config(env_prefix: str, settings: Dict[str, Any]) -> str:
+    """Writes the mod's settings, see CONFIG in init.lua, into env_prefix and
+    returns the file's path."""
+    path = os.path.join(env_prefix, "rl_mod_config.txt")
+    _write_atomic(path, "".join(f"{k}={v}\n" for k, v in settings.items()))
+    return path
@@ -0,0 +1,34 @@
+import os
+import tempfile
+import unittest
+
+from bounce_rl.environments.noita import mod_config
+
+
+class TestModConfig(unittest.TestCase):
+    def test_magic_numbers_are_written_per_instance(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [
+                mod_config.write_magic_numbers(os.path.join(tmp, str(i)), seed)
+                for i, seed in enumerate((7, 12))
+            ]
+            for path, seed in zip(paths, (7, 12)):
+                with open(path) as f:
+                    self.assertIn(f'WORLD_SEED="{seed}"', f.read())
+            self.assertEqual(
+                os.listdir(os.path.dirname(paths[0])), ["magic_numbers.xml"]
+            )
+
+    def test_mod_config(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = mod_config.write_mod_config(
+                tmp, {"stats_format": "binary", "flush_every_n_frames": 10}
+            )
+            with open(path) as f:
+                self.assertEqual(
+                    f.read(), "stats_format=binary\nflush_every_n_frames=10\n"
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
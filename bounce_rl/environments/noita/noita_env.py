@@ -1,10 +1,7 @@
 import atexit
 import datetime
 import logging
-import pathlib
-import pickle
 import random
-import subprocess
 import time
 from dataclasses import dataclass
 from enum import Enum
@@ -18,10 +15,14 @@ import bounce_rl.configs.app_configs as app_configs
 from bounce_rl.core.harness import Harness
 from bounce_rl.core.keyboard import keyboard
 from bounce_rl.core.keyboard.keyboard import lib_mpx_input
+from bounce_rl.core.launcher import snapshot
 from bounce_rl.core.time_control import time_writer
-from bounce_rl.environments.noita import noita_info, noita_reward
+from bounce_rl.environments.noita import mod_config, noita_info, noita_reward
+from bounce_rl.trajectories.frame_codec import FrameEncoder
+from bounce_rl.trajectories.store import TrajectoryStore
+from bounce_rl.trajectories.writer import AsyncTrajectoryWriter
 from bounce_rl.utilities.paths import project_root
-from bounce_rl.utilities.util import GrowingCircularFIFOArray, LinearInterpolator
+from bounce_rl.utilities.util import LinearInterpolator, WindowedStats
 
 logging.basicConfig(level=logging.DEBUG, format="%(asctime)s %(levelname)s %(message)s")
 
@@ -37,6 +38,44 @@ class StepVal:
     env_step: int
 
 
+def _save_snapshot() -> str:
+    """Returns the snapshot of Noita's starting save and config that instances are
+    launched from."""
+    noita_dir = f"{project_root()}/bounce_rl/environments/noita"
+    return snapshot.snapshot(
+        {
+            "save00": f"{noita_dir}/initial_save00",
+            "save_shared/config.xml": f"{noita_dir}/mod/golden_config.xml",
+        }
+    )
+
+
+# The columns of logged steps: the step's values followed by its info values.
+TRAJECTORY_SCHEMA = {
+    "action": ("f4", (9,)),
+    "reward": ("f4", ()),
+    "terminated": ("?", ()),
+    "truncated": ("?", ()),
+    "ep_num": ("i4", ()),
+    "ep_step": ("i4", ()),
+    "env_step": ("i8", ()),
+    # Keep in sync with NoitaInfo.info.
+    "biome": ("S32", ()),
+    "hp": ("i4", ()),
+    "max_hp": ("i4", ()),
+    "gold": ("i4", ()),
+    "x": ("i4", ()),
+    "y": ("i4", ()),
+    "tick": ("i8", ()),
+    "polymorphed": ("i4", ()),
+    "is_alive": ("?", ()),
+}
+
+
+def _encode_pixels(pixels: np.ndarray) -> bytes:
+    return simplejpeg.encode_jpeg(pixels, quality=92)
+
+
 class NoitaState(Enum):
     UNKNOWN = 0
     RUNNING = 1
@@ -87,8 +126,7 @@ class TerminateOnSparseReward:
         self.reward_history.push(
             step.reward, int(self.history_len.get_value(step.ep_step))
         )
-        reward_history = self.reward_history.get_array()
-        if np.sum(reward_history != 0) == 0:
+        if self.reward_history.count_nonzero() == 0:
             step.reward -= self.termination_penalty
             step.terminated = True
             if self.log:
@@ -98,7 +136,7 @@ class TerminateOnSparseReward:
         return step
 
     def reset(self):
-        self.reward_history = GrowingCircularFIFOArray(max_size=self.max_size)
+        self.reward_history = WindowedStats(max_size=self.max_size, window=1)
         # Push a non-zero reward to prevent early termination.
         self.reward_history.push(1, 1)
 
@@ -145,9 +183,31 @@ class NoitaEnv(gym.core.Env):
         self.app_config = app_configs.LoadAppConfig(self.run_config["app"])
         self.environment = {
             "ENV_PREFIX": f"/tmp/env_dirs_{self.instance}",
+            "SAVE_SNAPSHOT": _save_snapshot(),
         }
-        self.noita_info = noita_info.NoitaInfo(pipe_dir=self.environment["ENV_PREFIX"])
-        self.reward_callback = noita_reward.NoitaReward()
+        self.noita_info = noita_info.NoitaInfo(
+            pipe_dir=self.environment["ENV_PREFIX"],
+            stats_format=self.run_config["stats_format"],
+        )
+        self.reward_callback = noita_reward.NoitaReward(
+            self.run_config["reward_sampled_blocks"]
+        )
+        delta_frames = self.run_config["pixels_keyframe_interval"] > 0
+        self.trajectory = AsyncTrajectoryWriter(
+            TrajectoryStore(
+                f"{self.out_dir}/trajectory",
+                TRAJECTORY_SCHEMA,
+                fsync=self.run_config["trajectory_fsync"],
+                frame_encoder=(
+                    FrameEncoder(self.run_config["pixels_keyframe_interval"])
+                    if delta_frames
+                    else None
+                ),
+            ),
+            encode=None if delta_frames else _encode_pixels,
+            max_queued=self.run_config["trajectory_max_queued"],
+            overflow=self.run_config["trajectory_overflow"],
+        )
 
         if step_wrappers is None:
             step_wrappers = [TerminateOnOverworld(), TerminateOnSparseReward(log=True)]
@@ -170,6 +230,30 @@ class NoitaEnv(gym.core.Env):
             "pause_rate": 0.02,
             "step_duration": 0.166,
             "pixels_every_n_episodes": 1,
+            # Logged pixels are stored losslessly as a keyframe every n frames
+            # and deltas between them, or as JPEGs if this is 0.
+            "pixels_keyframe_interval": 64,
+            # One of "never", "chunk" or "flush", see trajectories.store.
+            "trajectory_fsync": "chunk",
+            # Steps are logged from a writer thread. When max_queued steps are
+            # waiting to be written, the "block" overflow policy stalls steps and
+            # "drop" skips logging them.
+            "trajectory_max_queued": 64,
+            "trajectory_overflow": "block",
+            # The mod logs stats as "tsv" lines or "binary" records, buffering
+            # them for the given number of frames. Steps end once the game's tick
+            # advances, so info can lag the pixels by up to this many frames.
+            "stats_format": "binary",
+            "stats_flush_every_n_frames": 2,
+            # Renders the blocks the player has visited, which the reward counts,
+            # into observations: None leaves the game's pixels as they are,
+            # "channel" appends the visited mask as a 4th channel and "blend" tints
+            # visited blocks. Logged pixels are never overlaid.
+            "exploration_overlay": None,
+            # Pays for every new block the player passed through during a step
+            # rather than only the block the step ends in. This changes the
+            # reward's scale, so it's off by default.
+            "reward_sampled_blocks": False,
             # There are 9 input actions in the environment, so policies may do
             # 1/sqrt(9) feature scaling on actions. To compensate, we scale mouse
             # coordinates here.
@@ -184,16 +268,17 @@ class NoitaEnv(gym.core.Env):
         if run_config is None:
             run_config = NoitaEnv._default_run_config()
 
+        channels = 4 if run_config.get("exploration_overlay") == "channel" else 3
         return gym.spaces.Box(
             low=0,
             high=255,
-            shape=(run_config["y_res"], run_config["x_res"], 3),
+            shape=(run_config["y_res"], run_config["x_res"], channels),
             dtype=np.uint8,
         )
 
     @property
     def observation_space(self):
-        return NoitaEnv._observation_space()
+        return NoitaEnv._observation_space(self.run_config)
 
     @staticmethod
     def _input_space():
@@ -274,8 +359,6 @@ class NoitaEnv(gym.core.Env):
         # Returns True if the reset was successful.
         self.ep_step = 0
         self.ep_num += 1
-        self.step_dir = f"{self.out_dir}/steps/ep_{self.ep_num}"
-        pathlib.Path(self.step_dir).mkdir(parents=True, exist_ok=True)
 
         for wrapper in self.step_wrappers:
             wrapper.reset()
@@ -290,7 +373,15 @@ class NoitaEnv(gym.core.Env):
             # os.system("killall noita.exe")
             time.sleep(1)
 
-        self._set_up_magic_numbers(self.seed)
+        mod_config.write_magic_numbers(self.environment["ENV_PREFIX"], self.seed)
+        mod_config.write_mod_config(
+            self.environment["ENV_PREFIX"],
+            {
+                "stats_format": self.run_config["stats_format"],
+                "flush_every_n_frames": self.run_config["stats_flush_every_n_frames"],
+                "reopen_after_bytes": self.noita_info.info_drain.max_bytes,
+            },
+        )
         self.harness = Harness(
             self.app_config,
             self.run_config,
@@ -363,7 +454,6 @@ class NoitaEnv(gym.core.Env):
 
         # Convert actions to device inputs
         # My SB3 implementation flattens the space, here we split it back out again.
-        orig_action = action
         if len(action) == 9:
             action = action[0:7], action[7:9]
         discrete_action, continuous_action = action
@@ -395,6 +485,7 @@ class NoitaEnv(gym.core.Env):
         # TODO: Move time control into harness
         self.harness.tick()
         init_info = self.noita_info.current_info()
+        init_samples = self.noita_info.n_samples
         retries = 20
         for i in range(retries):
             time_writer.SetSpeedup(self.run_config["run_rate"], str(self.instance))
@@ -412,7 +503,9 @@ class NoitaEnv(gym.core.Env):
         pixels = self.harness.get_screen()
 
         # Compute step values
-        reward = self.reward_callback.update(info)
+        reward = self.reward_callback.update(
+            info, self.noita_info.samples_since(init_samples)
+        )
         terminated = not info["is_alive"]
         truncated = False
         step_val = StepVal(
@@ -423,28 +516,11 @@ class NoitaEnv(gym.core.Env):
         for wrapper in self.step_wrappers:
             step_val = wrapper(step_val)
 
-        # Save step values minus pixels
-        save_val = StepVal(
-            None,
-            step_val.reward,
-            step_val.terminated,
-            step_val.truncated,
-            step_val.info,
-            step_val.ep_step,
-            step_val.env_step,
-        )
-        np.save(f"{self.step_dir}/step_{self.ep_step}.npy", save_val)
-
-        # Save actions
-        action_path = f"{self.step_dir}/action_{self.ep_step}.pkl"
-        with open(action_path, "wb") as f:
-            pickle.dump(orig_action, f)
-
         self._log_step(action, step_val)
 
         # return pixels, reward, terminated, truncated, info
         return (
-            step_val.pixels,
+            self._observation(step_val.pixels, step_val.info),
             step_val.reward,
             step_val.terminated or step_val.truncated,
             step_val.info,
@@ -457,50 +533,48 @@ class NoitaEnv(gym.core.Env):
         self.seed = seed
         self._reset_env()
         pixels = self.harness.get_screen()
-        _ = self.noita_info.on_tick()
+        info = self.noita_info.on_tick()
         # return pixels, info
-        return pixels
+        return self._observation(pixels, info)
+
+    def _observation(self, pixels: np.ndarray, info: Dict[str, Any]) -> np.ndarray:
+        overlay = self.run_config["exploration_overlay"]
+        if overlay is None:
+            return pixels
+        exploration = self.reward_callback.exploration
+        block_size = self.reward_callback.BLOCK_SIZE
+        if overlay == "blend":
+            return exploration.blend(pixels, info["x"], info["y"], block_size)
+        mask = exploration.render(info["x"], info["y"], block_size, pixels.shape[:2])
+        return np.concatenate([pixels, mask[:, :, np.newaxis]], axis=2)
 
     def run_info(self):
-        return {"episode_step": self.ep_step, "environment_step": self.env_step}
-
-    def _current_step_dir(self) -> str:
-        chunk = self.env_step // 10000
-        chunk_dir = f"{self.out_dir}/step_chunk_{chunk}"
-        pathlib.Path(chunk_dir).mkdir(parents=True, exist_ok=True)
-        return chunk_dir
-
-    def _log_step(self, action: np.ndarray, step_val: StepVal):
-        step_dir = self._current_step_dir()
-
-        pixels_filename = step_dir + f"/{self.env_step}_pixels.jpg"
-        action_filename = step_dir + f"/{self.env_step}_action.npy"
-        reward_filename = step_dir + f"/{self.env_step}_reward.pkl"
-        info_filename = step_dir + f"/{self.env_step}_info.pkl"
-        step_filename = step_dir + f"/{self.env_step}_step.pkl"
-
-        np.save(reward_filename, np.array([step_val.reward]))
-        with open(action_filename, "wb") as f:
-            pickle.dump(action, f)
-        step_info = {
-            "ep_step": self.ep_step,
-            "ep_num": self.ep_num,
-            "env_step": self.env_step,
-            "terminated": step_val.terminated,
-            "truncated": step_val.truncated,
+        return {
+            "episode_step": self.ep_step,
+            "environment_step": self.env_step,
+            "trajectory_queue_depth": self.trajectory.queue_depth,
+            "trajectory_dropped_steps": self.trajectory.dropped,
         }
-        # fmt: off
-        with open(info_filename, "wb") as info_file, \
-             open(step_filename, "wb") as step_file:
-            # fmt: on
-            pickle.dump(step_val.info, info_file)
-            pickle.dump(step_info, step_file)
+
+    def _log_step(self, action: Tuple[Iterable, Iterable], step_val: StepVal):
+        pixels = None
         if self.run_config["pixels_every_n_episodes"] > 0 and \
            self.ep_num % self.run_config["pixels_every_n_episodes"] == 0:
-            with open(pixels_filename, "wb") as pixels_file:
-                pixels_file.write(simplejpeg.encode_jpeg(step_val.pixels, quality=92))
+            pixels = step_val.pixels
+        record = dict(
+            step_val.info,
+            action=np.concatenate([np.ravel(a) for a in action]),
+            reward=step_val.reward,
+            terminated=step_val.terminated,
+            truncated=step_val.truncated,
+            ep_num=self.ep_num,
+            ep_step=self.ep_step,
+            env_step=self.env_step,
+        )
+        self.trajectory.append(record, pixels)
 
     def close(self):
+        self.trajectory.close()
         self.harness.cleanup()
         del self.harness
 
@@ -509,20 +583,3 @@ class NoitaEnv(gym.core.Env):
 
     def resume(self):
         self.harness.keyboard.key_sequence(["Escape"])
-
-    def _set_up_magic_numbers(self, seed):
-        copy_comm = (
-            (
-                f"cp -f {project_root()}/bounce_rl/environments/noita/mod/files/magic_numbers_template.xml "
-                f"{project_root()}/bounce_rl/environments/noita/mod/files/magic_numbers.xml"
-            ),
-        )
-        print("Running:", copy_comm)
-        subprocess.Popen(
-            copy_comm,
-            shell=True,
-        )
-        subprocess.Popen(
-            f'sed -i s/SEED_HERE/\\"{seed}\\"/g {project_root()}/bounce_rl/environments/noita/mod/files/magic_numbers.xml',
-            shell=True,
-        )
@@ -1,41 +1,119 @@
 import atexit
 import os
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Optional
 
+import numpy as np
 
-# Note: We can consider other for message passing the from mod to this file.
-# Options include:
-#  - Files
-#  - Named pipes
-#  - Shared memory
-#  - Sockets
-class FileTail:
-    def __init__(self, path: str, mode: str = "r", initial_line: Optional[str] = None):
+# The fields of the mod's stats lines, in order, and the layout of its binary stats
+# records. Keep in sync with the noita mod's init.lua.
+STATS_DTYPE = np.dtype(
+    [
+        ("biome", "S32"),
+        ("hp", "i4"),
+        ("max_hp", "i4"),
+        ("gold", "i4"),
+        ("x", "i4"),
+        ("y", "i4"),
+        ("tick", "i8"),
+        ("polymorphed", "i4"),
+    ]
+)
+
+
+def parse_stats(data: bytes) -> np.ndarray:
+    """Parses complete stats lines into an array of STATS_DTYPE records. Malformed
+    lines are skipped."""
+    n_fields = len(STATS_DTYPE.names)
+    lines = data.rstrip(b"\n").split(b"\n") if data else []
+    fields = b"\t".join(lines).split(b"\t")
+    try:
+        if len(fields) != n_fields * len(lines):
+            raise ValueError("Wrong number of fields")
+        table = np.array(fields, dtype=bytes).reshape((-1, n_fields))
+        stats = np.zeros(len(table), STATS_DTYPE)
+        for i, name in enumerate(STATS_DTYPE.names):
+            stats[name] = table[:, i]
+        return stats
+    except ValueError:
+        # Slow path: Some line is malformed.
+        records = []
+        for line in lines:
+            values = line.split(b"\t")
+            try:
+                if len(values) == n_fields:
+                    records.append((values[0], *(int(v) for v in values[1:])))
+            except ValueError:
+                pass
+        return np.array(records, dtype=STATS_DTYPE)
+
+
+def parse_binary_stats(data: bytes) -> np.ndarray:
+    """Parses complete fixed width stats records."""
+    n = len(data) // STATS_DTYPE.itemsize
+    return np.frombuffer(data, STATS_DTYPE, count=n)
+
+
+class FileDrain:
+    def __init__(self, path: str, max_bytes: Optional[int] = None):
+        """Reads the bytes appended to a file by another process.
+
+        If max_bytes is given, the file is rotated once it has been read past
+        max_bytes: it's renamed and a new, empty file is created at path. Writes
+        to the rotated file are still read until the next rotation, so writers
+        can keep their file open until they've written max_bytes to it and then
+        re-open path."""
         self.path = path
-        self.file = open(path, mode)
+        self.max_bytes = max_bytes
+        self.fd = os.open(path, os.O_RDONLY | os.O_CREAT, 0o644)
         self.position = 0
-        self.partial_line = ""
-        if initial_line is None:
-            initial_line = ""
-        self.line = initial_line
-
-    def get(self) -> Tuple[str, bool]:
-        """Returns the most recently seen line and whether a new line has been read."""
-        is_new = False
+        self.old_fd: Optional[int] = None
+
+    @staticmethod
+    def _read_all(fd: int) -> bytes:
+        parts = []
         while True:
-            self.file.seek(self.position)
-            line = self.file.readline()
-            if line and line.endswith("\n"):
-                is_new = True
-                self.position = self.file.tell()
-                self.line = line
-            else:
-                return self.line, is_new
+            # Most reads are drained in a single call.
+            part = os.read(fd, 1 << 20)
+            if not part:
+                return b"".join(parts)
+            parts.append(part)
+
+    def read(self) -> bytes:
+        data = b""
+        if self.old_fd is not None:
+            data = self._read_all(self.old_fd)
+        new_data = self._read_all(self.fd)
+        self.position += len(new_data)
+        if self.max_bytes is not None and self.position > self.max_bytes:
+            self._rotate()
+        return data + new_data
+
+    def _rotate(self) -> None:
+        os.replace(self.path, self.path + ".old")
+        if self.old_fd is not None:
+            os.close(self.old_fd)
+        self.old_fd = self.fd
+        self.fd = os.open(self.path, os.O_RDONLY | os.O_CREAT, 0o644)
+        self.position = 0
+
+    def close(self) -> None:
+        for fd in (self.fd, self.old_fd):
+            if fd is not None:
+                os.close(fd)
+        self.fd = self.old_fd = None
 
 
 class NoitaInfo:
-    def __init__(self, pipe_dir: str = "/tmp/rl_env"):
+    def __init__(
+        self,
+        pipe_dir: str = "/tmp/rl_env",
+        history_len: int = 4096,
+        max_stats_bytes: int = 1 << 20,
+        stats_format: str = "tsv",
+    ):
+        """Keeps the last history_len stat samples logged by the mod. The
+        stats_format must match the mod's, either "tsv" or "binary"."""
         self.is_alive = False
         Path(pipe_dir).mkdir(parents=True, exist_ok=True)
 
@@ -50,13 +128,18 @@ class NoitaInfo:
             "tick": 0,
             "polymorphed": 0,
         }
-        self.info_file = os.path.join(pipe_dir, "noita_stats.tsv")
-        self.info_tail = FileTail(
-            self.info_file, "a+", ", ".join([str(v) for v in self.info.values()])
+        self.binary_stats = stats_format == "binary"
+        self.info_file = os.path.join(
+            pipe_dir, "noita_stats.bin" if self.binary_stats else "noita_stats.tsv"
         )
+        self.info_drain = FileDrain(self.info_file, max_bytes=max_stats_bytes)
+        self._partial_record = b""
+        # A ring buffer of samples. n_samples counts every sample ever read.
+        self.history = np.zeros(history_len, STATS_DTYPE)
+        self.n_samples = 0
 
         self.notification_file = os.path.join(pipe_dir, "noita_notifications.txt")
-        self.notification_tail = FileTail(self.notification_file, "a+")
+        self.notification_drain = FileDrain(self.notification_file)
 
         atexit.register(self.cleanup)
 
@@ -67,19 +150,46 @@ class NoitaInfo:
     def current_info(self) -> dict:
         return self.info.copy()
 
+    def _push(self, samples: np.ndarray) -> None:
+        capacity = len(self.history)
+        n_samples = self.n_samples + len(samples)
+        samples = samples[-capacity:]
+        start = (n_samples - len(samples)) % capacity
+        first = min(len(samples), capacity - start)
+        self.history[start : start + first] = samples[:first]
+        self.history[: len(samples) - first] = samples[first:]
+        self.n_samples = n_samples
+
+    def samples_since(self, n_samples: int) -> np.ndarray:
+        """Returns the samples read after the first n_samples, oldest first. Only
+        the last len(history) samples are kept."""
+        count = min(self.n_samples - n_samples, len(self.history))
+        if count <= 0:
+            return np.zeros(0, STATS_DTYPE)
+        indices = np.arange(self.n_samples - count, self.n_samples) % len(self.history)
+        return self.history[indices]
+
     def on_tick(self) -> dict:
         # Update info
-        new_vals_line, new_data = self.info_tail.get()
-        self.is_alive = new_data or self.is_alive
-        new_vals = new_vals_line.split("\t")
-        for k, v in zip(self.info.keys(), new_vals):
-            if k != "biome":
-                v = int(v)
-            self.info[k] = v
+        data = self._partial_record + self.info_drain.read()
+        if self.binary_stats:
+            end = len(data) - len(data) % STATS_DTYPE.itemsize
+            samples = parse_binary_stats(data[:end])
+        else:
+            end = data.rfind(b"\n") + 1
+            samples = parse_stats(data[:end])
+        self._partial_record = data[end:]
+        if len(samples):
+            self.is_alive = True
+            self._push(samples)
+            last = samples[-1]
+            for k in STATS_DTYPE.names:
+                self.info[k] = (
+                    last[k].decode(errors="replace") if k == "biome" else int(last[k])
+                )
 
         # Update is_alive
-        line, did_die = self.notification_tail.get()
-        if did_die:
+        if b"died" in self.notification_drain.read():
             print("Found death notification")
             self.is_alive = False
 
@@ -87,9 +197,6 @@ class NoitaInfo:
         return self.info.copy()
 
     def cleanup(self) -> None:
-        if self.info_tail is not None:
-            self.info_tail.file.close()
-            self.info_tail = None
-        if self.notification_tail is not None:
-            self.notification_tail.file.close()
-            self.notification_tail = None
+        for drain in (self.info_drain, self.notification_drain):
+            if drain.fd is not None:
+                drain.close()
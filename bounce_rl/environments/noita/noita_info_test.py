@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from bounce_rl.environments.noita import noita_info
+
+
+def _line(tick: int, x: int = 0) -> str:
+    return f"$biome_mines\t100\t100\t0\t{x}\t0\t{tick}\t0\n"
+
+
+class TestNoitaInfo(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.stats = os.path.join(self.dir.name, "noita_stats.tsv")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def _append(self, data: str) -> None:
+        # Like the mod, re-open the file for each write.
+        with open(self.stats, "a") as f:
+            f.write(data)
+
+    def test_samples_are_kept_across_partial_lines_and_rotation(self):
+        info = noita_info.NoitaInfo(
+            self.dir.name, history_len=4, max_stats_bytes=3 * len(_line(0))
+        )
+        self._append(_line(1) + _line(2, x=5) + _line(3)[:10])
+        self.assertEqual(info.on_tick()["x"], 5)
+
+        start = info.n_samples
+        self._append(_line(3)[10:] + _line(4) + _line(5))
+        self.assertEqual(info.on_tick()["tick"], 5)
+        # The file was rotated, later writes go to a new file.
+        self.assertTrue(os.path.exists(self.stats + ".old"))
+        self._append(_line(6))
+        self.assertEqual(info.on_tick()["tick"], 6)
+
+        self.assertEqual(list(info.samples_since(start)["tick"]), [3, 4, 5, 6])
+        # Only the last 4 samples are kept.
+        self.assertEqual(list(info.samples_since(0)["tick"]), [3, 4, 5, 6])
+        self.assertEqual(info.n_samples, 6)
+        info.cleanup()
+
+    def test_binary_records(self):
+        info = noita_info.NoitaInfo(self.dir.name, stats_format="binary")
+        records = np.zeros(2, noita_info.STATS_DTYPE)
+        records["biome"] = b"$biome_mines"
+        records["x"] = [-3, 7]
+        records["tick"] = [1, 2]
+        data = records.tobytes()
+        with open(os.path.join(self.dir.name, "noita_stats.bin"), "ab") as f:
+            f.write(data[:100])
+        self.assertEqual(info.on_tick()["x"], -3)
+        with open(os.path.join(self.dir.name, "noita_stats.bin"), "ab") as f:
+            f.write(data[100:])
+        stats = info.on_tick()
+        self.assertEqual((stats["x"], stats["biome"]), (7, "$biome_mines"))
+        info.cleanup()
+
+    def test_death_notification(self):
+        info = noita_info.NoitaInfo(self.dir.name)
+        self.assertTrue(info.on_tick()["is_alive"])
+        with open(os.path.join(self.dir.name, "noita_notifications.txt"), "a") as f:
+            f.write("died\n")
+        self.assertFalse(info.on_tick()["is_alive"])
+        info.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,8 @@
-from typing import Any, Dict
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from bounce_rl.environments.noita.exploration import ExplorationMap
 
 
 class NoitaReward:
@@ -12,7 +16,11 @@ class NoitaReward:
     - Polymorphed penalty
     """
 
-    def __init__(self):
+    def __init__(self, reward_sampled_blocks: bool = False):
+        """By default a step is paid for entering at most one block, the block it
+        ends in. With reward_sampled_blocks, it's paid for every new block in the
+        stats sampled during the step, which changes the reward's scale."""
+        self.reward_sampled_blocks = reward_sampled_blocks
         self.BLOCK_SIZE = 100
         self.BLOCK_K = 1
         self.LOST_HP_K = 1
@@ -22,28 +30,21 @@ class NoitaReward:
         self.SPENT_GOLD_k = 0.05
         self.POLYMORPHED_K = 3
 
-        self.positions = {}
+        # The visited blocks, which the env can also render over its observations.
+        self.exploration = ExplorationMap()
         self.last_info = None
 
-        """
-        TODO: Consider adding exploration state to the environment's state to make
-              the environment's state more observable. This could be done with an
-              overlay over the game's pixels. Below are some params for calculating
-              the grid.
-
-                SCREEN_WIDTH_COORD = 440
-                SCREEN_HEIGHT_COORD = 248
-                SCREEN_WIDTH_PIX = 640
-                SCREEN_HEIGHT_PIX = 360
-
-                x_orig = info['x'] - SCREEN_WIDTH_COORD / 2
-                y_orig = info['y'] + 
-        """
-
-    def update(self, info: Dict[str, Any]):
-        block_x, block_y = info["x"] // self.BLOCK_SIZE, info["y"] // self.BLOCK_SIZE
+    def update(self, info: Dict[str, Any], samples: Optional[np.ndarray] = None):
+        """Samples are the stats logged by the mod during the step, see NoitaInfo.
+        They're only used with reward_sampled_blocks."""
+        xs, ys = [info["x"]], [info["y"]]
+        if samples is not None and self.reward_sampled_blocks:
+            xs = np.concatenate([samples["x"], xs])
+            ys = np.concatenate([samples["y"], ys])
+        new_blocks = self.exploration.visit_many(
+            np.floor_divide(xs, self.BLOCK_SIZE), np.floor_divide(ys, self.BLOCK_SIZE)
+        )
         if self.last_info is None:
-            self.positions[(block_x, block_y)] = 1
             self.last_info = info
             return 0
 
@@ -62,9 +63,7 @@ class NoitaReward:
 
         reward -= info["polymorphed"] * self.POLYMORPHED_K
 
-        if (block_x, block_y) not in self.positions:
-            reward += self.BLOCK_K
-            self.positions[(block_x, block_y)] = 1
+        reward += new_blocks * self.BLOCK_K
 
         self.last_info = info
         return reward
@@ -1,6 +1,8 @@
 import unittest
 
-from bounce_rl.environments.noita import noita_reward
+import numpy as np
+
+from bounce_rl.environments.noita import noita_info, noita_reward
 
 
 class TestArtOfRallyReward(unittest.TestCase):
@@ -87,6 +89,33 @@ class TestArtOfRallyReward(unittest.TestCase):
         reward = reward_class.update(new_info)
         self.assertEqual(reward, reward_class.BLOCK_K)
 
+    def test_blocks_passed_during_a_step(self):
+        reward_class = noita_reward.NoitaReward(reward_sampled_blocks=True)
+        samples = np.zeros(3, noita_info.STATS_DTYPE)
+        samples["x"] = [0, 150, 250]
+
+        _ = reward_class.update(self._valid_info())
+        reward = reward_class.update(self._valid_info(), samples)
+        self.assertEqual(reward, 2 * reward_class.BLOCK_K)
+
+    def test_default_matches_per_step_reward(self):
+        """By default, only the block each step ends in counts, as before samples
+        were passed in."""
+        reward_class = noita_reward.NoitaReward()
+        positions = [(0, 0), (250, 0), (250, 40), (0, 0), (-150, 900), (260, 10)]
+        sampled = [(0, 0), (50, 0), (150, 0), (250, 0)]
+        samples = np.zeros(len(sampled), noita_info.STATS_DTYPE)
+        samples["x"], samples["y"] = zip(*sampled)
+
+        rewards = []
+        for x, y in positions:
+            info = self._valid_info()
+            info["x"], info["y"] = x, y
+            rewards.append(reward_class.update(info, samples))
+        # The per-step reward: BLOCK_K for each step ending in an unvisited block.
+        self.assertEqual(rewards, [0, 1, 0, 0, 1, 0])
+        self.assertEqual(len(reward_class.exploration), 3)
+
     def test_polymorphed(self):
         reward_class = noita_reward.NoitaReward()
         initial_info = self._valid_info()
@@ -1,27 +1,39 @@
 # Manages n environments of which k are active. The remaining environments are buffers
 # swapped into the live set of k on reset to hide slow reset times in the underlying
-# environment.
+# environment. Buffer environments are reset by a ResetManager.
 #
 # Forked from SB3's SubprocVecEnv.
 
 import concurrent.futures
-import queue
-import threading
+import multiprocessing.connection as mp_connection
 from collections import OrderedDict
-from typing import List, Tuple, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 import gym
 import numpy as np
 from stable_baselines3.common.vec_env.base_vec_env import VecEnvObs
 
-from bounce_rl.gym.env.subproc_env import SubprocEnv
+from bounce_rl.gym.env.reset_manager import ResetManager
+from bounce_rl.gym.env.subproc_env import SharedObservations, SubprocEnv
 
 
 class PoolVecEnv:
-    def __init__(self, env_fns: List[callable], n: int, k: int):
+    def __init__(
+        self,
+        env_fns: List[callable],
+        n: int,
+        k: int,
+        reset_workers: Optional[int] = None,
+        reset_retries: int = 2,
+        reset_timeout: Optional[float] = 300.0,
+    ):
+        """Standby envs are reset by up to reset_workers threads, by default one
+        per standby env, and retried up to reset_retries times. Resets taking
+        over reset_timeout seconds are abandoned and their envs replaced."""
         assert len(env_fns) == n
         assert k <= n
 
+        self.env_fns = env_fns
         self.n = n
         self.k = k
         self.num_envs = k
@@ -29,43 +41,93 @@ class PoolVecEnv:
         with concurrent.futures.ThreadPoolExecutor() as executor:
             self.envs = list(executor.map(SubprocEnv, env_fns))
         self.live_envs = self.envs[:k]
-
-        self.ready_queue = queue.Queue()
-        for e in self.envs[k:]:
-            self._async_reset_env(e)
+        # The index in envs of each live env.
+        self.live_ids = list(range(k))
 
         self.observation_space = self.envs[0].observation_space
         self.action_space = self.envs[0].action_space
 
-    # TODO: Handle self.observation_space and self.action_space.
-    def _async_reset_env(self, env):
-        def reset_env(env):
-            env.reset()
-            if env.env_hasattr("pause"):
-                env.env_method("pause")
-            self.ready_queue.put(env)
+        # Box observations are written by the envs straight into a batch in
+        # shared memory with a slot per live env, rather than being pickled.
+        self.shared_obs = None
+        if SharedObservations.supports(self.observation_space):
+            self.shared_obs = SharedObservations(
+                self.observation_space.shape, self.observation_space.dtype, k
+            )
+            for e in self.envs:
+                e.attach_shared(self.shared_obs)
+
+        self.reset_manager = ResetManager(
+            self.envs,
+            self._make_env,
+            max_workers=reset_workers or max(1, n - k),
+            max_retries=reset_retries,
+            reset_timeout=reset_timeout,
+        )
+        for i in range(k, n):
+            self.reset_manager.submit(i)
 
-        thread = threading.Thread(target=reset_env, args=(env,), daemon=True)
-        thread.start()
+    def _make_env(self, i: int) -> SubprocEnv:
+        env = SubprocEnv(self.env_fns[i])
+        if self.shared_obs is not None:
+            env.attach_shared(self.shared_obs)
+        return env
 
+    # TODO: Handle self.observation_space and self.action_space.
     def _reset_live_env(self, i):
-        self._async_reset_env(self.live_envs[i])
+        """Swaps live env i for a ready env, which the reset manager replaces if
+        it fails to resume."""
+        self.reset_manager.submit(self.live_ids[i])
+        while True:
+            env_id = self.reset_manager.take_ready()
+            env = self.reset_manager.envs[env_id]
+            try:
+                if env.env_hasattr("resume"):
+                    env.env_method("resume")
+                break
+            except (EOFError, OSError):
+                self.reset_manager.submit(env_id)
+        self.live_ids[i] = env_id
+        self.live_envs[i] = env
+
+    def reset_metrics(self) -> Dict[str, float]:
+        """See ResetManager.metrics. Useful for sizing n and k."""
+        return self.reset_manager.metrics()
+
+    def _slot(self, i: int):
+        """The shared observation slot of live env i, if there's shared memory."""
+        return i if self.shared_obs is not None else None
+
+    def _batch_obs(self, obs) -> VecEnvObs:
+        if self.shared_obs is not None:
+            # Copied since the slots are overwritten by the next step.
+            return self.shared_obs.array.copy()
+        return _flatten_obs(obs, self.observation_space)
 
-        self.live_envs[i] = self.ready_queue.get()
-        if self.live_envs[i].env_hasattr("resume"):
-            self.live_envs[i].env_method("resume")
+    def _gather(self, envs: List[SubprocEnv], wait_fn) -> list:
+        """Collects the results of envs' pending commands in the order they
+        finish, returning them in envs' order."""
+        results = [None] * len(envs)
+        pending = {env.remote: i for i, env in enumerate(envs)}
+        while pending:
+            for remote in mp_connection.wait(list(pending)):
+                i = pending.pop(remote)
+                results[i] = wait_fn(envs[i])
+        return results
 
     def step_async(self, actions: np.ndarray):
+        """Starts stepping the live envs, so they run while the caller works."""
         self.actions = actions
+        for i, env in enumerate(self.live_envs):
+            try:
+                env.step_async(actions[i], self._slot(i))
+            except OSError:
+                # The env's process died. Its remote reads as closed in step_wait.
+                env.waiting = True
 
     def step_wait(self):
-        return self.step(self.actions)
-
-    def step(self, actions: np.ndarray):
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            results = list(
-                executor.map(lambda v: v[0].step(v[1]), zip(self.live_envs, actions))
-            )
+        actions = self.actions
+        results = self._gather(self.live_envs, _step_wait)
 
         # Reset failed environments.
         for i, r in enumerate(results):
@@ -73,29 +135,58 @@ class PoolVecEnv:
                 new_result = None
                 while new_result is None:
                     self._reset_live_env(i)
-                    new_result = self.live_envs[i].step(actions[i])
+                    try:
+                        new_result = self.live_envs[i].step(actions[i], self._slot(i))
+                    except (EOFError, OSError):
+                        pass
                 results[i] = new_result
 
         obs, rews, dones, infos = zip(*results)
+        batch_obs = self._batch_obs(obs)
         for i, done in enumerate(dones):
             if done:
                 self._reset_live_env(i)
         return (
-            _flatten_obs(obs, self.observation_space),
+            batch_obs,
             np.stack(rews),
             np.stack(dones),
             list(infos),
         )
 
+    def step(self, actions: np.ndarray):
+        self.step_async(actions)
+        return self.step_wait()
+
     def reset(self):
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            obs = list(executor.map(lambda env: env.reset(), self.live_envs))
-        return _flatten_obs(obs, self.observation_space)
+        for i, env in enumerate(self.live_envs):
+            env.reset_async(slot=self._slot(i))
+        obs = self._gather(self.live_envs, SubprocEnv.reset_wait)
+        return self._batch_obs(obs)
+
+    def close(self):
+        self.reset_manager.close()
+        for env in self.envs:
+            try:
+                env.close()
+            except (EOFError, OSError):
+                pass
+        if self.shared_obs is not None:
+            self.shared_obs.close()
 
     def seed(self, seed=None):
         pass
 
 
+def _step_wait(env: SubprocEnv) -> Optional[tuple]:
+    """Returns the step's result, or None like a failed step if the env's process
+    died."""
+    try:
+        return env.step_wait()
+    except (EOFError, OSError):
+        env.waiting = False
+        return None
+
+
 def _flatten_obs(
     obs: Union[List[VecEnvObs], Tuple[VecEnvObs]], space: gym.spaces.Space
 ) -> VecEnvObs:
@@ -1,10 +1,12 @@
+import time
 import unittest
 from unittest.mock import Mock
 
+import gym.spaces
 import numpy as np
 
-from src.env.fake_test_env import FakeTestEnv
-from src.env.pool_vec_env import PoolVecEnv
+from bounce_rl.gym.env.fake_test_env import FakeTestEnv
+from bounce_rl.gym.env.pool_vec_env import PoolVecEnv
 
 
 class TestPoolVecEnv(unittest.TestCase):
@@ -29,6 +31,32 @@ class TestPoolVecEnv(unittest.TestCase):
         self.assertEqual(done, [False])
         self.assertEqual(info, [{}])
 
+    def test_step_async(self):
+        env = PoolVecEnv([lambda: FakeTestEnv(done_after=5)] * 2, n=2, k=2)
+        env.step_async(np.array([1, 2]))
+        obs, rew, done, info = env.step_wait()
+        self.assertEqual(obs.tolist(), [0, 0])
+        self.assertEqual(rew.tolist(), [1, 2])
+        self.assertEqual(done.tolist(), [False, False])
+
+    def test_step_async_pipelines_envs(self):
+        class SlowEnv(FakeTestEnv):
+            def step(self, action):
+                time.sleep(0.5)
+                obs, rew, done, info = super().step(action)
+                return obs, rew, done, {"slow": True}
+
+        env = PoolVecEnv([SlowEnv, FakeTestEnv], n=2, k=2)
+        start = time.perf_counter()
+        env.step_async(np.array([1, 2]))
+        # Stepping happens in the env processes while the caller works.
+        self.assertLess(time.perf_counter() - start, 0.25)
+        obs, rew, done, info = env.step_wait()
+        # The fast env finishes first, but results are in env order.
+        self.assertEqual(rew.tolist(), [1, 2])
+        self.assertEqual(info, [{"slow": True}, {}])
+        env.close()
+
     def test_swap_on_done(self):
         c_0 = FakeTestEnv(done_after=2)
         c_1 = FakeTestEnv(done_after=3)
@@ -75,6 +103,76 @@ class TestPoolVecEnv(unittest.TestCase):
         self.assertEqual(done, [False])
         self.assertEqual(info, [{}])
 
+    def test_shared_observations(self):
+        space = gym.spaces.Box(low=0, high=10, shape=(2,), dtype=np.int64)
+
+        class VectorEnv(FakeTestEnv):
+            def step(self, action):
+                obs, rew, done, info = super().step(action)
+                return np.array([obs, action]), rew, done, info
+
+        env = PoolVecEnv(
+            [lambda: VectorEnv(done_after=2, observation_space=space)], n=1, k=1
+        )
+        self.assertIsNotNone(env.shared_obs)
+        obs, rew, done, info = env.step(np.array([3]))
+        self.assertEqual(obs.tolist(), [[0, 3]])
+        obs, rew, done, info = env.step(np.array([4]))
+        self.assertEqual(obs.tolist(), [[1, 4]])
+        self.assertEqual(done, [True])
+        obs, rew, done, info = env.step(np.array([5]))
+        self.assertEqual(obs.tolist(), [[0, 5]])
+        env.close()
+
+    def test_failed_reset(self):
+        class FailingEnv(FakeTestEnv):
+            def reset(self, seed=None):
+                raise RuntimeError("Reset failed")
+
+        # With one reset worker, the failing env's resets finish first.
+        env = PoolVecEnv(
+            [lambda: FakeTestEnv(done_after=1), FailingEnv],
+            n=2,
+            k=1,
+            reset_workers=1,
+            reset_retries=1,
+        )
+        obs, rew, done, info = env.step(np.array([1]))
+        self.assertEqual(done, [True])
+        self.assertEqual(env.live_ids, [0])
+
+        metrics = env.reset_metrics()
+        self.assertEqual(metrics["resets"], 1)
+        self.assertEqual(metrics["failures"], 1)
+        # The env is replaced before its retry but not after its last attempt.
+        self.assertEqual(metrics["replacements"], 1)
+        self.assertEqual(metrics["failed_envs"], 1)
+        env.close()
+
+    def test_reset_timeout(self):
+        class HangingEnv(FakeTestEnv):
+            def reset(self, seed=None):
+                time.sleep(60)
+
+        env = PoolVecEnv(
+            [lambda: FakeTestEnv(done_after=1), HangingEnv],
+            n=2,
+            k=1,
+            reset_workers=1,
+            reset_retries=0,
+            reset_timeout=0.5,
+        )
+        hanging_env = env.envs[1]
+        obs, rew, done, info = env.step(np.array([1]))
+        self.assertEqual(env.live_ids, [0])
+
+        metrics = env.reset_metrics()
+        self.assertEqual(metrics["timeouts"], 1)
+        self.assertEqual(metrics["failed_envs"], 1)
+        self.assertEqual(metrics["replacements"], 0)
+        self.assertFalse(hanging_env.process.is_alive())
+        env.close()
+
     def test_failed_step_handling(self):
         def get_mock_env():
             c_env = FakeTestEnv()
@@ -89,4 +187,4 @@ class TestPoolVecEnv(unittest.TestCase):
         self.assertEqual(obs, [1])
         self.assertEqual(rew, [2])
         self.assertEqual(done, [False])
-        self.assertEqual(info, [{}])
\ No newline at end of file
+        self.assertEqual(info, [{}])
@@ -0,0 +1,167 @@
+# Resets PoolVecEnv's standby environments on a bounded pool of worker threads and
+# tracks each environment's health.
+#
+# An environment is live while PoolVecEnv steps it, resetting while it's queued for
+# or running a reset, ready once it's reset and waiting to be swapped in and failed
+# once every attempt to reset it has failed. An environment whose reset fails or
+# times out is replaced by a new process before it's retried, since SubprocEnv
+# workers exit when their env raises and a hung env can't be recovered.
+
+import concurrent.futures
+import enum
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from bounce_rl.gym.env.subproc_env import SubprocEnv
+from bounce_rl.utilities.util import WindowedStats
+
+
+class EnvState(enum.Enum):
+    LIVE = "live"
+    RESETTING = "resetting"
+    READY = "ready"
+    FAILED = "failed"
+
+
+def _discard(env: SubprocEnv) -> None:
+    """Closes an env that may be dead, broken or hung, killing it if need be."""
+    try:
+        # An env with a pending command may never answer, so it's killed.
+        if env.process.is_alive() and not env.waiting:
+            env.close()
+    except (EOFError, OSError):
+        pass
+    if env.process.is_alive():
+        env.process.kill()
+    env.process.join()
+
+
+class ResetManager:
+    def __init__(
+        self,
+        envs: List[SubprocEnv],
+        make_env: Callable[[int], SubprocEnv],
+        max_workers: int = 4,
+        max_retries: int = 2,
+        reset_timeout: Optional[float] = None,
+        metrics_window: int = 100,
+    ):
+        """Manages the given envs, which start live. make_env creates a replacement
+        for the env with the given index. Envs are reset up to max_retries more
+        times after a failure, including a reset taking over reset_timeout
+        seconds, before being marked failed. Metrics cover the last
+        metrics_window resets."""
+        self.envs = envs
+        self.make_env = make_env
+        self.max_retries = max_retries
+        self.reset_timeout = reset_timeout
+        self.states = [EnvState.LIVE] * len(envs)
+        self._ready: deque = deque()
+        self._cond = threading.Condition()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers, thread_name_prefix="env-reset"
+        )
+        self._counts = {
+            "resets": 0,
+            "retries": 0,
+            "timeouts": 0,
+            "replacements": 0,
+            "failures": 0,
+        }
+        self._reset_seconds = WindowedStats(metrics_window)
+        self._queue_wait_seconds = WindowedStats(metrics_window)
+        self._ready_wait_seconds = WindowedStats(metrics_window)
+
+    def submit(self, i: int) -> None:
+        """Queues env i for a reset."""
+        with self._cond:
+            self.states[i] = EnvState.RESETTING
+        self._executor.submit(self._reset, i, time.perf_counter())
+
+    def _reset(self, i: int, submitted: float) -> None:
+        start = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                with self._cond:
+                    self._counts["retries"] += 1
+            try:
+                env = self.envs[i]
+                if not env.process.is_alive():
+                    env = self._replace(i)
+                env.reset_async()
+                if not env.remote.poll(self.reset_timeout):
+                    with self._cond:
+                        self._counts["timeouts"] += 1
+                    raise TimeoutError(f"Reset took over {self.reset_timeout}s")
+                env.reset_wait()
+                if env.env_hasattr("pause"):
+                    env.env_method("pause")
+                break
+            except Exception as e:
+                print(f"WARNING: Failed to reset env {i} on attempt {attempt}: {e!r}")
+                if attempt == self.max_retries:
+                    # Nothing will use the env again, so don't start a new one.
+                    _discard(self.envs[i])
+                    continue
+                try:
+                    self._replace(i)
+                except Exception as replace_error:
+                    print(f"WARNING: Failed to replace env {i}: {replace_error!r}")
+        else:
+            with self._cond:
+                self.states[i] = EnvState.FAILED
+                self._counts["failures"] += 1
+                self._cond.notify_all()
+            return
+
+        with self._cond:
+            self._counts["resets"] += 1
+            self._queue_wait_seconds.push(start - submitted)
+            self._reset_seconds.push(time.perf_counter() - start)
+            self.states[i] = EnvState.READY
+            self._ready.append(i)
+            self._cond.notify_all()
+
+    def _replace(self, i: int) -> SubprocEnv:
+        _discard(self.envs[i])
+        self.envs[i] = self.make_env(i)
+        with self._cond:
+            self._counts["replacements"] += 1
+        return self.envs[i]
+
+    def take_ready(self) -> int:
+        """Waits for a ready env, marks it live and returns its index. Raises a
+        RuntimeError if no env is ready or resetting."""
+        start = time.perf_counter()
+        with self._cond:
+            while not self._ready:
+                if EnvState.RESETTING not in self.states:
+                    raise RuntimeError("No env is ready or resetting.")
+                self._cond.wait()
+            i = self._ready.popleft()
+            self.states[i] = EnvState.LIVE
+            self._ready_wait_seconds.push(time.perf_counter() - start)
+        return i
+
+    def metrics(self) -> Dict[str, float]:
+        """Returns reset counts, the number of envs in each state and the mean and
+        max of recent reset durations, of the time resets waited for a worker and
+        of the time callers waited for a ready env."""
+        with self._cond:
+            metrics: Dict[str, float] = dict(self._counts)
+            for state in EnvState:
+                metrics[f"{state.value}_envs"] = self.states.count(state)
+            for name, stats in (
+                ("reset_seconds", self._reset_seconds),
+                ("queue_wait_seconds", self._queue_wait_seconds),
+                ("ready_wait_seconds", self._ready_wait_seconds),
+            ):
+                metrics[f"mean_{name}"] = stats.mean()
+                metrics[f"max_{name}"] = stats.max()
+        return metrics
+
+    def close(self) -> None:
+        """Waits for running resets to finish."""
+        self._executor.shutdown(wait=True)
@@ -1,11 +1,50 @@
 import multiprocessing as mp
-from typing import Any, Callable, Dict, Optional
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, Optional, Tuple
 
 import gym
 import numpy as np
 from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper
 
 
+class SharedObservations:
+    def __init__(
+        self,
+        shape: Tuple[int, ...],
+        dtype: Any,
+        n_slots: int,
+        name: Optional[str] = None,
+    ):
+        """A batch of n_slots observations in shared memory, which env workers
+        write in place of sending observations through their pipes. Creates the
+        shared memory unless given the name of existing shared memory."""
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.n_slots = n_slots
+        self.owner = name is None
+        size = max(1, n_slots * int(np.prod(shape)) * self.dtype.itemsize)
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size)
+        self.array = np.ndarray((n_slots, *self.shape), self.dtype, buffer=self.shm.buf)
+
+    @staticmethod
+    def supports(space: gym.spaces.Space) -> bool:
+        return isinstance(space, gym.spaces.Box)
+
+    def spec(self) -> Tuple[Tuple[int, ...], str, int, str]:
+        """Returns the arguments that attach other processes to this batch."""
+        return self.shape, self.dtype.str, self.n_slots, self.shm.name
+
+    def close(self) -> None:
+        """Releases the memory, which is freed once its owner closes it."""
+        if self.shm is None:
+            return
+        del self.array
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+        self.shm = None
+
+
 def _worker(
     remote: mp.connection.Connection,
     parent_remote: mp.connection.Connection,
@@ -14,18 +53,37 @@ def _worker(
     parent_remote.close()
     env = env_fn_wrapper.var()
     reset_info: Optional[Dict[str, Any]] = {}
+    shared: Optional[SharedObservations] = None
     while True:
         try:
             cmd, data = remote.recv()
             if cmd == "step":
                 result = env.step(data)
                 remote.send((result, reset_info))
+            elif cmd == "step_shared":
+                # Observations are written to their slot and the rest is sent.
+                action, slot = data
+                result = env.step(action)
+                if result is not None:
+                    shared.array[slot] = result[0]
+                    result = (None, *result[1:])
+                remote.send((result, reset_info))
             elif cmd == "reset":
                 maybe_options = {"options": data[1]} if data[1] else {}
                 observation = env.reset(seed=data[0], **maybe_options)
+                if len(data) > 2 and data[2] is not None:
+                    shared.array[data[2]] = observation
+                    observation = None
                 remote.send(observation)
+            elif cmd == "attach_shared":
+                if shared is not None:
+                    shared.close()
+                shared = SharedObservations(*data) if data is not None else None
+                remote.send(True)
             elif cmd == "close":
                 env.close()
+                if shared is not None:
+                    shared.close()
                 remote.close()
                 break
             elif cmd == "get_spaces":
@@ -70,6 +128,7 @@ class SubprocEnv(gym.Env):
     ):
         self.waiting = False
         self.closed = False
+        self._slot: Optional[int] = None
 
         if start_method is None:
             # Fork is not a thread safe method (see issue #217)
@@ -88,30 +147,55 @@ class SubprocEnv(gym.Env):
 
         self.remote.send(("get_spaces", None))
         self.observation_space, self.action_space = self.remote.recv()
-
-    # Do we need the async API for SB3 integration?
-    # def step_async(self, action: np.ndarray) -> None:
-    #     self.remote.send(("step", action))
-    #     self.waiting = True
-    #
-    # def step_wait(self):
-    #     result = self.remote.recv()
-    #     self.waiting = False
-    #     obs, rews, dones, infos, self.reset_infos = result
-    #     return obs, rews, dones, infos
-
-    def step(self, action: np.ndarray) -> tuple:
-        self.remote.send(("step", action))
+        self.shared: Optional[SharedObservations] = None
+
+    def attach_shared(self, shared: Optional[SharedObservations]) -> None:
+        """Makes steps and resets given a slot write their observations to that
+        slot of shared, or detaches the env from shared memory if it's None."""
+        self.remote.send(("attach_shared", shared.spec() if shared else None))
+        self.remote.recv()
+        self.shared = shared
+
+    def step_async(self, action: np.ndarray, slot: Optional[int] = None) -> None:
+        """Starts a step. The remote is readable once its result is ready, so
+        callers can wait on many envs' remotes with multiprocessing's wait."""
+        if slot is None:
+            self.remote.send(("step", action))
+        else:
+            self.remote.send(("step_shared", (action, slot)))
+        self._slot = slot
         self.waiting = True
+
+    def step_wait(self) -> tuple:
+        """If the step was given a slot, the observation is returned as a view of
+        that slot of the attached shared observations, which the next write
+        overwrites."""
         result, self.reset_info = self.remote.recv()
         self.waiting = False
+        if result is not None and self._slot is not None:
+            result = (self.shared.array[self._slot], *result[1:])
         return result
 
-    def reset(self, seed=None):
-        self.remote.send(("reset", (0, None)))
+    def step(self, action: np.ndarray, slot: Optional[int] = None) -> tuple:
+        self.step_async(action, slot)
+        return self.step_wait()
+
+    def reset_async(self, seed=None, slot: Optional[int] = None) -> None:
+        self.remote.send(("reset", (0, None, slot)))
+        self._slot = slot
+        self.waiting = True
+
+    def reset_wait(self):
         result = self.remote.recv()
+        self.waiting = False
+        if self._slot is not None:
+            return self.shared.array[self._slot]
         return result  # type: ignore[assignment]
 
+    def reset(self, seed=None, slot: Optional[int] = None):
+        self.reset_async(seed, slot)
+        return self.reset_wait()
+
     def close(self) -> None:
         if self.closed:
             return
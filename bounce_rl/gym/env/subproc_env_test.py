@@ -1,9 +1,10 @@
 import unittest
 
 import gym.spaces
+import numpy as np
 
-from src.env.fake_test_env import FakeTestEnv
-from src.env.subproc_env import SubprocEnv
+from bounce_rl.gym.env.fake_test_env import FakeTestEnv
+from bounce_rl.gym.env.subproc_env import SharedObservations, SubprocEnv
 
 
 class TestSubprocEnv(unittest.TestCase):
@@ -53,6 +54,29 @@ class TestSubprocEnv(unittest.TestCase):
         obs, rew, done, info = env.step(2)
         self.assertEqual(obs, 1)
 
+    def test_shared_observations(self):
+        space = gym.spaces.Box(low=0, high=10, shape=(), dtype=np.int64)
+        env = SubprocEnv(lambda: FakeTestEnv(done_after=10, observation_space=space))
+        shared = SharedObservations(space.shape, space.dtype, 2)
+        env.attach_shared(shared)
+
+        _ = env.step(0, slot=1)
+        obs, rew, done, info = env.step(3, slot=1)
+        self.assertEqual(obs, 1)
+        self.assertEqual(rew, 3)
+        self.assertEqual(shared.array.tolist(), [0, 1])
+
+        shared.array[0] = 7
+        obs = env.reset(slot=0)
+        self.assertEqual(obs, 0)
+        self.assertEqual(shared.array.tolist(), [0, 1])
+        # Steps without a slot still send their observations.
+        obs, rew, done, info = env.step(2)
+        self.assertEqual(obs, 0)
+        self.assertEqual(shared.array.tolist(), [0, 1])
+        env.close()
+        shared.close()
+
     def test_close(self):
         # Since close happens out of process, it's a little messy to test.
         # We just verify that it can be called successfully.
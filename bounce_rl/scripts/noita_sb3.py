@@ -15,6 +15,7 @@ import stable_baselines3
 import stable_baselines3.common.env_checker
 from stable_baselines3.common.vec_env import VecFrameStack
 
+from bounce_rl.core.launcher import launcher_client
 from bounce_rl.environments.noita import noita_env
 from bounce_rl.gym.env.pool_vec_env import PoolVecEnv
 
@@ -55,7 +56,11 @@ def run(
     timesteps=1e6,
     n_stack=4,
     num_envs=4,
+    pin_cpus=False,
 ):
+    if pin_cpus:
+        # Before the envs start, so every learner thread lands on the learner cores.
+        print("Learner CPUs: ", launcher_client.pin_learner())
     # Step duration is set to 0.125 in NoitaEnv.
     noita_env.NoitaEnv.pre_init(num_envs=num_envs)
     env_fns = []
@@ -68,6 +73,7 @@ def run(
                 x_pos=i % 2,
                 y_pos=i // 2,
                 instance=i,
+                run_config={"pin_cpus": pin_cpus},
             )
         )
     env = VecFrameStack(
@@ -0,0 +1,152 @@
+"""Random access to the transitions of a logged trajectory.
+
+Each logged step holds its action, reward and done flags along with the pixels
+observed after the action, so the transition of step t is (pixels of step t - 1,
+action t, reward t, done t, pixels of step t). The first step of an episode has no
+transition since the observation it acted on, from the reset, isn't logged.
+
+Actions and rewards are read through each chunk's memory mapped rows file when a
+batch is built. Only the done flags and episode bookkeeping, a few bytes per row,
+are kept in memory, and frames are decoded on demand, so a dataset costs little
+memory however long the trajectory is."""
+
+import concurrent.futures
+import threading
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import simplejpeg
+
+from bounce_rl.trajectories import frame_codec, store
+
+
+class TrajectoryDataset:
+    def __init__(
+        self,
+        directory: str,
+        frame_stack: int = 1,
+        episode_column: str = "ep_num",
+        action_column: str = "action",
+        reward_column: str = "reward",
+        done_columns: Sequence[str] = ("terminated", "truncated"),
+    ):
+        """Observations stack the last frame_stack frames, repeating the
+        episode's first frame to fill stacks at the start of episodes."""
+        self.directory = directory
+        self.frame_stack = frame_stack
+        self.chunks = [
+            store.ChunkReader(directory, c) for c in store.list_chunks(directory)
+        ]
+        # The global row number of each chunk's first row.
+        self._chunk_starts = np.cumsum([0] + [c.n_rows for c in self.chunks])
+
+        names = [episode_column, action_column, reward_column, *done_columns]
+        columns = [c.columns(names + [store.IMAGE_SIZE]) for c in self.chunks]
+        # Per chunk columns, views of the mapped rows files, see _gather.
+        self._actions = [c[action_column] for c in columns]
+        self._rewards = [c[reward_column] for c in columns]
+
+        def concatenate(name: str) -> np.ndarray:
+            return np.concatenate([c[name] for c in columns]) if columns else []
+
+        self.dones = np.zeros(self._chunk_starts[-1], dtype=bool)
+        for name in done_columns:
+            self.dones |= np.asarray(concatenate(name), dtype=bool)
+
+        episodes = np.asarray(concatenate(episode_column))
+        has_frame = np.asarray(concatenate(store.IMAGE_SIZE)) > 0
+        # The first row of each row's episode.
+        starts = np.ones(len(episodes), dtype=bool)
+        starts[1:] = episodes[1:] != episodes[:-1]
+        self._episode_start = np.maximum.accumulate(
+            np.where(starts, np.arange(len(episodes)), 0)
+        )
+        # Steps whose previous step is in their episode and both have frames.
+        valid = np.zeros(len(episodes), dtype=bool)
+        valid[1:] = ~starts[1:] & has_frame[1:] & has_frame[:-1]
+        self.indices = np.flatnonzero(valid)
+
+        self._local = threading.local()
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def _gather(self, parts: List[np.ndarray], rows: np.ndarray) -> np.ndarray:
+        """Returns the values of a per chunk column at the given global rows."""
+        chunks = np.searchsorted(self._chunk_starts, rows, side="right") - 1
+        return np.stack(
+            [parts[c][r - self._chunk_starts[c]] for c, r in zip(chunks, rows)]
+        )
+
+    def _frame(self, row: int) -> np.ndarray:
+        """Decodes the frame of a global row. Each thread has its own readers."""
+        readers = getattr(self._local, "readers", None)
+        if readers is None:
+            readers = self._local.readers = {}
+        chunk = int(np.searchsorted(self._chunk_starts, row, side="right")) - 1
+        local_row = row - int(self._chunk_starts[chunk])
+        if chunk not in readers:
+            reader = store.ChunkReader(self.directory, chunk)
+            if frame_codec.is_frame(reader.image(local_row)):
+                reader = frame_codec.FrameReader(reader)
+            readers[chunk] = reader
+        reader = readers[chunk]
+        if isinstance(reader, frame_codec.FrameReader):
+            return reader.frame(local_row)
+        return simplejpeg.decode_jpeg(reader.image(local_row))
+
+    def _frames(self, row: int) -> np.ndarray:
+        """Returns the frame_stack + 1 frames ending at row, repeating the
+        episode's first frame before its start. Each frame is decoded once and in
+        order, so delta frames decode from the one before rather than from their
+        keyframe."""
+        first = self._episode_start[row]
+        rows = [max(row - i, first) for i in reversed(range(self.frame_stack + 1))]
+        decoded = {r: self._frame(r) for r in sorted(set(rows))}
+        return np.stack([decoded[r] for r in rows])
+
+    def transitions(self, rows: Sequence[int]) -> Dict[str, np.ndarray]:
+        """Returns a batch of the transitions of the given rows, which must be in
+        indices. Observations are frame_stack x H x W x C if frames are stacked
+        and H x W x C otherwise."""
+        rows = np.asarray(rows)
+        # A transition's observations share all but one frame.
+        frames = np.stack([self._frames(r) for r in rows])
+        obs = np.ascontiguousarray(frames[:, :-1])
+        next_obs = np.ascontiguousarray(frames[:, 1:])
+        if self.frame_stack == 1:
+            obs, next_obs = obs[:, 0], next_obs[:, 0]
+        return {
+            "obs": obs,
+            "action": self._gather(self._actions, rows),
+            "reward": self._gather(self._rewards, rows),
+            "done": self.dones[rows],
+            "next_obs": next_obs,
+        }
+
+    def batches(
+        self,
+        batch_size: int,
+        shuffle: bool = True,
+        seed: Optional[int] = None,
+        workers: int = 4,
+        prefetch: int = 8,
+    ) -> Iterator[Dict[str, np.ndarray]]:
+        """Yields one epoch of minibatches, decoded by a pool of worker threads
+        up to prefetch batches ahead. The last partial batch is dropped."""
+        order = self.indices
+        if shuffle:
+            order = np.random.default_rng(seed).permutation(order)
+        batch_rows: List[np.ndarray] = [
+            order[i : i + batch_size]
+            for i in range(0, len(order) - batch_size + 1, batch_size)
+        ]
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            pending: deque = deque()
+            for rows in batch_rows:
+                pending.append(pool.submit(self.transitions, rows))
+                if len(pending) > prefetch:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
@@ -0,0 +1,86 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from bounce_rl.trajectories import dataset, frame_codec, store
+
+SCHEMA = {
+    "action": ("f4", (2,)),
+    "reward": ("f4", ()),
+    "terminated": ("?", ()),
+    "truncated": ("?", ()),
+    "ep_num": ("i4", ()),
+}
+
+
+def _frame(step: int) -> np.ndarray:
+    return np.full((4, 6, 3), step, np.uint8)
+
+
+class TestTrajectoryDataset(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        # Two episodes of 5 steps, split over chunks of 4 rows.
+        with store.TrajectoryStore(
+            self.dir.name,
+            SCHEMA,
+            rows_per_chunk=4,
+            frame_encoder=frame_codec.FrameEncoder(keyframe_interval=2),
+        ) as s:
+            for step in range(10):
+                record = {
+                    "action": [step, -step],
+                    "reward": step,
+                    "terminated": step % 5 == 4,
+                    "ep_num": step // 5,
+                }
+                s.append(record, _frame(step))
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_transitions_stay_within_episodes(self):
+        data = dataset.TrajectoryDataset(self.dir.name, frame_stack=3)
+        self.assertEqual(list(data.indices), [1, 2, 3, 4, 6, 7, 8, 9])
+
+        batch = data.transitions([6, 9])
+        np.testing.assert_array_equal(batch["reward"], [6, 9])
+        np.testing.assert_array_equal(batch["done"], [False, True])
+        self.assertEqual(batch["obs"].shape, (2, 3, 4, 6, 3))
+        # The stack before step 6 repeats its episode's first frame.
+        np.testing.assert_array_equal(batch["obs"][0, :, 0, 0, 0], [5, 5, 5])
+        np.testing.assert_array_equal(batch["next_obs"][1, :, 0, 0, 0], [7, 8, 9])
+
+    def test_frames_are_decoded_once_in_order(self):
+        data = dataset.TrajectoryDataset(self.dir.name, frame_stack=3)
+        decoded = []
+        frame = data._frame
+        data._frame = lambda row: decoded.append(row) or frame(row)
+
+        batch = data.transitions([9, 6])
+        self.assertEqual(decoded, [6, 7, 8, 9, 5, 6])
+        np.testing.assert_array_equal(batch["obs"][0, :, 0, 0, 0], [6, 7, 8])
+        np.testing.assert_array_equal(batch["next_obs"][1, :, 0, 0, 0], [5, 5, 6])
+        # Rows 9 and 6 are in different chunks.
+        np.testing.assert_array_equal(batch["action"], [[9, -9], [6, -6]])
+
+    def test_unstacked_observations(self):
+        data = dataset.TrajectoryDataset(self.dir.name)
+        batch = data.transitions([2])
+        self.assertEqual(batch["obs"].shape, (1, 4, 6, 3))
+        self.assertEqual(batch["obs"][0, 0, 0, 0], 1)
+        self.assertEqual(batch["next_obs"][0, 0, 0, 0], 2)
+
+    def test_batches_cover_an_epoch(self):
+        data = dataset.TrajectoryDataset(self.dir.name)
+        rewards = [
+            r
+            for batch in data.batches(batch_size=2, seed=0, workers=2, prefetch=1)
+            for r in batch["reward"]
+        ]
+        self.assertEqual(sorted(rewards), [1, 2, 3, 4, 6, 7, 8, 9])
+
+
+if __name__ == "__main__":
+    unittest.main()
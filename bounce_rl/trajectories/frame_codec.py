@@ -0,0 +1,126 @@
+"""A keyframe and delta codec for logged frames.
+
+Consecutive frames mostly repeat each other, so all but every keyframe_interval-th
+frame is stored as the zlib compressed XOR of the frame with the frame before it.
+Unchanged pixels XOR to zero, which zlib stores in almost no space.
+
+With a tolerance above zero, pixel channels that changed by at most tolerance are
+kept at their previous value. The encoder diffs against the frames the decoder will
+reconstruct, so this loss doesn't accumulate across deltas.
+
+Each encoded frame starts with a header giving its kind and shape, so readers can
+find a chunk's keyframes from the first byte of each of its images."""
+
+import struct
+import zlib
+from typing import Optional
+
+import numpy as np
+
+from bounce_rl.trajectories.store import IMAGE_OFFSET, IMAGE_SIZE, ChunkReader
+
+KEYFRAME = 0
+DELTA = 1
+# kind, height, width, channels
+HEADER = struct.Struct("<BxHHH")
+
+
+class FrameEncoder:
+    def __init__(self, keyframe_interval: int = 64, tolerance: int = 0, level: int = 1):
+        """Level is the zlib compression level."""
+        self.keyframe_interval = keyframe_interval
+        self.tolerance = tolerance
+        self.level = level
+        self.reset()
+
+    def reset(self) -> None:
+        """Makes the next frame a keyframe."""
+        self._previous: Optional[np.ndarray] = None
+        self._since_keyframe = 0
+
+    def encode(self, frame: np.ndarray) -> bytes:
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        if frame.ndim == 2:
+            frame = frame[:, :, np.newaxis]
+        previous = self._previous
+        if (
+            previous is None
+            or previous.shape != frame.shape
+            or self._since_keyframe >= self.keyframe_interval
+        ):
+            self._previous = frame
+            self._since_keyframe = 1
+            return HEADER.pack(KEYFRAME, *frame.shape) + zlib.compress(
+                frame, self.level
+            )
+
+        if self.tolerance > 0:
+            changed = (
+                np.abs(frame.astype(np.int16) - previous.astype(np.int16))
+                > self.tolerance
+            )
+            frame = np.where(changed, frame, previous)
+        self._previous = frame
+        self._since_keyframe += 1
+        return HEADER.pack(DELTA, *frame.shape) + zlib.compress(
+            np.bitwise_xor(frame, previous), self.level
+        )
+
+
+def is_frame(blob: bytes) -> bool:
+    """Returns whether blob was encoded by FrameEncoder rather than being an image
+    file, all of whose formats start with a byte above DELTA."""
+    return len(blob) >= HEADER.size and blob[0] <= DELTA
+
+
+def decode(blob: bytes, previous: Optional[np.ndarray] = None) -> np.ndarray:
+    """Decodes a frame. Deltas need the decoded frame before them."""
+    kind, height, width, channels = HEADER.unpack_from(blob)
+    data = np.frombuffer(zlib.decompress(blob[HEADER.size :]), dtype=np.uint8)
+    data = data.reshape((height, width, channels))
+    if kind == KEYFRAME:
+        return data
+    assert previous is not None, "Deltas need their previous frame"
+    return np.bitwise_xor(data, previous)
+
+
+class FrameReader:
+    def __init__(self, chunk: ChunkReader):
+        """Decodes the frames of a chunk's rows in any order."""
+        self.chunk = chunk
+        index = chunk.columns([IMAGE_OFFSET, IMAGE_SIZE])
+        # The rows with images and the rows with keyframes, in order.
+        self._image_rows = np.flatnonzero(index[IMAGE_SIZE])
+        self._keyframe_rows = self._find_keyframes(index[IMAGE_OFFSET])
+        self._last_row: Optional[int] = None
+        self._last_frame: Optional[np.ndarray] = None
+
+    def _find_keyframes(self, offsets: np.ndarray) -> np.ndarray:
+        if len(self._image_rows) == 0:
+            return self._image_rows
+        blobs = np.memmap(self.chunk.blobs_path, dtype=np.uint8, mode="r")
+        kinds = blobs[offsets[self._image_rows]]
+        return self._image_rows[kinds == KEYFRAME]
+
+    def frame(self, row: int) -> Optional[np.ndarray]:
+        """Returns the row's frame or None if it doesn't have one. Decoding starts
+        from the row's keyframe, or from the last frame returned if that's between
+        the keyframe and the row, so sequential reads decode one delta per frame."""
+        if row == self._last_row:
+            return self._last_frame
+        i = np.searchsorted(self._image_rows, row)
+        if i == len(self._image_rows) or self._image_rows[i] != row:
+            return None
+        k = np.searchsorted(self._keyframe_rows, row, side="right") - 1
+        assert k >= 0, "The chunk's first frame isn't a keyframe"
+        keyframe_row = self._keyframe_rows[k]
+        if self._last_row is not None and keyframe_row <= self._last_row < row:
+            start = np.searchsorted(self._image_rows, self._last_row) + 1
+            frame = self._last_frame
+        else:
+            start = np.searchsorted(self._image_rows, keyframe_row)
+            frame = None
+        for r in self._image_rows[start : i + 1]:
+            frame = decode(self.chunk.image(int(r)), frame)
+        self._last_row, self._last_frame = row, frame
+        return frame
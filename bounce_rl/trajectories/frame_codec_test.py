@@ -0,0 +1,62 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from bounce_rl.trajectories import frame_codec, store
+
+
+def _frames(n: int) -> list:
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (36, 64, 3), dtype=np.uint8)
+    frames = []
+    for i in range(n):
+        frame = frame.copy()
+        frame[i % 36, :8] = rng.integers(0, 256, (8, 3))
+        frames.append(frame)
+    return frames
+
+
+class TestFrameCodec(unittest.TestCase):
+    def test_deltas_are_lossless_and_small(self):
+        frames = _frames(5)
+        encoder = frame_codec.FrameEncoder(keyframe_interval=4)
+        blobs = [encoder.encode(f) for f in frames]
+        self.assertEqual([b[0] for b in blobs], [0, 1, 1, 1, 0])
+        self.assertLess(len(blobs[1]), len(blobs[0]) // 10)
+
+        frame = None
+        for original, blob in zip(frames, blobs):
+            frame = frame_codec.decode(blob, frame)
+            np.testing.assert_array_equal(frame, original)
+
+    def test_tolerance_doesnt_accumulate(self):
+        encoder = frame_codec.FrameEncoder(tolerance=2)
+        frame = None
+        for value in (10, 12, 14, 16):
+            original = np.full((2, 2, 3), value, np.uint8)
+            frame = frame_codec.decode(encoder.encode(original), frame)
+            self.assertLessEqual(np.abs(frame.astype(int) - original).max(), 2)
+
+    def test_random_access_through_the_store(self):
+        frames = _frames(12)
+        with tempfile.TemporaryDirectory() as path:
+            encoder = frame_codec.FrameEncoder(keyframe_interval=3)
+            with store.TrajectoryStore(
+                path, {"step": ("i4", ())}, rows_per_chunk=8, frame_encoder=encoder
+            ) as s:
+                for i, frame in enumerate(frames):
+                    s.append({"step": i}, frame if i != 5 else None)
+
+            for chunk, rows in ((0, range(8)), (1, range(8, 12))):
+                reader = frame_codec.FrameReader(store.ChunkReader(path, chunk))
+                for row in (6, 2, 3, 7, 0, 4, 1) if chunk == 0 else (3, 0, 2, 1):
+                    frame = reader.frame(row)
+                    if rows[row] == 5:
+                        self.assertIsNone(frame)
+                    else:
+                        np.testing.assert_array_equal(frame, frames[rows[row]])
+
+
+if __name__ == "__main__":
+    unittest.main()
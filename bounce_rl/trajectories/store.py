@@ -0,0 +1,377 @@
+"""An append-only, columnar store for step records.
+
+A store is a directory of chunks. Each chunk is a rows file holding fixed schema
+records and a blobs file holding the records' optional images, which the rows
+file indexes by offset and size.
+
+A rows file is a sequence of 8 byte aligned blocks. Row group blocks hold the
+rows appended since the previous flush, one contiguous array per column. Every
+flush is followed by a footer block that lists the chunk's row groups and a
+trailer that points at the footer, so readers can open a chunk without scanning
+it. If the writer crashes before writing a footer, readers recover the chunk's
+complete row groups by scanning its blocks and checking their checksums.
+
+The fsync policy sets how much of a run survives a machine crash:
+  "never": Files are left to the OS to write back.
+  "chunk": Chunks are synced when they're finished.
+  "flush": Every flush is synced."""
+
+import json
+import os
+import struct
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Maps column names to their numpy dtype strings and per row shapes.
+Schema = Dict[str, Tuple[str, Tuple[int, ...]]]
+
+FSYNC_POLICIES = ("never", "chunk", "flush")
+
+BLOCK_MAGIC = b"TRJB"
+TRAILER_MAGIC = b"TRJE"
+ROWS_BLOCK = 0
+FOOTER_BLOCK = 1
+# magic, kind, row count, payload size, payload crc32
+BLOCK_HEADER = struct.Struct("<4sB3xIQI4x")
+# footer block offset, magic
+TRAILER = struct.Struct("<Q4s4x")
+
+IMAGE_OFFSET = "_image_offset"
+IMAGE_SIZE = "_image_size"
+IMAGE_COLUMNS: Schema = {IMAGE_OFFSET: ("<u8", ()), IMAGE_SIZE: ("<u4", ())}
+
+
+def _padded(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def _column_size(column: Tuple[str, Tuple[int, ...]], n_rows: int) -> int:
+    dtype, shape = column
+    return np.dtype(dtype).itemsize * int(np.prod(shape, dtype=np.int64)) * n_rows
+
+
+def chunk_paths(directory: str, chunk: int) -> Tuple[str, str]:
+    """Returns the paths of a chunk's rows and blobs files."""
+    base = os.path.join(directory, f"chunk_{chunk:06d}")
+    return base + ".rows", base + ".blobs"
+
+
+def list_chunks(directory: str) -> List[int]:
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        int(f[len("chunk_") : -len(".rows")])
+        for f in os.listdir(directory)
+        if f.startswith("chunk_") and f.endswith(".rows")
+    )
+
+
+def _fsync_dir(directory: str) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class TrajectoryStore:
+    def __init__(
+        self,
+        directory: str,
+        schema: Schema,
+        rows_per_group: int = 256,
+        rows_per_chunk: int = 10000,
+        fsync: str = "chunk",
+        frame_encoder: Optional[Any] = None,
+    ):
+        """Appends to new chunks in directory, after any that already exist.
+
+        Rows are buffered until rows_per_group of them have been appended or
+        flush() is called. If a frame_encoder, like frame_codec.FrameEncoder, is
+        given, images can be appended as arrays that it encodes. It's reset at the
+        start of each chunk so chunks can be decoded on their own."""
+        assert fsync in FSYNC_POLICIES, f"Unknown fsync policy: {fsync}"
+        assert not set(schema) & set(IMAGE_COLUMNS), "Reserved column name"
+        self.directory = directory
+        self.schema: Schema = {
+            name: (np.dtype(dtype).str, tuple(shape))
+            for name, (dtype, shape) in {**schema, **IMAGE_COLUMNS}.items()
+        }
+        self.rows_per_group = rows_per_group
+        self.rows_per_chunk = rows_per_chunk
+        self.fsync = fsync
+        self.frame_encoder = frame_encoder
+        os.makedirs(directory, exist_ok=True)
+
+        self._buffers = {
+            name: np.zeros((rows_per_group, *shape), dtype=dtype)
+            for name, (dtype, shape) in self.schema.items()
+        }
+        self._buffered = 0
+        existing = list_chunks(directory)
+        self._chunk = existing[-1] + 1 if existing else 0
+        self._rows_file = None
+        self._blobs_file = None
+        self._row_groups: List[Tuple[int, int]] = []
+        self._chunk_rows = 0
+        self.n_rows = 0
+
+    def _open_chunk(self) -> None:
+        rows_path, blobs_path = chunk_paths(self.directory, self._chunk)
+        self._rows_file = open(rows_path, "xb")
+        self._blobs_file = open(blobs_path, "xb")
+        self._row_groups = []
+        self._chunk_rows = 0
+        if self.frame_encoder is not None:
+            self.frame_encoder.reset()
+        # An empty footer records the schema for recovery.
+        self._write_footer()
+        if self.fsync != "never":
+            _fsync_dir(self.directory)
+
+    def append(self, record: Dict[str, Any], image: Optional[Any] = None) -> None:
+        """Appends a record and its optional image, given as bytes or as an array
+        for the frame encoder. Missing columns are zero and extra keys are
+        ignored."""
+        if self._rows_file is None:
+            self._open_chunk()
+        if isinstance(image, np.ndarray):
+            image = self.frame_encoder.encode(image)
+        i = self._buffered
+        for name, buffer in self._buffers.items():
+            buffer[i] = record.get(name, 0)
+        if image:
+            self._buffers[IMAGE_OFFSET][i] = self._blobs_file.tell()
+            self._buffers[IMAGE_SIZE][i] = len(image)
+            self._blobs_file.write(image)
+        self._buffered += 1
+        self._chunk_rows += 1
+        self.n_rows += 1
+        if self._chunk_rows >= self.rows_per_chunk:
+            self._close_chunk()
+        elif self._buffered == self.rows_per_group:
+            self.flush()
+
+    def append_many(
+        self, records: Sequence[Dict[str, Any]], images: Sequence[Optional[Any]]
+    ) -> None:
+        """Appends records and their optional images, see append. Each run of rows
+        that fits in the current row group is written with one assignment per
+        column and one write of its images."""
+        assert len(records) == len(images), "Every record needs an image or None"
+        start = 0
+        while start < len(records):
+            if self._rows_file is None:
+                self._open_chunk()
+            n = min(
+                len(records) - start,
+                self.rows_per_chunk - self._chunk_rows,
+                self.rows_per_group - self._buffered,
+            )
+            rows = records[start : start + n]
+            blobs = [
+                (
+                    self.frame_encoder.encode(image)
+                    if isinstance(image, np.ndarray)
+                    else image or b""
+                )
+                for image in images[start : start + n]
+            ]
+            i = self._buffered
+            for name, buffer in self._buffers.items():
+                if name not in IMAGE_COLUMNS:
+                    missing = np.zeros(buffer.shape[1:], buffer.dtype)
+                    buffer[i : i + n] = [record.get(name, missing) for record in rows]
+            sizes = np.array([len(blob) for blob in blobs], dtype=np.int64)
+            offsets = self._blobs_file.tell() + np.cumsum(sizes) - sizes
+            # Rows without an image have a zero offset and size.
+            self._buffers[IMAGE_OFFSET][i : i + n] = np.where(sizes > 0, offsets, 0)
+            self._buffers[IMAGE_SIZE][i : i + n] = sizes
+            self._blobs_file.write(b"".join(blobs))
+
+            self._buffered += n
+            self._chunk_rows += n
+            self.n_rows += n
+            start += n
+            if self._chunk_rows >= self.rows_per_chunk:
+                self._close_chunk()
+            elif self._buffered == self.rows_per_group:
+                self.flush()
+
+    def flush(self) -> None:
+        """Writes the buffered rows as a row group followed by a new footer."""
+        if self._rows_file is None or self._buffered == 0:
+            return
+        n = self._buffered
+        payload = b"".join(
+            buffer[:n].tobytes().ljust(_padded(buffer[:n].nbytes), b"\0")
+            for buffer in self._buffers.values()
+        )
+        self._row_groups.append((self._rows_file.tell(), n))
+        self._write_block(ROWS_BLOCK, n, payload)
+        self._write_footer()
+        self._buffered = 0
+
+        self._blobs_file.flush()
+        self._rows_file.flush()
+        if self.fsync == "flush":
+            # Blobs first, so synced rows never point at unsynced images.
+            os.fsync(self._blobs_file.fileno())
+            os.fsync(self._rows_file.fileno())
+
+    def _write_footer(self) -> None:
+        footer = json.dumps(
+            {
+                "schema": {k: [d, list(s)] for k, (d, s) in self.schema.items()},
+                "row_groups": self._row_groups,
+            }
+        ).encode()
+        footer_offset = self._rows_file.tell()
+        self._write_block(FOOTER_BLOCK, 0, footer.ljust(_padded(len(footer))))
+        self._rows_file.write(TRAILER.pack(footer_offset, TRAILER_MAGIC))
+
+    def _write_block(self, kind: int, n_rows: int, payload: bytes) -> None:
+        self._rows_file.write(
+            BLOCK_HEADER.pack(
+                BLOCK_MAGIC, kind, n_rows, len(payload), zlib.crc32(payload)
+            )
+        )
+        self._rows_file.write(payload)
+
+    def _close_chunk(self) -> None:
+        self.flush()
+        for f in (self._blobs_file, self._rows_file):
+            if self.fsync != "never":
+                os.fsync(f.fileno())
+            f.close()
+        self._rows_file = None
+        self._blobs_file = None
+        self._chunk += 1
+
+    def close(self) -> None:
+        if self._rows_file is not None:
+            self._close_chunk()
+
+    def __enter__(self) -> "TrajectoryStore":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def _read_footer(f, size: int) -> Optional[Dict[str, Any]]:
+    if size < TRAILER.size:
+        return None
+    f.seek(size - TRAILER.size)
+    footer_offset, magic = TRAILER.unpack(f.read(TRAILER.size))
+    if magic != TRAILER_MAGIC or footer_offset + BLOCK_HEADER.size > size:
+        return None
+    f.seek(footer_offset)
+    header = BLOCK_HEADER.unpack(f.read(BLOCK_HEADER.size))
+    block_magic, kind, _, length, crc = header
+    if block_magic != BLOCK_MAGIC or kind != FOOTER_BLOCK:
+        return None
+    payload = f.read(length)
+    if len(payload) != length or zlib.crc32(payload) != crc:
+        return None
+    return json.loads(payload)
+
+
+def _scan(f, size: int) -> Tuple[Optional[Schema], List[Tuple[int, int]]]:
+    """Returns the schema and complete row groups of a chunk that has no valid
+    footer at its end. The schema is None if the chunk's first footer is torn."""
+    schema = None
+    row_groups = []
+    offset = 0
+    while offset + BLOCK_HEADER.size <= size:
+        f.seek(offset)
+        block_magic, kind, n_rows, length, crc = BLOCK_HEADER.unpack(
+            f.read(BLOCK_HEADER.size)
+        )
+        if block_magic != BLOCK_MAGIC:
+            break
+        payload = f.read(length)
+        if len(payload) != length or zlib.crc32(payload) != crc:
+            break
+        if kind == ROWS_BLOCK:
+            row_groups.append((offset, n_rows))
+        else:
+            schema = json.loads(payload)["schema"]
+            length += TRAILER.size
+        offset += BLOCK_HEADER.size + length
+    return schema, row_groups
+
+
+class ChunkReader:
+    def __init__(self, directory: str, chunk: int):
+        self.rows_path, self.blobs_path = chunk_paths(directory, chunk)
+        size = os.path.getsize(self.rows_path)
+        with open(self.rows_path, "rb") as f:
+            footer = _read_footer(f, size)
+            if footer is not None:
+                schema = footer["schema"]
+                row_groups = footer["row_groups"]
+            else:
+                schema, row_groups = _scan(f, size)
+        if schema is None:
+            schema, row_groups = {}, []
+        self.schema: Schema = {k: (d, tuple(s)) for k, (d, s) in schema.items()}
+        self.row_groups: List[Tuple[int, int]] = [tuple(g) for g in row_groups]
+        self.n_rows = sum(n for _, n in self.row_groups)
+        self._mmap = None
+        self._image_index: Optional[Dict[str, np.ndarray]] = None
+        self._blobs = None
+
+    def _map(self) -> np.memmap:
+        if self._mmap is None:
+            self._mmap = np.memmap(self.rows_path, dtype=np.uint8, mode="r")
+        return self._mmap
+
+    def columns(self, names: Optional[Sequence[str]] = None) -> Dict[str, np.ndarray]:
+        """Returns the chunk's values of the given columns, by default all of them.
+
+        Columns of chunks with a single row group are views of the mapped file."""
+        if names is None:
+            names = list(self.schema)
+        data = self._map() if self.row_groups else None
+        parts: Dict[str, List[np.ndarray]] = {name: [] for name in names}
+        for offset, n_rows in self.row_groups:
+            pos = offset + BLOCK_HEADER.size
+            for name, (dtype, shape) in self.schema.items():
+                size = _column_size((dtype, shape), n_rows)
+                if name in parts:
+                    parts[name].append(
+                        data[pos : pos + size].view(dtype).reshape((n_rows, *shape))
+                    )
+                pos += _padded(size)
+        columns = {}
+        for name in names:
+            dtype, shape = self.schema[name]
+            if len(parts[name]) == 1:
+                columns[name] = parts[name][0]
+            elif parts[name]:
+                columns[name] = np.concatenate(parts[name])
+            else:
+                columns[name] = np.zeros((0, *shape), dtype=dtype)
+        return columns
+
+    def image(self, row: int) -> Optional[bytes]:
+        """Returns the row's image or None if it doesn't have one."""
+        if self._image_index is None:
+            self._image_index = self.columns([IMAGE_OFFSET, IMAGE_SIZE])
+        size = int(self._image_index[IMAGE_SIZE][row])
+        if size == 0:
+            return None
+        if self._blobs is None:
+            self._blobs = open(self.blobs_path, "rb")
+        self._blobs.seek(int(self._image_index[IMAGE_OFFSET][row]))
+        return self._blobs.read(size)
+
+    def close(self) -> None:
+        self._mmap = None
+        self._image_index = None
+        if self._blobs is not None:
+            self._blobs.close()
+            self._blobs = None
@@ -0,0 +1,87 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from bounce_rl.trajectories import store
+
+SCHEMA = {"action": ("f4", (3,)), "reward": ("f4", ()), "biome": ("S8", ())}
+
+
+def _record(i: int) -> dict:
+    return {"action": [i, i + 1, i + 2], "reward": i / 2, "biome": b"mines"}
+
+
+class TestTrajectoryStore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = self.dir.name
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_round_trip_across_chunks_and_row_groups(self):
+        with store.TrajectoryStore(
+            self.path, SCHEMA, rows_per_group=3, rows_per_chunk=7, fsync="flush"
+        ) as s:
+            for i in range(10):
+                s.append(_record(i), image=b"img%d" % i if i % 2 else None)
+        self.assertEqual(store.list_chunks(self.path), [0, 1])
+
+        reader = store.ChunkReader(self.path, 0)
+        self.assertEqual(reader.n_rows, 7)
+        self.assertEqual([n for _, n in reader.row_groups], [3, 3, 1])
+        columns = reader.columns()
+        np.testing.assert_array_equal(columns["action"][:, 0], np.arange(7))
+        np.testing.assert_array_equal(columns["reward"], np.arange(7) / 2)
+        self.assertEqual(columns["biome"][6], b"mines")
+        self.assertEqual(reader.image(5), b"img5")
+        self.assertIsNone(reader.image(4))
+        reader.close()
+
+        self.assertEqual(store.ChunkReader(self.path, 1).n_rows, 3)
+
+    def test_append_many_matches_per_row_appends(self):
+        images = [b"img%d" % i if i % 3 else None for i in range(10)]
+        with store.TrajectoryStore(
+            self.path + "/many", SCHEMA, rows_per_group=3, rows_per_chunk=7
+        ) as s:
+            s.append(_record(0), images[0])
+            s.append_many([_record(i) for i in range(1, 10)], images[1:])
+        with store.TrajectoryStore(
+            self.path + "/single", SCHEMA, rows_per_group=3, rows_per_chunk=7
+        ) as s:
+            for i in range(10):
+                s.append(_record(i), images[i])
+
+        for chunk in (0, 1):
+            many = store.ChunkReader(self.path + "/many", chunk)
+            single = store.ChunkReader(self.path + "/single", chunk)
+            self.assertEqual(many.row_groups, single.row_groups)
+            for name, column in single.columns().items():
+                np.testing.assert_array_equal(many.columns()[name], column)
+            for row in range(single.n_rows):
+                self.assertEqual(many.image(row), single.image(row))
+            many.close()
+            single.close()
+
+    def test_torn_write_keeps_complete_row_groups(self):
+        s = store.TrajectoryStore(self.path, SCHEMA, rows_per_group=2)
+        for i in range(5):
+            s.append(_record(i))
+        s.flush()
+        last_group_offset = s._row_groups[-1][0]
+        rows_path, _ = store.chunk_paths(self.path, 0)
+        # Tear the last row group's rows and footer.
+        with open(rows_path, "r+b") as f:
+            f.truncate(last_group_offset + 40)
+
+        reader = store.ChunkReader(self.path, 0)
+        self.assertEqual(reader.n_rows, 4)
+        np.testing.assert_array_equal(
+            reader.columns(["reward"])["reward"], [0, 0.5, 1, 1.5]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+"""Moves trajectory logging off the env's step path.
+
+Items are handed to a writer thread through a bounded queue. When the queue is
+full, which only happens when the disk can't keep up, the "block" overflow policy
+stalls the caller and the "drop" policy discards the item."""
+
+import queue
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from bounce_rl.trajectories.store import TrajectoryStore
+
+OVERFLOW_POLICIES = ("block", "drop")
+
+_STOP = object()
+
+
+class BoundedWorker:
+    def __init__(
+        self,
+        handle: Callable[[List[Any]], None],
+        max_queued: int = 64,
+        overflow: str = "block",
+        batch_size: int = 8,
+        name: str = "bounded-worker",
+    ):
+        """Calls handle from a worker thread with batches of up to batch_size
+        queued items. An exception raised by handle is re-raised by the next call
+        to put, join or close, and items queued after it are discarded."""
+        assert overflow in OVERFLOW_POLICIES, f"Unknown overflow policy: {overflow}"
+        self.handle = handle
+        self.overflow = overflow
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(max_queued)
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def put(self, item: Any) -> bool:
+        """Queues item and returns whether it was queued rather than dropped."""
+        self._raise_error()
+        if self.overflow == "block":
+            self._queue.put(item)
+            return True
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def join(self) -> None:
+        """Waits until every queued item has been handled."""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self) -> None:
+        """Handles the queued items and stops the worker."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self._raise_error()
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batch[-1] is _STOP
+            items = batch[:-1] if stop else batch
+            try:
+                if items and self._error is None:
+                    self.handle(items)
+            except BaseException as e:
+                self._error = e
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+
+class AsyncTrajectoryWriter:
+    def __init__(
+        self,
+        store: TrajectoryStore,
+        encode: Optional[Callable[[np.ndarray], bytes]] = None,
+        max_queued: int = 64,
+        overflow: str = "block",
+        batch_size: int = 8,
+    ):
+        """Appends records and their encoded pixels to store from a writer thread.
+
+        The writer keeps references to appended records and pixels, so callers
+        mustn't modify them afterwards."""
+        self.store = store
+        self.encode = encode
+        self._worker = BoundedWorker(
+            self._write, max_queued, overflow, batch_size, name="trajectory-writer"
+        )
+
+    @property
+    def queue_depth(self) -> int:
+        return self._worker.queue_depth
+
+    @property
+    def dropped(self) -> int:
+        return self._worker.dropped
+
+    def append(self, record: Dict[str, Any], pixels: Optional[Any] = None) -> bool:
+        """Queues a record and returns whether it was queued rather than dropped.
+        Pixels are passed to encode, or stored as is if there's no encode."""
+        return self._worker.put((record, pixels))
+
+    def _write(self, batch: List[Any]) -> None:
+        # Pixels are encoded one frame at a time, then the whole batch is appended
+        # in one call, see TrajectoryStore.append_many.
+        records = [record for record, _ in batch]
+        images = [
+            self.encode(pixels) if pixels is not None and self.encode else pixels
+            for _, pixels in batch
+        ]
+        self.store.append_many(records, images)
+
+    def flush(self) -> None:
+        """Writes every queued record through to the store's files."""
+        self._worker.join()
+        self.store.flush()
+
+    def close(self) -> None:
+        try:
+            self._worker.close()
+        finally:
+            self.store.close()
+
+    def __enter__(self) -> "AsyncTrajectoryWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
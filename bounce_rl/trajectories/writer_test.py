@@ -0,0 +1,59 @@
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from bounce_rl.trajectories import store, writer
+
+
+class TestBoundedWorker(unittest.TestCase):
+    def test_drop_policy_drops_when_full(self):
+        release = threading.Event()
+        handled = []
+
+        def handle(batch):
+            release.wait()
+            handled.extend(batch)
+
+        worker = writer.BoundedWorker(
+            handle, max_queued=2, overflow="drop", batch_size=1
+        )
+        queued = [worker.put(i) for i in range(6)]
+        # The worker holds one item while it waits, two more fit in the queue.
+        self.assertEqual(queued.count(False), worker.dropped)
+        self.assertGreaterEqual(worker.dropped, 3)
+        release.set()
+        worker.close()
+        self.assertEqual(handled, [i for i, q in enumerate(queued) if q])
+
+    def test_errors_are_raised_to_the_caller(self):
+        def handle(batch):
+            raise ValueError("disk full")
+
+        worker = writer.BoundedWorker(handle)
+        worker.put(0)
+        with self.assertRaises(ValueError):
+            worker.join()
+        worker.close()
+
+
+class TestAsyncTrajectoryWriter(unittest.TestCase):
+    def test_records_are_encoded_and_written_on_close(self):
+        with tempfile.TemporaryDirectory() as path:
+            schema = {"reward": ("f4", ())}
+            with writer.AsyncTrajectoryWriter(
+                store.TrajectoryStore(path, schema), encode=np.ndarray.tobytes
+            ) as w:
+                for i in range(20):
+                    pixels = np.full(4, i, np.uint8) if i % 2 else None
+                    w.append({"reward": i}, pixels)
+
+            reader = store.ChunkReader(path, 0)
+            self.assertEqual(reader.n_rows, 20)
+            self.assertEqual(reader.image(3), bytes([3] * 4))
+            self.assertIsNone(reader.image(2))
+
+
+if __name__ == "__main__":
+    unittest.main()
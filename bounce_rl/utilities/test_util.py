@@ -1,5 +1,5 @@
 import unittest
-from util import GrowingCircularFIFOArray, LinearInterpolator
+from util import GrowingCircularFIFOArray, LinearInterpolator, WindowedStats
 from numpy import testing as npt
 
 class TestLinearInterpolator(unittest.TestCase):
@@ -39,5 +39,36 @@ class TestGrowingCircularFIFOArray(unittest.TestCase):
         buf.push(1, 10)
         self.assertRaises(AssertionError, buf.push, 2, 9)
 
+class TestWindowedStats(unittest.TestCase):
+    def test_sliding_window(self):
+        stats = WindowedStats(3)
+        for x in [5, 0, 2, 7]:
+            stats.push(x)
+        npt.assert_allclose(stats.values(), [0, 2, 7])
+        self.assertEqual(stats.sum(), 9)
+        self.assertEqual(stats.count_nonzero(), 2)
+        self.assertEqual(stats.mean(), 3)
+        self.assertEqual(stats.min(), 0)
+        self.assertEqual(stats.max(), 7)
+
+    def test_growing_window(self):
+        stats = WindowedStats(10, window=2)
+        for x in [4, 1, 3]:
+            stats.push(x)
+        self.assertEqual(stats.min(), 1)
+        stats.push(2, 4)
+        npt.assert_allclose(stats.values(), [4, 1, 3, 2])
+        self.assertEqual(stats.max(), 4)
+        self.assertEqual(stats.sum(), 10)
+
+    def test_shrinking_window(self):
+        stats = WindowedStats(10)
+        for x in [9, 0, 0, 1]:
+            stats.push(x)
+        stats.resize(2)
+        npt.assert_allclose(stats.values(), [0, 1])
+        self.assertEqual(stats.max(), 1)
+        self.assertEqual(stats.count_nonzero(), 1)
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
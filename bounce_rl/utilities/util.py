@@ -1,5 +1,6 @@
 import json
-from typing import Any
+from collections import deque
+from typing import Any, Optional
 
 import numpy as np
 
@@ -47,6 +48,109 @@ class GrowingCircularFIFOArray:
         self.max_requested_size = requested_size
 
 
+class WindowedStats:
+    """Statistics of the last window values pushed. The window size may change
+    between pushes, up to max_size.
+
+    Pushes and queries are O(1). Min and max are amortized over pushes, and
+    changing the window size by n costs O(n)."""
+
+    def __init__(self, max_size: int, window: Optional[int] = None):
+        self.max_size = max_size
+        self.window = max_size if window is None else window
+        assert 0 < self.window <= max_size
+        self._values = [0.0] * max_size
+        # The number of values ever pushed, and the number in the window.
+        self._n_pushed = 0
+        self._n = 0
+        self._sum = 0.0
+        self._nonzero = 0
+        # Indices of candidate minimums and maximums, oldest first. Their values
+        # increase for minimums and decrease for maximums.
+        self._mins: deque = deque()
+        self._maxes: deque = deque()
+
+    def __len__(self) -> int:
+        return self._n
+
+    def _value(self, index: int) -> float:
+        return self._values[index % self.max_size]
+
+    def _add_oldest(self, index: int) -> None:
+        x = self._value(index)
+        self._sum += x
+        self._nonzero += x != 0
+        # An older value only matters if it's beyond every newer value.
+        if not self._mins or x < self._value(self._mins[0]):
+            self._mins.appendleft(index)
+        if not self._maxes or x > self._value(self._maxes[0]):
+            self._maxes.appendleft(index)
+
+    def _remove_oldest(self, index: int) -> None:
+        x = self._value(index)
+        self._sum -= x
+        self._nonzero -= x != 0
+        for candidates in (self._mins, self._maxes):
+            if candidates and candidates[0] == index:
+                candidates.popleft()
+
+    def resize(self, window: int) -> None:
+        assert 0 < window <= self.max_size
+        self.window = window
+        available = min(window, self._n_pushed)
+        while self._n < available:
+            self._n += 1
+            self._add_oldest(self._n_pushed - self._n)
+        while self._n > window:
+            self._remove_oldest(self._n_pushed - self._n)
+            self._n -= 1
+
+    def push(self, x: float, window: Optional[int] = None) -> None:
+        """Pushes x, first resizing the window if a size is given."""
+        if window is not None and window != self.window:
+            self.resize(window)
+        if self._n == self.window:
+            self._remove_oldest(self._n_pushed - self._n)
+            self._n -= 1
+
+        index = self._n_pushed
+        self._values[index % self.max_size] = x
+        self._n_pushed += 1
+        self._n += 1
+        self._sum += x
+        self._nonzero += x != 0
+        while self._mins and self._value(self._mins[-1]) >= x:
+            self._mins.pop()
+        self._mins.append(index)
+        while self._maxes and self._value(self._maxes[-1]) <= x:
+            self._maxes.pop()
+        self._maxes.append(index)
+
+        # Recompute the running sum now and then so float error can't build up.
+        if self._n_pushed % self.max_size == 0:
+            self._sum = float(sum(self.values()))
+
+    def values(self) -> np.ndarray:
+        """Returns the values in the window, oldest first."""
+        start = self._n_pushed - self._n
+        return np.array([self._value(i) for i in range(start, self._n_pushed)])
+
+    def sum(self) -> float:
+        return self._sum
+
+    def count_nonzero(self) -> int:
+        return self._nonzero
+
+    def mean(self) -> float:
+        return self._sum / self._n if self._n else float("nan")
+
+    def min(self) -> float:
+        return self._value(self._mins[0]) if self._mins else float("nan")
+
+    def max(self) -> float:
+        return self._value(self._maxes[0]) if self._maxes else float("nan")
+
+
 def LoadJSON(filename):
     with open(filename) as f:
         loaded = json.load(f)
@@ -0,0 +1,154 @@
+"""X11 message framing for the proxy's streams.
+
+The framers walk runs of messages that have no registered handler so that Python
+only sees the messages it needs to handle. The native implementation in
+native_framer.pyx is used when it's built, this module's pure Python classes
+otherwise. Both assume little endian connections, which the request stream
+asserts at setup.
+
+Serial numbers are 16 bits, so each connection records the opcode of every
+in-flight request in a fixed 64K table. 0 isn't a valid major opcode and marks an
+unknown request."""
+
+import array
+import struct
+from typing import Iterable, Optional, Tuple
+
+GENERIC_EVENT_CODE = 35
+# The only message without a sequence number.
+KEYMAP_NOTIFY_CODE = 11
+N_SERIALS = 2**16
+
+
+def request_code_table() -> bytearray:
+    return bytearray(N_SERIALS)
+
+
+def histogram() -> array.array:
+    """Returns a zeroed 256 bin array of message counts."""
+    return array.array("Q", bytes(8 * 256))
+
+
+def handled_mask(codes: Iterable[int]) -> bytearray:
+    """Returns a 256 byte lookup table with a 1 at each of the given codes."""
+    mask = bytearray(256)
+    for code in codes:
+        mask[code] = 1
+    return mask
+
+
+class RequestFramer:
+    def __init__(self, request_codes: bytearray, handled: bytearray, serial: int):
+        self.request_codes = request_codes
+        self.handled = handled
+        self.serial = serial
+        # Requests seen, by opcode.
+        self.counts = histogram()
+
+    def frame(
+        self, buffer: bytearray, pos: int, filled: int
+    ) -> Optional[Tuple[int, int]]:
+        """Returns the length and opcode of the request at pos or None if its header
+        is incomplete."""
+        if filled - pos < 4:
+            return None
+        opcode, request_len = struct.unpack_from("<BxH", buffer, pos)
+        if request_len == 0:
+            # Big request protocol request
+            if filled - pos < 8:
+                return None
+            request_len = struct.unpack_from("<I", buffer, pos + 4)[0]
+        return max(4, 4 * request_len), opcode
+
+    def record(self, opcode: int) -> None:
+        self.counts[opcode] += 1
+        self.request_codes[self.serial] = opcode
+        self.serial = (self.serial + 1) % N_SERIALS
+
+    def scan(self, buffer: bytearray, pos: int, filled: int) -> Tuple[int, int]:
+        """Records and skips the unhandled requests starting at pos.
+
+        Returns the position of the first request that needs Python and the number
+        of bytes of the last request that haven't been received yet."""
+        while True:
+            frame = self.frame(buffer, pos, filled)
+            if frame is None or self.handled[frame[1]]:
+                return pos, 0
+            msg_len, opcode = frame
+            self.record(opcode)
+            pos += msg_len
+            if pos > filled:
+                return filled, pos - filled
+
+
+class ReplyFramer:
+    def __init__(
+        self,
+        request_codes: bytearray,
+        handled_replies: bytearray,
+        handled_events: bytearray,
+    ):
+        self.request_codes = request_codes
+        self.handled_replies = handled_replies
+        self.handled_events = handled_events
+        # Messages seen, by code without the send event bit. Errors are counted
+        # under 0 and replies under 1.
+        self.counts = histogram()
+        # The sequence number of the last message seen, which is that of the last
+        # request the server processed.
+        self.sequence = 0
+
+    def frame(
+        self, buffer: bytearray, pos: int, filled: int
+    ) -> Optional[Tuple[int, int, int]]:
+        """Returns the length, code and handler key of the message at pos or None if
+        its header is incomplete. The key is the request's opcode for replies and
+        the event code without the send event bit for events."""
+        if filled - pos < 8:
+            return None
+        code, sequence_num, extra_length = struct.unpack_from("<BxHI", buffer, pos)
+        if code == 1:
+            return 32 + 4 * extra_length, code, self.request_codes[sequence_num]
+        key = code & 0x7F
+        if key != GENERIC_EVENT_CODE:
+            extra_length = 0
+        return 32 + 4 * extra_length, code, key
+
+    def record(self, code: int, sequence_num: int) -> None:
+        self.counts[code & 0x7F] += 1
+        if code & 0x7F != KEYMAP_NOTIFY_CODE:
+            self.sequence = sequence_num
+
+    def scan(self, buffer: bytearray, pos: int, filled: int) -> Tuple[int, int]:
+        """Skips the unhandled replies and events starting at pos, unsetting the
+        events' send event bits. Errors are left to Python.
+
+        Returns the position of the first message that needs Python and the number
+        of bytes of the last message that haven't been received yet."""
+        while True:
+            frame = self.frame(buffer, pos, filled)
+            if frame is None:
+                return pos, 0
+            msg_len, code, key = frame
+            if code == 0:
+                return pos, 0
+            if code == 1:
+                if self.handled_replies[key]:
+                    return pos, 0
+            else:
+                if self.handled_events[key]:
+                    return pos, 0
+                buffer[pos] = key
+            self.record(code, struct.unpack_from("<H", buffer, pos + 2)[0])
+            pos += msg_len
+            if pos > filled:
+                return filled, pos - filled
+
+
+try:
+    from bounce_rl.x_proxy.native_framer import (  # noqa: F811
+        ReplyFramer,
+        RequestFramer,
+    )
+except ImportError:
+    pass
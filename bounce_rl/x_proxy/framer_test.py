@@ -0,0 +1,75 @@
+import struct
+import unittest
+
+from bounce_rl.x_proxy import framer
+
+try:
+    from bounce_rl.x_proxy import native_framer
+except ImportError:
+    native_framer = None
+
+NO_OPERATION = 127
+
+
+def _requests() -> bytearray:
+    data = bytearray()
+    for n_words in (1, 3, 2**16 + 5):
+        if n_words < 2**16:
+            data += struct.pack("<BxH", NO_OPERATION, n_words) + bytes(4 * n_words - 4)
+        else:
+            data += struct.pack("<BxHI", NO_OPERATION, 0, n_words)
+            data += bytes(4 * n_words - 8)
+    return data
+
+
+def _replies() -> bytearray:
+    data = bytearray()
+    data += struct.pack("<BBHI", 1, 0, 1, 2) + bytes(32)
+    data += struct.pack("<BBH", 0x80 | 12, 0, 2) + bytes(28)
+    data += struct.pack("<BBHI", 35, 131, 3, 1) + bytes(28)
+    data += struct.pack("<BBH", 0, 3, 4) + bytes(28)
+    return data
+
+
+class TestPythonFramer(unittest.TestCase):
+    module = framer
+
+    def test_request_scan_stops_at_handled_and_partial_requests(self):
+        codes = framer.request_code_table()
+        handled = framer.handled_mask([1])
+        request_framer = self.module.RequestFramer(codes, handled, 1)
+        data = _requests() + struct.pack("<BxH", 1, 1)
+
+        self.assertEqual(request_framer.scan(data, 0, 16), (16, 0))
+        self.assertEqual(request_framer.scan(data, 16, 24), (24, 4 * 2**16 + 12))
+        self.assertEqual(
+            request_framer.scan(data, len(data) - 4, len(data)), (len(data) - 4, 0)
+        )
+        self.assertEqual(request_framer.serial, 4)
+        self.assertEqual(list(codes[1:5]), [NO_OPERATION] * 3 + [0])
+
+    def test_reply_scan_unsets_send_event_bit_and_stops_at_errors(self):
+        codes = framer.request_code_table()
+        codes[1] = NO_OPERATION
+        reply_framer = self.module.ReplyFramer(
+            codes, framer.handled_mask([]), framer.handled_mask([])
+        )
+        data = _replies()
+
+        self.assertEqual(reply_framer.scan(data, 0, len(data)), (108, 0))
+        self.assertEqual(data[40], 12)
+        self.assertEqual(reply_framer.sequence, 3)
+        self.assertEqual(reply_framer.frame(data, 108, len(data)), (32, 0, 0))
+        self.assertEqual(reply_framer.scan(data, 0, 50), (50, 22))
+
+        reply_framer.handled_events[35] = 1
+        self.assertEqual(reply_framer.scan(data, 0, len(data)), (72, 0))
+
+
+@unittest.skipIf(native_framer is None, "native_framer isn't built")
+class TestNativeFramer(TestPythonFramer):
+    module = native_framer
+
+
+if __name__ == "__main__":
+    unittest.main()
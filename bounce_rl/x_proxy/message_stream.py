@@ -0,0 +1,169 @@
+import collections
+import socket
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from bounce_rl.x_proxy.output_queue import OutputQueue
+
+RECV_BUFFER_SIZE = 2**19
+ANC_BUFFER_SIZE = 10000
+
+Handler = Callable[[memoryview], Optional[bytes]]
+
+
+class StreamStats:
+    """Counters for one direction of a connection. Message counts are kept by the
+    stream's framer."""
+
+    __slots__ = ("bytes", "counts", "handler_calls", "handler_seconds")
+
+    def __init__(self):
+        self.bytes = 0
+        self.counts: Sequence[int] = ()
+        self.handler_calls: Dict[str, int] = collections.defaultdict(int)
+        self.handler_seconds: Dict[str, float] = collections.defaultdict(float)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "bytes": self.bytes,
+            "messages": sum(self.counts),
+            "codes": {str(c): n for c, n in enumerate(self.counts) if n > 0},
+            "handlers": {
+                name: {"calls": calls, "seconds": self.handler_seconds[name]}
+                for name, calls in self.handler_calls.items()
+            },
+        }
+
+
+class MessageStream:
+    """Frames an X11 byte stream in place and forwards it to an output queue.
+
+    Bytes are received straight into a preallocated buffer. Messages without a
+    handler are forwarded as memoryviews into that buffer, including messages whose
+    tail hasn't arrived yet. Only messages with a handler are held until they're
+    complete. A handler may edit its message in place or return replacement bytes,
+    b"" drops the message.
+
+    Subclasses implement the framing."""
+
+    def __init__(self, output: OutputQueue, buffer_size: int = RECV_BUFFER_SIZE):
+        self.output = output
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        # Number of valid bytes at the start of the buffer.
+        self.filled = 0
+        # Bytes of a partially forwarded message that are still to come.
+        self.passthrough = 0
+        self.connected = False
+        self.stats = StreamStats()
+        # Injected messages waiting for the end of a partially forwarded message.
+        self._injected: List[bytes] = []
+
+    def _frame(self, pos: int) -> Optional[Tuple[int, Optional[Handler]]]:
+        """Returns the length and handler of the message at pos or None if its
+        header is incomplete. Must not have side effects."""
+        raise NotImplementedError
+
+    def _on_message(self, pos: int) -> None:
+        """Called exactly once per message, before it is handled or forwarded."""
+        raise NotImplementedError
+
+    def _scan(self, pos: int) -> Tuple[int, int]:
+        """Skips the run of messages at pos that have no handler, doing their
+        _on_message work. Returns the position of the first message that wasn't
+        skipped and the number of bytes of the last skipped message that haven't
+        been received yet."""
+        return pos, 0
+
+    def recv(self, sock: socket.socket) -> int:
+        """Reads from the socket and forwards what it can. Returns the number of bytes
+        read, 0 on EOF."""
+        nbytes, anc_data, _, _ = sock.recvmsg_into(
+            [self.view[self.filled :]], ANC_BUFFER_SIZE
+        )
+        if nbytes > 0:
+            self.stats.bytes += nbytes
+            self.filled += nbytes
+            self._process(anc_data)
+        return nbytes
+
+    def consume(self, data: Sequence, anc_data: Sequence = ()) -> None:
+        """Copies already received bytes into the stream and forwards what it can."""
+        data = memoryview(data)
+        self.stats.bytes += len(data)
+        while len(data) > 0:
+            n = min(len(data), len(self.buffer) - self.filled)
+            self.buffer[self.filled : self.filled + n] = data[:n]
+            self.filled += n
+            data = data[n:]
+            self._process(anc_data)
+            anc_data = ()
+
+    def inject(self, message: bytes) -> None:
+        """Forwards a message the peer didn't send at the next message boundary."""
+        if self.passthrough == 0:
+            self.output.write([message])
+        else:
+            self._injected.append(message)
+
+    def _grow(self, size: int) -> None:
+        buffer = bytearray(size)
+        buffer[: self.filled] = self.view[: self.filled]
+        self.buffer = buffer
+        self.view = memoryview(buffer)
+
+    def _process(self, anc_data: Sequence) -> None:
+        segments: List = []
+        segment_start = 0
+        pos = min(self.passthrough, self.filled)
+        self.passthrough -= pos
+        if self.passthrough == 0 and self._injected:
+            segments.append(self.view[:pos])
+            segments.extend(self._injected)
+            self._injected = []
+            segment_start = pos
+
+        while self.passthrough == 0:
+            pos, self.passthrough = self._scan(pos)
+            if self.passthrough > 0:
+                break
+            frame = self._frame(pos)
+            if frame is None:
+                break
+            msg_len, handler = frame
+            end = pos + msg_len
+
+            if handler is None:
+                self._on_message(pos)
+                if end > self.filled:
+                    self.passthrough = end - self.filled
+                    end = self.filled
+                pos = end
+                continue
+
+            if end > self.filled:
+                if msg_len > len(self.buffer):
+                    self._grow(2 * msg_len)
+                break
+
+            self._on_message(pos)
+            start = time.perf_counter()
+            new_msg = handler(self.view[pos:end])
+            self.stats.handler_seconds[handler.__name__] += time.perf_counter() - start
+            self.stats.handler_calls[handler.__name__] += 1
+            if new_msg is not None:
+                segments.append(self.view[segment_start:pos])
+                segments.append(new_msg)
+                segment_start = end
+            pos = end
+
+        segments.append(self.view[segment_start:pos])
+        self.output.write(segments, anc_data)
+
+        # Move the incomplete tail to the front of the buffer.
+        leftover = self.filled - pos
+        if leftover > 0 and pos > 0:
+            self.buffer[:leftover] = bytes(self.view[pos : self.filled])
+        self.filled = leftover
+        if self.filled == len(self.buffer):
+            self._grow(2 * len(self.buffer))
@@ -0,0 +1,176 @@
+import socket
+import struct
+import unittest
+
+from bounce_rl.x_proxy import framer, x_overrides
+from bounce_rl.x_proxy.output_queue import OutputQueue
+from bounce_rl.x_proxy.reply_connection import ReplyStream
+from bounce_rl.x_proxy.request_connection import RequestStream
+
+NO_OPERATION = 127
+CLIENT_SETUP = struct.pack("BxHHHHxx", ord("l"), 11, 0, 0, 0)
+SERVER_SETUP = struct.pack("BxHHH", 1, 11, 0, 1) + bytes(4)
+
+
+def _no_operation(n_words: int) -> bytes:
+    return struct.pack("BxH", NO_OPERATION, n_words) + bytes(4 * (n_words - 1))
+
+
+def _big_no_operation(n_words: int) -> bytes:
+    return struct.pack("BxHI", NO_OPERATION, 0, n_words) + bytes(4 * (n_words - 2))
+
+
+def _create_window(value_mask: int, values) -> bytes:
+    n_words = 8 + len(values)
+    header = struct.pack(
+        "BBHIIhhHHHHII", 1, 24, n_words, 1, 2, 0, 0, 1, 1, 0, 0, 0, value_mask
+    )
+    return header + b"".join(struct.pack("I", v) for v in values)
+
+
+def _event(code: int) -> bytes:
+    return struct.pack("BBH", code, 0, 7) + bytes(28)
+
+
+def _reply(sequence_num: int, extra_words: int = 0) -> bytes:
+    return struct.pack("BBHI", 1, 0, sequence_num, extra_words) + bytes(
+        24 + 4 * extra_words
+    )
+
+
+# The reply to request 2, a QueryPointer, with the pointer at (5, 5) on the root
+# and (2, 2) in the window.
+QUERY_POINTER_REPLY = struct.pack("BBHIIIhhhhH", 1, 1, 2, 0, 1, 0, 5, 5, 2, 2, 0)
+QUERY_POINTER_REPLY += bytes(32 - len(QUERY_POINTER_REPLY))
+
+
+class StreamTestCase(unittest.TestCase):
+    def setUp(self):
+        self.out_sock, self.peer_sock = socket.socketpair(
+            socket.AF_UNIX, socket.SOCK_STREAM
+        )
+        self.out_sock.setblocking(False)
+        self.peer_sock.setblocking(False)
+        self.output = OutputQueue(self.out_sock)
+
+    def tearDown(self):
+        self.out_sock.close()
+        self.peer_sock.close()
+
+    def forwarded(self) -> bytes:
+        self.output.flush()
+        try:
+            return self.peer_sock.recv(2**20)
+        except BlockingIOError:
+            return b""
+
+
+class TestRequestStream(StreamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.stream = RequestStream(self.output, conn_id=0)
+
+    def test_unhandled_requests_are_forwarded_unchanged(self):
+        data = CLIENT_SETUP + _no_operation(1) + _no_operation(3) + _big_no_operation(4)
+        self.stream.consume(data)
+        self.assertEqual(self.forwarded(), data)
+        # X numbers requests from 1.
+        self.assertEqual(list(self.stream.request_codes[1:5]), [NO_OPERATION] * 3 + [0])
+
+    def test_incomplete_header_is_held(self):
+        self.stream.consume(CLIENT_SETUP + _no_operation(1)[:2])
+        self.assertEqual(self.forwarded(), CLIENT_SETUP)
+        self.stream.consume(_no_operation(1)[2:])
+        self.assertEqual(self.forwarded(), _no_operation(1))
+
+    def test_unhandled_request_streams_through_before_complete(self):
+        request = _big_no_operation(2**16)
+        self.stream.consume(CLIENT_SETUP + request[:1000])
+        self.assertEqual(self.forwarded(), CLIENT_SETUP + request[:1000])
+        self.stream.consume(request[1000:] + _no_operation(1))
+
+        received = b""
+        while len(received) < len(request) - 1000 + 4:
+            received += self.forwarded()
+        self.assertEqual(received, request[1000:] + _no_operation(1))
+        self.assertEqual(self.stream.serial, 3)
+
+    def test_handled_request_is_rewritten(self):
+        request = _create_window(0x00000002, [5])
+        self.stream.consume(CLIENT_SETUP + _no_operation(1) + request[:10])
+        self.assertEqual(self.forwarded(), CLIENT_SETUP + _no_operation(1))
+        self.stream.consume(request[10:] + _no_operation(1))
+
+        expected = x_overrides.HandleCreateWindowRequest(memoryview(bytearray(request)))
+        self.assertEqual(self.forwarded(), bytes(expected) + _no_operation(1))
+
+
+class TestReplyStream(StreamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.request_codes = framer.request_code_table()
+        self.stream = ReplyStream(self.output, self.request_codes, conn_id=0)
+
+    def test_replies_and_events_are_forwarded(self):
+        self.request_codes[1] = NO_OPERATION
+        data = SERVER_SETUP + _reply(1, extra_words=3) + _event(12)
+        self.stream.consume(data)
+        self.assertEqual(self.forwarded(), data)
+
+    def test_sequence_is_the_last_seen(self):
+        self.request_codes[1] = NO_OPERATION
+        self.stream.consume(SERVER_SETUP + _reply(1))
+        self.assertEqual(self.stream.sequence, 1)
+        # Events handled in Python count too, and KeymapNotify has no sequence.
+        self.stream.event_handlers = {12: lambda event: None}
+        self.stream.consume(_event(12) + struct.pack("B", 11) + bytes(31))
+        self.assertEqual(self.stream.sequence, 7)
+
+    def test_send_event_bit_is_unset(self):
+        self.stream.consume(SERVER_SETUP + _event(12) + _event(0x80 | 12))
+        self.assertEqual(self.forwarded(), SERVER_SETUP + _event(12) + _event(12))
+
+    def test_injected_event_waits_for_message_boundary(self):
+        self.request_codes[1] = NO_OPERATION
+        reply = _reply(1, extra_words=100)
+        self.stream.consume(SERVER_SETUP + reply[:100])
+        self.stream.inject(_event(2))
+        self.stream.consume(reply[100:])
+        self.assertEqual(self.forwarded(), SERVER_SETUP + reply + _event(2))
+
+    def test_filtered_events_are_dropped(self):
+        self.stream.event_handlers = {12: lambda event: b""}
+        self.stream.consume(SERVER_SETUP + _event(12) + _event(13))
+        self.assertEqual(self.forwarded(), SERVER_SETUP + _event(13))
+
+
+class TestQueryPointerOverride(StreamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.requests = RequestStream(self.output, conn_id=0)
+        self.replies = ReplyStream(self.output, self.requests.request_codes, 0)
+        # GetInputFocus is request 1 and QueryPointer request 2.
+        self.requests.consume(
+            CLIENT_SETUP
+            + struct.pack("BxH", 43, 1)
+            + struct.pack("BxHI", x_overrides.QUERY_POINTER, 2, 1)
+        )
+        self.forwarded()
+
+    def test_replies_are_unchanged_without_a_pointer(self):
+        data = SERVER_SETUP + _reply(1) + QUERY_POINTER_REPLY
+        self.replies.consume(data)
+        self.assertEqual(self.forwarded(), data)
+
+    def test_only_query_pointer_replies_are_rewritten(self):
+        self.replies.set_pointer(10, 20)
+        input_focus = _reply(1)
+        self.replies.consume(SERVER_SETUP + input_focus + QUERY_POINTER_REPLY)
+        forwarded = self.forwarded()[len(SERVER_SETUP) :]
+        self.assertEqual(forwarded[:32], input_focus)
+        # The pointer is 3, 3 from the window's origin on the root.
+        self.assertEqual(struct.unpack_from("hhhh", forwarded, 48), (13, 23, 10, 20))
+
+
+if __name__ == "__main__":
+    unittest.main()
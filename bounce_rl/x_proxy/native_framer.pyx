@@ -0,0 +1,160 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""Native implementation of the framers in framer.py."""
+
+from libc.stdint cimport uint8_t, uint16_t, uint32_t
+from libc.string cimport memcpy
+
+import array
+
+cdef enum:
+    GENERIC_EVENT_CODE = 35
+    KEYMAP_NOTIFY_CODE = 11
+
+
+cdef inline uint16_t _u16(const uint8_t[::1] buffer, Py_ssize_t pos):
+    return buffer[pos] | (buffer[pos + 1] << 8)
+
+
+cdef inline uint32_t _u32(const uint8_t[::1] buffer, Py_ssize_t pos):
+    cdef uint32_t value
+    memcpy(&value, &buffer[pos], 4)
+    return value
+
+
+cdef class RequestFramer:
+    cdef uint8_t[::1] _request_codes
+    cdef uint8_t[::1] _handled
+    cdef unsigned long long[::1] _counts
+    cdef public object request_codes
+    cdef public object handled
+    cdef public uint16_t serial
+    cdef public object counts
+
+    def __init__(self, bytearray request_codes, bytearray handled, int serial):
+        assert len(request_codes) == 2**16 and len(handled) == 256
+        self.request_codes = request_codes
+        self.handled = handled
+        self._request_codes = request_codes
+        self._handled = handled
+        self.serial = serial
+        self.counts = array.array("Q", bytes(8 * 256))
+        self._counts = self.counts
+
+    cdef inline Py_ssize_t _frame(
+        self, const uint8_t[::1] buffer, Py_ssize_t pos, Py_ssize_t filled
+    ):
+        """Returns the request's length or -1 if its header is incomplete."""
+        if filled - pos < 4:
+            return -1
+        cdef Py_ssize_t request_len = _u16(buffer, pos + 2)
+        if request_len == 0:
+            if filled - pos < 8:
+                return -1
+            request_len = _u32(buffer, pos + 4)
+        return max(4, 4 * request_len)
+
+    def frame(self, bytearray buffer, Py_ssize_t pos, Py_ssize_t filled):
+        cdef Py_ssize_t msg_len = self._frame(buffer, pos, filled)
+        if msg_len < 0:
+            return None
+        return msg_len, buffer[pos]
+
+    def record(self, uint8_t opcode):
+        self._counts[opcode] += 1
+        self._request_codes[self.serial] = opcode
+        self.serial += 1
+
+    def scan(self, bytearray buffer, Py_ssize_t pos, Py_ssize_t filled):
+        cdef const uint8_t[::1] view = buffer
+        cdef Py_ssize_t msg_len
+        cdef uint8_t opcode
+        while True:
+            msg_len = self._frame(view, pos, filled)
+            if msg_len < 0:
+                return pos, 0
+            opcode = view[pos]
+            if self._handled[opcode]:
+                return pos, 0
+            self._counts[opcode] += 1
+            self._request_codes[self.serial] = opcode
+            self.serial += 1
+            pos += msg_len
+            if pos > filled:
+                return filled, pos - filled
+
+
+cdef class ReplyFramer:
+    cdef uint8_t[::1] _request_codes
+    cdef uint8_t[::1] _handled_replies
+    cdef uint8_t[::1] _handled_events
+    cdef unsigned long long[::1] _counts
+    cdef public object request_codes
+    cdef public object handled_replies
+    cdef public object handled_events
+    cdef public object counts
+    cdef public uint16_t sequence
+
+    def __init__(
+        self,
+        bytearray request_codes,
+        bytearray handled_replies,
+        bytearray handled_events,
+    ):
+        assert len(request_codes) == 2**16
+        assert len(handled_replies) == 256 and len(handled_events) == 256
+        self.request_codes = request_codes
+        self.handled_replies = handled_replies
+        self.handled_events = handled_events
+        self._request_codes = request_codes
+        self._handled_replies = handled_replies
+        self._handled_events = handled_events
+        self.counts = array.array("Q", bytes(8 * 256))
+        self._counts = self.counts
+        self.sequence = 0
+
+    cdef inline Py_ssize_t _length(
+        self, const uint8_t[::1] buffer, Py_ssize_t pos, uint8_t key
+    ):
+        if buffer[pos] == 1 or key == GENERIC_EVENT_CODE:
+            return 32 + 4 * <Py_ssize_t>_u32(buffer, pos + 4)
+        return 32
+
+    def frame(self, bytearray buffer, Py_ssize_t pos, Py_ssize_t filled):
+        if filled - pos < 8:
+            return None
+        cdef uint8_t code = buffer[pos]
+        cdef uint8_t key
+        if code == 1:
+            key = self._request_codes[_u16(buffer, pos + 2)]
+        else:
+            key = code & 0x7F
+        return self._length(buffer, pos, key), code, key
+
+    def record(self, uint8_t code, uint16_t sequence_num):
+        self._counts[code & 0x7F] += 1
+        if code & 0x7F != KEYMAP_NOTIFY_CODE:
+            self.sequence = sequence_num
+
+    def scan(self, bytearray buffer, Py_ssize_t pos, Py_ssize_t filled):
+        cdef uint8_t[::1] view = buffer
+        cdef uint8_t code, key
+        while filled - pos >= 8:
+            code = view[pos]
+            if code == 0:
+                break
+            if code == 1:
+                key = self._request_codes[_u16(view, pos + 2)]
+                if self._handled_replies[key]:
+                    break
+            else:
+                key = code & 0x7F
+                if self._handled_events[key]:
+                    break
+                view[pos] = key
+            self._counts[code & 0x7F] += 1
+            if key != KEYMAP_NOTIFY_CODE:
+                self.sequence = _u16(view, pos + 2)
+            pos += self._length(view, pos, key)
+            if pos > filled:
+                return filled, pos - filled
+        return pos, 0
@@ -0,0 +1,110 @@
+import collections
+import socket
+from typing import Deque, List, Sequence, Tuple
+
+from bounce_rl.x_proxy import anc_data_util
+
+# Linux's IOV_MAX is 1024, we stay well below it.
+MAX_IOVECS = 64
+
+
+class OutputQueue:
+    """Buffers bytes bound for a non-blocking socket.
+
+    Writes are attempted immediately and anything the kernel doesn't accept is kept,
+    in order, until the owner calls flush() once the socket is writable again.
+    Ancillary data stays attached to the first byte of the buffer it was queued with
+    and its file descriptors are closed once they've been sent."""
+
+    def __init__(self, sock: socket.socket):
+        self.socket = sock
+        self.pending_bytes = 0
+        # The most bytes that have been pending at once.
+        self.peak_bytes = 0
+        self._pending: Deque[Tuple[memoryview, List]] = collections.deque()
+        # Ancillary data that arrived without any bytes to carry it.
+        self._stashed_anc_data: List = []
+
+    def __len__(self) -> int:
+        return self.pending_bytes
+
+    def _send(self, buffers: Sequence, anc_data: List) -> int:
+        """Returns the number of bytes sent. Raises on a broken connection."""
+        try:
+            sent = self.socket.sendmsg(buffers, anc_data)
+        except (BlockingIOError, InterruptedError):
+            return 0
+        except OSError:
+            # The descriptors weren't sent and won't be queued, so close them.
+            anc_data_util.cleanup_anc_data(anc_data)
+            raise
+        anc_data_util.cleanup_anc_data(anc_data)
+        return sent
+
+    def write(self, buffers: Sequence, anc_data: Sequence = ()) -> None:
+        anc_data = self._stashed_anc_data + list(anc_data)
+        buffers = [b for b in buffers if len(b) > 0]
+        if len(buffers) == 0:
+            self._stashed_anc_data = anc_data
+            return
+        self._stashed_anc_data = []
+
+        total = sum(len(b) for b in buffers)
+        sent = 0
+        if not self._pending:
+            sent = self._send(buffers[:MAX_IOVECS], anc_data)
+            if sent > 0:
+                anc_data = []
+            if sent == total:
+                return
+
+        # Copy whatever is left, the caller is free to reuse its buffers.
+        skip = sent
+        for buf in buffers:
+            if skip >= len(buf):
+                skip -= len(buf)
+                continue
+            self._pending.append((memoryview(bytes(buf[skip:])), anc_data))
+            anc_data = []
+            skip = 0
+        self.pending_bytes += total - sent
+        self.peak_bytes = max(self.peak_bytes, self.pending_bytes)
+
+    def flush(self) -> None:
+        """Sends as much pending data as the socket will take."""
+        while self._pending:
+            # Ancillary data can only be sent along with the first buffer of a call.
+            anc_data = self._pending[0][1]
+            batch = [self._pending[0][0]]
+            for i in range(1, min(len(self._pending), MAX_IOVECS)):
+                buf, buf_anc_data = self._pending[i]
+                if buf_anc_data:
+                    break
+                batch.append(buf)
+
+            try:
+                sent = self._send(batch, anc_data)
+            except OSError:
+                # _send closed the descriptors, so close() mustn't close them again.
+                self._pending[0] = (self._pending[0][0], [])
+                raise
+            if sent == 0:
+                return
+            self.pending_bytes -= sent
+            while sent > 0:
+                buf, _ = self._pending[0]
+                if len(buf) <= sent:
+                    self._pending.popleft()
+                    sent -= len(buf)
+                else:
+                    self._pending[0] = (buf[sent:], [])
+                    sent = 0
+
+    def close(self) -> None:
+        """Drops pending data and closes any file descriptors that weren't sent."""
+        for _, anc_data in self._pending:
+            anc_data_util.cleanup_anc_data(anc_data)
+        anc_data_util.cleanup_anc_data(self._stashed_anc_data)
+        self._pending.clear()
+        self._stashed_anc_data = []
+        self.pending_bytes = 0
@@ -0,0 +1,101 @@
+import array
+import os
+import socket
+import unittest
+
+from bounce_rl.x_proxy.output_queue import OutputQueue
+
+
+def _read_all(sock: socket.socket, n: int) -> bytes:
+    out = bytearray()
+    while len(out) < n:
+        out += sock.recv(n - len(out))
+    return bytes(out)
+
+
+def _fd_anc_data(fd: int):
+    return [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", [fd]).tobytes())]
+
+
+class TestOutputQueue(unittest.TestCase):
+    def setUp(self):
+        self.send_sock, self.recv_sock = socket.socketpair(
+            socket.AF_UNIX, socket.SOCK_STREAM
+        )
+        self.send_sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        self.send_sock.setblocking(False)
+        self.queue = OutputQueue(self.send_sock)
+
+    def tearDown(self):
+        self.send_sock.close()
+        self.recv_sock.close()
+
+    def test_small_write_is_sent_immediately(self):
+        self.queue.write([b"abc", memoryview(b"def")])
+        self.assertEqual(self.queue.pending_bytes, 0)
+        self.assertEqual(_read_all(self.recv_sock, 6), b"abcdef")
+
+    def test_partial_writes_are_queued_in_order(self):
+        data = os.urandom(2**20)
+        buf = bytearray(data)
+        self.queue.write([buf[: 2**19], buf[2**19 :]])
+        self.assertGreater(self.queue.pending_bytes, 0)
+        # The queue must not reference the caller's buffers.
+        buf[:] = bytes(len(buf))
+
+        received = bytearray()
+        while len(received) < len(data):
+            received += self.recv_sock.recv(2**16)
+            self.queue.flush()
+        self.assertEqual(bytes(received), data)
+        self.assertEqual(self.queue.pending_bytes, 0)
+
+    def test_anc_data_travels_with_its_bytes(self):
+        self.queue.write([os.urandom(2**20)])
+        self.assertGreater(self.queue.pending_bytes, 0)
+
+        r, w = os.pipe()
+        self.queue.write([b"fd"], _fd_anc_data(r))
+
+        received = bytearray()
+        fds = []
+        while len(received) < 2**20 + 2:
+            data, anc_data, _, _ = self.recv_sock.recvmsg(2**16, 64)
+            received += data
+            for _, _, fd_bytes in anc_data:
+                fd = array.array("i", fd_bytes)[0]
+                fds.append((len(received) - len(data), len(received), fd))
+            self.queue.flush()
+
+        self.assertEqual(len(fds), 1)
+        # The descriptor is delivered by the recvmsg call that reads its first byte.
+        start, end, fd = fds[0]
+        self.assertTrue(start <= 2**20 < end)
+        os.write(w, b"x")
+        self.assertEqual(os.read(fd, 1), b"x")
+        # The queue closes its copy of the descriptor once sent, so the received
+        # descriptor may reuse its number.
+        if fd != r:
+            self.assertRaises(OSError, os.fstat, r)
+        os.close(fd)
+        os.close(w)
+
+    def test_close_releases_unsent_fds(self):
+        self.queue.write([os.urandom(2**20)])
+        r, w = os.pipe()
+        self.queue.write([b"fd"], _fd_anc_data(r))
+        self.queue.close()
+        self.assertEqual(self.queue.pending_bytes, 0)
+        self.assertRaises(OSError, os.fstat, r)
+        os.close(w)
+
+    def test_failed_send_releases_fds(self):
+        self.recv_sock.close()
+        r, w = os.pipe()
+        self.assertRaises(BrokenPipeError, self.queue.write, [b"fd"], _fd_anc_data(r))
+        self.assertRaises(OSError, os.fstat, r)
+        os.close(w)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,429 @@
+"""Synthetic X11 traffic benchmark for the X proxy.
+
+Runs a fake X server and a fake client over unix sockets, once connected directly
+and once through a proxy_main subprocess, and reports throughput and the latency
+the proxy adds. The streaming scenarios saturate the connection, so their latencies
+include queueing, round_trips measures unloaded latency. Usage:
+
+  python -m bounce_rl.x_proxy.proxy_benchmark [--scenarios put_image,...]
+"""
+
+import argparse
+import json
+import os
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from bounce_rl.x_proxy.framer import GENERIC_EVENT_CODE
+
+GET_INPUT_FOCUS = 43
+POLY_FILL_RECTANGLE = 70
+PUT_IMAGE = 72
+NO_OPERATION = 127
+
+CLIENT_SETUP = struct.pack("BxHHHHxx", ord("l"), 11, 0, 0, 0)
+# A successful setup with one screen whose root window is ROOT_WINDOW.
+RESOURCE_ID_BASE = 0x00400000
+RESOURCE_ID_MASK = 0x001FFFFF
+ROOT_WINDOW = 0x123
+SERVER_SETUP = (
+    struct.pack("BxHHH", 1, 11, 0, 19)
+    + struct.pack(
+        "IIIIHHBBxxxxBBxxxx",
+        0,
+        RESOURCE_ID_BASE,
+        RESOURCE_ID_MASK,
+        0,
+        4,
+        2**16 - 1,
+        1,
+        0,
+        8,
+        255,
+    )
+    + b"fake"
+    + struct.pack("I", ROOT_WINDOW)
+    + bytes(36)
+)
+
+SERVER_DISPLAY = 90
+PROXY_DISPLAY = 91
+
+TIMESTAMP = struct.Struct("d")
+
+
+@dataclass
+class Result:
+    scenario: str
+    mode: str
+    seconds: float
+    n_bytes: int
+    n_messages: int
+    latencies: List[float] = field(default_factory=list)
+
+    def summary(self) -> Dict[str, float]:
+        summary = {
+            "MB/s": self.n_bytes / self.seconds / 1e6,
+            "msgs/s": self.n_messages / self.seconds,
+        }
+        if self.latencies:
+            p50, p90, p99 = np.percentile(np.array(self.latencies) * 1e6, (50, 90, 99))
+            summary.update({"p50_us": p50, "p90_us": p90, "p99_us": p99})
+        return summary
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    data = bytearray()
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        data += chunk
+    return bytes(data)
+
+
+class _Framer:
+    """Splits a received byte stream into X11 messages."""
+
+    def __init__(self, sock: socket.socket, is_request_stream: bool):
+        self.sock = sock
+        self.is_request_stream = is_request_stream
+        self.buffer = bytearray()
+        self.pos = 0
+
+    def _message_len(self) -> Optional[int]:
+        available = len(self.buffer) - self.pos
+        if self.is_request_stream:
+            if available < 4:
+                return None
+            n_words = struct.unpack_from("H", self.buffer, self.pos + 2)[0]
+            if n_words == 0:
+                if available < 8:
+                    return None
+                n_words = struct.unpack_from("I", self.buffer, self.pos + 4)[0]
+            return 4 * n_words
+
+        if available < 8:
+            return None
+        code, extra_words = struct.unpack_from("BxxxI", self.buffer, self.pos)
+        if code == 1 or code & 0x7F == GENERIC_EVENT_CODE:
+            return 32 + 4 * extra_words
+        return 32
+
+    def messages(self):
+        """Yields messages as (memoryview, receive time) until the peer closes."""
+        while True:
+            chunk = self.sock.recv(2**20)
+            if not chunk:
+                return
+            now = time.perf_counter()
+            self.buffer = self.buffer[self.pos :] + chunk
+            self.pos = 0
+            while True:
+                msg_len = self._message_len()
+                if msg_len is None or len(self.buffer) - self.pos < msg_len:
+                    break
+                yield self.buffer[self.pos : self.pos + msg_len], now
+                self.pos += msg_len
+
+
+def _put_image(timestamp_offset: int, n_bytes: int) -> Callable[[], bytes]:
+    # A big-requests PutImage. The first data word carries the send time.
+    n_words = n_bytes // 4
+    body = bytearray(4 * n_words)
+    struct.pack_into("BBHI", body, 0, PUT_IMAGE, 2, 0, n_words)
+
+    def make() -> bytes:
+        TIMESTAMP.pack_into(body, timestamp_offset, time.perf_counter())
+        return body
+
+    return make
+
+
+def _small_requests() -> Callable[[], bytes]:
+    # Alternating NoOperation and PolyFillRectangle requests. The first data word
+    # of each carries the send time, the fake server doesn't look at the rest.
+    burst = bytearray()
+    offsets = []
+    for i in range(64):
+        offsets.append(len(burst) + 4)
+        if i % 2 == 0:
+            burst += struct.pack("BxH", NO_OPERATION, 3) + bytes(8)
+        else:
+            burst += struct.pack("BxH", POLY_FILL_RECTANGLE, 5) + bytes(16)
+
+    def make() -> bytes:
+        now = time.perf_counter()
+        for offset in offsets:
+            TIMESTAMP.pack_into(burst, offset, now)
+        return burst
+
+    return make
+
+
+def _generic_events(extra_words: int) -> Callable[[], bytes]:
+    burst = bytearray()
+    for i in range(64):
+        burst += struct.pack("BBHIH", GENERIC_EVENT_CODE, 131, 0, extra_words, 2)
+        burst += bytes(22 + 4 * extra_words)
+
+    def make() -> bytes:
+        now = time.perf_counter()
+        for offset in range(0, len(burst), 32 + 4 * extra_words):
+            TIMESTAMP.pack_into(burst, offset + 12, now)
+        return burst
+
+    return make
+
+
+def _stream(
+    sender: socket.socket,
+    receiver: socket.socket,
+    make_data: Callable[[], bytes],
+    timestamp_offset: int,
+    is_request_stream: bool,
+    seconds: float,
+) -> Result:
+    """Sends make_data() as fast as the receiver takes it for the given duration."""
+    done = threading.Event()
+
+    def send():
+        while not done.is_set():
+            sender.sendall(make_data())
+        sender.shutdown(socket.SHUT_WR)
+
+    send_thread = threading.Thread(target=send, daemon=True)
+    start = time.perf_counter()
+    send_thread.start()
+    timer = threading.Timer(seconds, done.set)
+    timer.start()
+
+    result = Result("", "", 0, 0, 0)
+    for msg, now in _Framer(receiver, is_request_stream).messages():
+        result.n_bytes += len(msg)
+        result.n_messages += 1
+        sent = TIMESTAMP.unpack_from(msg, timestamp_offset)[0]
+        result.latencies.append(now - sent)
+    result.seconds = time.perf_counter() - start
+    send_thread.join()
+    return result
+
+
+def _round_trips(
+    client: socket.socket, server: socket.socket, n: int, seconds: float
+) -> Result:
+    """GetInputFocus ping-pong, the server replies to each request."""
+
+    def serve():
+        sequence_num = 0
+        for msg, _ in _Framer(server, is_request_stream=True).messages():
+            sequence_num += 1
+            server.sendall(struct.pack("BBHI", 1, 0, sequence_num, 0) + bytes(24))
+
+    serve_thread = threading.Thread(target=serve, daemon=True)
+    serve_thread.start()
+
+    result = Result("", "", 0, 0, 0)
+    start = time.perf_counter()
+    request = struct.pack("BxH", GET_INPUT_FOCUS, 1)
+    while result.n_messages < n and time.perf_counter() - start < seconds:
+        sent = time.perf_counter()
+        client.sendall(request)
+        _recv_exact(client, 32)
+        result.latencies.append(time.perf_counter() - sent)
+        result.n_messages += 1
+        result.n_bytes += 36
+    result.seconds = time.perf_counter() - start
+    client.shutdown(socket.SHUT_WR)
+    serve_thread.join()
+    return result
+
+
+def _replay(client: socket.socket, server: socket.socket, path: str) -> Result:
+    """Sends a recorded client request stream (without the connection setup)."""
+    with open(path, "rb") as f:
+        data = f.read()
+
+    def send():
+        client.sendall(data)
+        client.shutdown(socket.SHUT_WR)
+
+    send_thread = threading.Thread(target=send, daemon=True)
+    start = time.perf_counter()
+    send_thread.start()
+    result = Result("", "", 0, 0, 0)
+    for msg, _ in _Framer(server, is_request_stream=True).messages():
+        result.n_bytes += len(msg)
+        result.n_messages += 1
+    result.seconds = time.perf_counter() - start
+    send_thread.join()
+    return result
+
+
+class FakeXServer:
+    """Accepts connections on a display socket and answers the connection setup."""
+
+    def __init__(self, socket_dir: str, display_num: int):
+        self.listen_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listen_socket.bind(os.path.join(socket_dir, f"X{display_num}"))
+        self.listen_socket.listen(16)
+
+    def accept(self) -> socket.socket:
+        sock, _ = self.listen_socket.accept()
+        _recv_exact(sock, len(CLIENT_SETUP))
+        sock.sendall(SERVER_SETUP)
+        return sock
+
+    def close(self) -> None:
+        self.listen_socket.close()
+
+
+def connect(server: FakeXServer, path: str):
+    """Returns a (client, server) socket pair with the connection set up."""
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(path)
+    client.sendall(CLIENT_SETUP)
+    server_sock = server.accept()
+    _recv_exact(client, len(SERVER_SETUP))
+    return client, server_sock
+
+
+def _start_proxy(socket_dir: str) -> subprocess.Popen:
+    proxy = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "bounce_rl.x_proxy.proxy_main",
+            "--proxy_display",
+            str(PROXY_DISPLAY),
+            "--real_display",
+            f":{SERVER_DISPLAY}",
+            "--socket_dir",
+            socket_dir,
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+    proxy_path = os.path.join(socket_dir, f"X{PROXY_DISPLAY}")
+    while not os.path.exists(proxy_path):
+        assert proxy.poll() is None, "Proxy exited during startup"
+        time.sleep(0.01)
+    return proxy
+
+
+def run_scenario(
+    name: str, server: FakeXServer, path: str, args: argparse.Namespace
+) -> Result:
+    client, server_sock = connect(server, path)
+    try:
+        if name == "put_image":
+            result = _stream(
+                client,
+                server_sock,
+                _put_image(8, args.image_bytes),
+                8,
+                is_request_stream=True,
+                seconds=args.seconds,
+            )
+        elif name == "small_requests":
+            result = _stream(
+                client,
+                server_sock,
+                _small_requests(),
+                4,
+                is_request_stream=True,
+                seconds=args.seconds,
+            )
+        elif name == "generic_events":
+            result = _stream(
+                server_sock,
+                client,
+                _generic_events(args.event_words),
+                12,
+                is_request_stream=False,
+                seconds=args.seconds,
+            )
+        elif name == "round_trips":
+            result = _round_trips(client, server_sock, args.round_trips, args.seconds)
+        elif name == "replay":
+            result = _replay(client, server_sock, args.replay)
+        else:
+            raise ValueError(f"Unknown scenario: {name}")
+    finally:
+        client.close()
+        server_sock.close()
+    result.scenario = name
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--scenarios",
+        type=str,
+        default="put_image,small_requests,generic_events,round_trips",
+        help="Comma separated scenarios, 'replay' requires --replay.",
+    )
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--image_bytes", type=int, default=640 * 360 * 4 + 24)
+    parser.add_argument("--event_words", type=int, default=8)
+    parser.add_argument("--round_trips", type=int, default=5000)
+    parser.add_argument(
+        "--replay",
+        type=str,
+        default=None,
+        help="A file of raw client request bytes, recorded after connection setup.",
+    )
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    scenarios = args.scenarios.split(",")
+    if args.replay is not None and "replay" not in scenarios:
+        scenarios.append("replay")
+
+    results: List[Result] = []
+    with tempfile.TemporaryDirectory() as socket_dir:
+        server = FakeXServer(socket_dir, SERVER_DISPLAY)
+        proxy = _start_proxy(socket_dir)
+        try:
+            for name in scenarios:
+                for mode, display in (
+                    ("direct", SERVER_DISPLAY),
+                    ("proxy", PROXY_DISPLAY),
+                ):
+                    path = os.path.join(socket_dir, f"X{display}")
+                    result = run_scenario(name, server, path, args)
+                    result.mode = mode
+                    results.append(result)
+        finally:
+            proxy.terminate()
+            proxy.wait()
+            server.close()
+
+    summaries = {(r.scenario, r.mode): r.summary() for r in results}
+    for name in scenarios:
+        proxy_summary = summaries[(name, "proxy")]
+        direct_summary = summaries[(name, "direct")]
+        for key in ("p50_us", "p90_us", "p99_us"):
+            if key in proxy_summary:
+                proxy_summary["added_" + key] = proxy_summary[key] - direct_summary[key]
+
+    if args.json:
+        print(json.dumps({f"{s}/{m}": v for (s, m), v in summaries.items()}, indent=2))
+        return
+
+    for (scenario, mode), summary in summaries.items():
+        stats = ", ".join(f"{k}: {v:.1f}" for k, v in summary.items())
+        print(f"{scenario:>16} {mode:>6}  {stats}")
+
+
+if __name__ == "__main__":
+    main()
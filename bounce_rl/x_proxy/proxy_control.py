@@ -0,0 +1,116 @@
+import fcntl
+import json
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from bounce_rl.utilities.paths import project_root
+
+CONTROL_SOCKET = "/tmp/bounce_rl_x_proxy_control"
+
+
+class ProxyControl:
+    """Client for a running proxy service's control socket."""
+
+    def __init__(self, path: str = CONTROL_SOCKET, timeout: float = 5):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        self.socket.connect(path)
+        self.file = self.socket.makefile("rwb")
+        # Harness and its Keyboard share a connection from different threads, and
+        # each response has to go back to the thread that sent the command.
+        self.lock = threading.Lock()
+
+    def _call(self, **command) -> Dict[str, Any]:
+        with self.lock:
+            self.file.write(json.dumps(command).encode() + b"\n")
+            self.file.flush()
+            line = self.file.readline()
+        if not line:
+            raise ConnectionError("Proxy service closed the control connection")
+        response = json.loads(line)
+        if not response["ok"]:
+            raise RuntimeError(f"Proxy command {command} failed: {response['error']}")
+        return response
+
+    def add_display(self, proxy_display: int, real_display: str) -> None:
+        """Starts proxying proxy_display to real_display. Returns once the display's
+        socket accepts connections."""
+        self._call(cmd="add", proxy_display=proxy_display, real_display=real_display)
+
+    def remove_display(self, proxy_display: int) -> None:
+        """Stops proxying proxy_display and closes its connections."""
+        self._call(cmd="remove", proxy_display=proxy_display)
+
+    def list_displays(self) -> Dict[int, str]:
+        displays = self._call(cmd="list")["displays"]
+        return {int(k): v for k, v in displays.items()}
+
+    def set_pointer(self, proxy_display: int, x: int, y: int) -> None:
+        """Reports (x, y) to the display's QueryPointer requests, relative to the
+        queried window."""
+        self._call(cmd="pointer", proxy_display=proxy_display, x=x, y=y)
+
+    def send_input(
+        self, proxy_display: int, window: int, events: List[Dict[str, Any]]
+    ) -> None:
+        """Sends input events to the client owning window, see Proxy.send_input."""
+        self._call(
+            cmd="input", proxy_display=proxy_display, window=window, events=events
+        )
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Returns per-connection counters, see Proxy.stats."""
+        return self._call(cmd="stats")["connections"]
+
+    def close(self) -> None:
+        self.file.close()
+        self.socket.close()
+
+
+def connect(
+    path: str = CONTROL_SOCKET,
+    startup_timeout: float = 10,
+    cpus: Optional[Iterable[int]] = None,
+) -> ProxyControl:
+    """Connects to the proxy service, starting it if it isn't running. A service
+    started by this call only runs on the given CPUs."""
+    try:
+        return ProxyControl(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        pass
+
+    # Serialize startup across processes so only one service gets started.
+    with open(path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            return ProxyControl(path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            pass
+
+        command = [sys.executable, "-m", "bounce_rl.x_proxy.proxy_main"]
+        command += ["--control_socket", path]
+        if cpus:
+            command = ["taskset", "-c", ",".join(str(c) for c in cpus)] + command
+        subprocess.Popen(
+            command,
+            cwd=project_root(),
+            start_new_session=True,
+        )
+        start = time.monotonic()
+        while True:
+            try:
+                return ProxyControl(path)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() - start > startup_timeout:
+                    raise
+                time.sleep(0.005)
+
+
+if __name__ == "__main__":
+    # Prints the running service's connection stats.
+    path = sys.argv[1] if len(sys.argv) > 1 else CONTROL_SOCKET
+    print(json.dumps(ProxyControl(path).stats(), indent=2))
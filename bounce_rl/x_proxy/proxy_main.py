@@ -1,19 +1,46 @@
 import argparse
 import atexit
+import json
 import logging
 import os
-import select
+import selectors
 import signal
 import socket
 import sys
+from typing import Any, Dict, List, Optional, Set, Tuple
 
-from bounce_rl.x_proxy import reply_connection, request_connection
+from bounce_rl.x_proxy import reply_connection, request_connection, x_input
+from bounce_rl.x_proxy.output_queue import OutputQueue
+from bounce_rl.x_proxy.proxy_control import CONTROL_SOCKET
 
 logging.basicConfig(level=logging.WARNING)
 
 
-def _display_path(display_num):
-    return "/tmp/.X11-unix/X" + str(display_num)
+X11_SOCKET_DIR = "/tmp/.X11-unix"
+
+
+def _display_path(display_num, socket_dir: str = X11_SOCKET_DIR):
+    return os.path.join(socket_dir, "X" + str(display_num))
+
+
+def _remove_socket(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _remove_stale_socket(path: str) -> None:
+    """Removes a unix socket left behind by a dead process."""
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        _remove_socket(path)
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"{path} is in use by another process")
 
 
 def parse_display(display_spec: str) -> int:
@@ -30,99 +57,415 @@ def parse_display(display_spec: str) -> int:
     return int(display_num)
 
 
+# Stop reading from a socket once its peer has this many bytes queued and resume
+# once the peer has drained below the low watermark.
+HIGH_WATERMARK = 8 * 2**20
+LOW_WATERMARK = 2**20
+
+
+class Endpoint:
+    """One socket of a proxied connection.
+
+    Bytes read from this endpoint's socket are parsed by its stream and queued on
+    its peer's output."""
+
+    def __init__(self, sock: socket.socket, listener: "Listener"):
+        self.socket = sock
+        self.listener = listener
+        self.output = OutputQueue(sock)
+        self.peer: Optional["Endpoint"] = None
+        self.stream: Any = None
+        self.reading = True
+        self.events = 0
+        self.closed = False
+        # Set once the socket reached EOF. The connection is closed once
+        # everything read from it has been written to its peer.
+        self.eof = False
+
+
+class Listener:
+    """The listening socket of a proxied display and the connections made to it."""
+
+    def __init__(self, sock: socket.socket, path: str, server_display: str):
+        self.socket = sock
+        self.path = path
+        self.server_display = server_display
+        self.endpoints: Set[Endpoint] = set()
+        # The window relative pointer position reported to this display's clients
+        # once input has been injected.
+        self.pointer: Optional[Tuple[int, int]] = None
+
+
+class ControlConnection:
+    """A connection to the control socket. Takes one JSON command per line and
+    answers each with one JSON line."""
+
+    def __init__(self, sock: socket.socket):
+        self.socket = sock
+        self.output = OutputQueue(sock)
+        self.buffer = bytearray()
+        self.reading = True
+        self.events = 0
+        self.closed = False
+
+
 class Proxy:
-    def __init__(self, client_display_num: int, server_display: str):
-        print(f"Hosting proxy on {client_display_num}")
-        self.client_display = client_display_num
-        server_display_num = parse_display(server_display)
-        self.server_display = server_display_num
-
-        self.client_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        x_conn_path = _display_path(self.client_display)
-        self.client_socket.bind(x_conn_path)
-        atexit.register(lambda: os.remove(x_conn_path))
-        signal.signal(signal.SIGTERM, lambda signum, frame: os.remove(x_conn_path))
-        signal.signal(signal.SIGINT, lambda signum, frame: os.remove(x_conn_path))
-        signal.signal(signal.SIGHUP, lambda signum, frame: os.remove(x_conn_path))
-        self.client_socket.listen(200)
-
-        self.sockets = [self.client_socket]
+    """Proxies X11 connections for any number of displays from one event loop.
+
+    Displays are added with add_display or, while running, through the control
+    socket."""
+
+    def __init__(
+        self,
+        socket_dir: str = X11_SOCKET_DIR,
+        control_path: Optional[str] = None,
+    ):
+        self.socket_dir = socket_dir
+        self.selector = selectors.DefaultSelector()
+        self.listeners: Dict[int, Listener] = {}
         self.conn_id = 0
-        self.proxy_connections = {}
+
+        self.control_path = control_path
+        self.control_socket = None
+        if control_path is not None:
+            _remove_stale_socket(control_path)
+            self.control_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.control_socket.bind(control_path)
+            self.control_socket.listen(64)
+            self.control_socket.setblocking(False)
+            self.selector.register(self.control_socket, selectors.EVENT_READ, None)
+
+        atexit.register(self.close)
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, lambda signum, frame: sys.exit(0))
+
+    def add_display(self, proxy_display: int, server_display: str) -> None:
+        if proxy_display in self.listeners:
+            if self.listeners[proxy_display].server_display == server_display:
+                return
+            raise ValueError(f"Display :{proxy_display} is already proxied")
+        parse_display(server_display)
+
+        print(f"Hosting proxy on {proxy_display}")
+        path = _display_path(proxy_display, self.socket_dir)
+        _remove_socket(path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(path)
+        sock.listen(200)
+        sock.setblocking(False)
+
+        listener = Listener(sock, path, server_display)
+        self.listeners[proxy_display] = listener
+        self.selector.register(sock, selectors.EVENT_READ, listener)
+
+    def remove_display(self, proxy_display: int) -> None:
+        listener = self.listeners.pop(proxy_display, None)
+        if listener is None:
+            return
+        for endpoint in list(listener.endpoints):
+            self.cleanup(endpoint)
+        self.selector.unregister(listener.socket)
+        listener.socket.close()
+        _remove_socket(listener.path)
+
+    def close(self) -> None:
+        for proxy_display in list(self.listeners):
+            self.remove_display(proxy_display)
+        if self.control_socket is not None:
+            self.control_socket.close()
+            self.control_socket = None
+            _remove_socket(self.control_path)
+
+    def set_pointer(self, proxy_display: int, x: int, y: int) -> None:
+        """Makes the display's clients see the pointer at (x, y) relative to the
+        window they query."""
+        listener = self.listeners[proxy_display]
+        listener.pointer = (x, y)
+        for client in listener.endpoints:
+            client.peer.stream.reply_stream.set_pointer(x, y)
+
+    def send_input(
+        self, proxy_display: int, window: int, events: List[Dict[str, Any]]
+    ) -> None:
+        """Injects core input events into the stream of the client that owns window.
+
+        Each event has a type from x_input.EVENT_CODES, a window relative x and y,
+        root_x and root_y, and optionally detail (keycode or button) and state.
+        Motion also moves the pointer that QueryPointer replies report."""
+        listener = self.listeners[proxy_display]
+        for event in events:
+            if x_input.EVENT_CODES[event["type"]] == x_input.MOTION_NOTIFY:
+                self.set_pointer(proxy_display, event["x"], event["y"])
+
+        for client in list(listener.endpoints):
+            reply_stream = client.peer.stream.reply_stream
+            if not reply_stream.owns(window):
+                continue
+            # Events carry the serial of the last request the server processed.
+            # A later one would tell the client that requests still waiting on
+            # replies are complete.
+            sequence_num = reply_stream.sequence
+            try:
+                for event in events:
+                    reply_stream.inject(
+                        x_input.input_event(
+                            x_input.EVENT_CODES[event["type"]],
+                            event.get("detail", 0),
+                            sequence_num,
+                            reply_stream.root,
+                            window,
+                            event["x"],
+                            event["y"],
+                            event["root_x"],
+                            event["root_y"],
+                            event.get("state", 0),
+                        )
+                    )
+            except (BrokenPipeError, ConnectionResetError):
+                self.cleanup(client)
+                continue
+            self._update_events(client)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Returns a snapshot of every proxied connection's counters. Requests are
+        counted by opcode and replies by message code."""
+        snapshot = []
+        for proxy_display, listener in self.listeners.items():
+            for client in listener.endpoints:
+                display = client.peer
+                snapshot.append(
+                    {
+                        "conn_id": client.stream.request_stream.conn_id,
+                        "proxy_display": proxy_display,
+                        "requests": client.stream.request_stream.stats.snapshot(),
+                        "replies": display.stream.reply_stream.stats.snapshot(),
+                        "queued_to_server": display.output.pending_bytes,
+                        "peak_queued_to_server": display.output.peak_bytes,
+                        "queued_to_client": client.output.pending_bytes,
+                        "peak_queued_to_client": client.output.peak_bytes,
+                    }
+                )
+        return snapshot
 
     def run(self):
         while True:
-            read, wait, exceptions = select.select(self.sockets, [], self.sockets)
-            if len(exceptions) > 0:
-                logging.debug("Found %s exception state sockets.", len(exceptions))
-            for rs in read:
-                if rs is self.client_socket:
-                    # Create sockets for the client connection and display connection.
-                    logging.info("Client connected")
-                    client_sock, address = rs.accept()
-                    display_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-                    display_sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-                    display_sock.connect(_display_path(self.server_display))
-
-                    self.sockets.append(client_sock)
-                    self.sockets.append(display_sock)
-
-                    requests = request_connection.RequestConnection(
-                        display_sock, self.conn_id
-                    )
-                    replies = reply_connection.ReplyConnection(
-                        client_sock, requests.request_stream.request_codes, self.conn_id
-                    )
-                    self.conn_id += 1
-                    self.proxy_connections[client_sock] = requests
-                    self.proxy_connections[display_sock] = replies
+            for key, mask in self.selector.select():
+                if key.data is None:
+                    self._accept_control()
                     continue
-                else:
-                    if rs not in self.sockets:
-                        continue
-
-                    mirror_socket = self.proxy_connections.get(rs, None)
-                    if mirror_socket is None:
-                        assert False, "No mirror"
-
-                    try:
-                        recv_data, anc_data, flags, _ = rs.recvmsg(int(5e5), int(1e4))
-                    except ConnectionResetError:
-                        logging.info("ConnectionReset cleanup")
-                        self.cleanup_from_client(mirror_socket, rs)
-                        continue
-
-                    if len(recv_data) == 0:
-                        logging.info("Connection closed cleanup")
-                        self.cleanup_from_client(mirror_socket, rs)
-                        continue
-
-                    try:
-                        mirror_socket.sendmsg([recv_data], anc_data)
-                    except BrokenPipeError:
-                        logging.info("Client connection broken")
-                        self.cleanup_from_server(mirror_socket, rs)
-                        continue
-
-    def cleanup_from_client(self, mirror_socket, rs):
-        rs.shutdown(socket.SHUT_RDWR)
-        mirror_socket.get_socket().shutdown(socket.SHUT_RDWR)
-        rs.close()
-        mirror_socket.get_socket().close()
-        self.sockets.remove(rs)
-        self.sockets.remove(mirror_socket.get_socket())
-        self.proxy_connections.pop(rs, None)
-        self.proxy_connections.pop(mirror_socket, None)
-
-    def cleanup_from_server(self, mirror_socket, rs):
-        rs.shutdown(socket.SHUT_RDWR)
-        mirror_socket.get_socket().shutdown(socket.SHUT_RDWR)
-        rs.close()
-        mirror_socket.get_socket().close()
-        self.sockets.remove(rs)
-        self.sockets.remove(mirror_socket.get_socket())
-        self.proxy_connections.pop(rs, None)
-        self.proxy_connections.pop(mirror_socket, None)
+                if isinstance(key.data, Listener):
+                    self._accept(key.data)
+                    continue
+
+                endpoint = key.data
+                if mask & selectors.EVENT_WRITE and not endpoint.closed:
+                    self._on_writable(endpoint)
+                if mask & selectors.EVENT_READ and not endpoint.closed:
+                    if isinstance(endpoint, ControlConnection):
+                        self._on_control_readable(endpoint)
+                    else:
+                        self._on_readable(endpoint)
+
+    def _accept(self, listener: Listener) -> None:
+        # Create sockets for the client connection and display connection.
+        logging.info("Client connected")
+        try:
+            client_sock, _ = listener.socket.accept()
+        except BlockingIOError:
+            return
+        display_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        display_sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        try:
+            display_sock.connect(
+                _display_path(parse_display(listener.server_display), self.socket_dir)
+            )
+        except OSError:
+            logging.warning("Couldn't connect to %s", listener.server_display)
+            client_sock.close()
+            display_sock.close()
+            return
+        client_sock.setblocking(False)
+        display_sock.setblocking(False)
+
+        client = Endpoint(client_sock, listener)
+        display = Endpoint(display_sock, listener)
+        client.peer = display
+        display.peer = client
+        client.stream = request_connection.RequestConnection(
+            display.output, self.conn_id
+        )
+        display.stream = reply_connection.ReplyConnection(
+            client.output, client.stream.request_stream.request_codes, self.conn_id
+        )
+        if listener.pointer is not None:
+            display.stream.reply_stream.set_pointer(*listener.pointer)
+        self.conn_id += 1
+        # Only client endpoints are tracked, their peers are reached through them.
+        listener.endpoints.add(client)
+        self._update_events(client)
+        self._update_events(display)
+
+    def _update_events(self, endpoint: Any) -> None:
+        events = 0
+        if endpoint.reading:
+            events |= selectors.EVENT_READ
+        if endpoint.output.pending_bytes > 0:
+            events |= selectors.EVENT_WRITE
+        if events == endpoint.events:
+            return
+
+        if endpoint.events == 0:
+            self.selector.register(endpoint.socket, events, endpoint)
+        elif events == 0:
+            self.selector.unregister(endpoint.socket)
+        else:
+            self.selector.modify(endpoint.socket, events, endpoint)
+        endpoint.events = events
+
+    def _on_readable(self, endpoint: Endpoint) -> None:
+        peer = endpoint.peer
+        try:
+            nbytes = endpoint.stream.recv(endpoint.socket)
+        except (BlockingIOError, InterruptedError):
+            return
+        except ConnectionResetError:
+            logging.info("ConnectionReset cleanup")
+            self.cleanup(endpoint)
+            return
+        except BrokenPipeError:
+            logging.info("Mirror connection broken")
+            self.cleanup(endpoint)
+            return
+
+        if nbytes == 0:
+            logging.info("Connection closed, draining its peer")
+            endpoint.eof = True
+            endpoint.reading = False
+            self._update_events(endpoint)
+            self._close_if_drained(peer)
+            return
+
+        # Apply backpressure to this socket while its peer can't keep up.
+        if peer.output.pending_bytes > HIGH_WATERMARK:
+            endpoint.reading = False
+        self._update_events(endpoint)
+        self._update_events(peer)
+
+    def _on_writable(self, endpoint: Any) -> None:
+        try:
+            endpoint.output.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            logging.info("Connection broken on write")
+            self.cleanup(endpoint)
+            return
+
+        peer = getattr(endpoint, "peer", None)
+        if peer is not None and peer.eof:
+            self._close_if_drained(endpoint)
+            return
+        if (
+            peer is not None
+            and not peer.reading
+            and endpoint.output.pending_bytes < LOW_WATERMARK
+        ):
+            peer.reading = True
+            self._update_events(peer)
+        self._update_events(endpoint)
+
+    def _close_if_drained(self, endpoint: Endpoint) -> None:
+        """Closes the connection of an endpoint whose peer reached EOF once the
+        endpoint has written everything its peer sent."""
+        if endpoint.output.pending_bytes > 0:
+            self._update_events(endpoint)
+            return
+        try:
+            endpoint.socket.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+        self.cleanup(endpoint)
+
+    def cleanup(self, endpoint: Any) -> None:
+        peer = getattr(endpoint, "peer", None)
+        for e in (endpoint, peer):
+            if e is None or e.closed:
+                continue
+            e.closed = True
+            if e.events != 0:
+                self.selector.unregister(e.socket)
+                e.events = 0
+            e.output.close()
+            try:
+                e.socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            e.socket.close()
+            listener = getattr(e, "listener", None)
+            if listener is not None:
+                listener.endpoints.discard(e)
+
+    def _accept_control(self) -> None:
+        try:
+            sock, _ = self.control_socket.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        self._update_events(ControlConnection(sock))
+
+    def _on_control_readable(self, conn: ControlConnection) -> None:
+        try:
+            data = conn.socket.recv(2**16)
+        except (BlockingIOError, InterruptedError):
+            return
+        except ConnectionResetError:
+            data = b""
+        if len(data) == 0:
+            self.cleanup(conn)
+            return
+
+        conn.buffer += data
+        while b"\n" in conn.buffer:
+            line, _, rest = conn.buffer.partition(b"\n")
+            conn.buffer = rest
+            response = self._handle_command(line)
+            try:
+                conn.output.write([json.dumps(response).encode() + b"\n"])
+            except (BrokenPipeError, ConnectionResetError):
+                self.cleanup(conn)
+                return
+        self._update_events(conn)
+
+    def _handle_command(self, line: bytes) -> Dict[str, Any]:
+        try:
+            command = json.loads(line)
+            cmd = command["cmd"]
+            if cmd == "add":
+                self.add_display(int(command["proxy_display"]), command["real_display"])
+                return {"ok": True}
+            elif cmd == "remove":
+                self.remove_display(int(command["proxy_display"]))
+                return {"ok": True}
+            elif cmd == "list":
+                displays = {
+                    str(d): listener.server_display
+                    for d, listener in self.listeners.items()
+                }
+                return {"ok": True, "displays": displays}
+            elif cmd == "pointer":
+                self.set_pointer(
+                    int(command["proxy_display"]), command["x"], command["y"]
+                )
+                return {"ok": True}
+            elif cmd == "input":
+                self.send_input(
+                    int(command["proxy_display"]), command["window"], command["events"]
+                )
+                return {"ok": True}
+            elif cmd == "stats":
+                return {"ok": True, "connections": self.stats()}
+            raise ValueError(f"Unknown command: {cmd}")
+        except Exception as e:
+            logging.warning("Control command failed: %s", e)
+            return {"ok": False, "error": repr(e)}
 
 
 if __name__ == "__main__":
@@ -131,17 +474,41 @@ if __name__ == "__main__":
     parser.add_argument(
         "--proxy_display",
         type=int,
-        required=True,
+        default=None,
         help="The X11 display the proxy will serve traffic for.",
     )
     parser.add_argument(
         "--real_display",
         type=str,
-        required=True,
+        default=None,
         help="The X11 display the proxy is backed by.",
     )
+    parser.add_argument(
+        "--socket_dir",
+        type=str,
+        default=X11_SOCKET_DIR,
+        help="The directory holding both displays' unix sockets.",
+    )
+    parser.add_argument(
+        "--control_socket",
+        type=str,
+        default=None,
+        help="Path of a unix socket that accepts commands to add and remove displays. "
+        f"Defaults to {CONTROL_SOCKET} when no display is given.",
+    )
     args = parser.parse_args()
+    assert (args.proxy_display is None) == (
+        args.real_display is None
+    ), "--proxy_display and --real_display must be given together"
+    control_socket = args.control_socket
+    if args.proxy_display is None and control_socket is None:
+        control_socket = CONTROL_SOCKET
 
-    print(f"Proxying display: {args.proxy_display} to {args.real_display}", flush=True)
-    proxy = Proxy(args.proxy_display, args.real_display)
+    proxy = Proxy(args.socket_dir, control_socket)
+    if args.proxy_display is not None:
+        print(
+            f"Proxying display: {args.proxy_display} to {args.real_display}",
+            flush=True,
+        )
+        proxy.add_display(args.proxy_display, args.real_display)
     proxy.run()
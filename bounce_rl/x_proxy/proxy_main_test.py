@@ -0,0 +1,188 @@
+import os
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from bounce_rl.utilities.paths import project_root
+from bounce_rl.x_proxy import proxy_control
+from bounce_rl.x_proxy.proxy_benchmark import (
+    RESOURCE_ID_BASE,
+    ROOT_WINDOW,
+    FakeXServer,
+    connect,
+)
+
+NO_OPERATION = struct.pack("BxH", 127, 1)
+
+
+class TestProxyService(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.socket_dir = self.tmp_dir.name
+        self.control_path = os.path.join(self.socket_dir, "control")
+        self.server = FakeXServer(self.socket_dir, 50)
+        self.proxy = subprocess.Popen(
+            [sys.executable, "-m", "bounce_rl.x_proxy.proxy_main"]
+            + ["--socket_dir", self.socket_dir, "--control_socket", self.control_path],
+            cwd=project_root(),
+            stdout=subprocess.DEVNULL,
+        )
+        while not os.path.exists(self.control_path):
+            time.sleep(0.01)
+        self.control = proxy_control.ProxyControl(self.control_path)
+
+    def tearDown(self):
+        self.control.close()
+        self.proxy.terminate()
+        self.proxy.wait()
+        self.server.close()
+        self.tmp_dir.cleanup()
+
+    def _display_path(self, display: int) -> str:
+        return os.path.join(self.socket_dir, f"X{display}")
+
+    def test_add_displays(self):
+        self.control.add_display(51, ":50")
+        self.control.add_display(52, ":50")
+        self.assertEqual(self.control.list_displays(), {51: ":50", 52: ":50"})
+
+        for display in (51, 52):
+            client, server = connect(self.server, self._display_path(display))
+            client.sendall(NO_OPERATION)
+            self.assertEqual(server.recv(4), NO_OPERATION)
+            client.close()
+            server.close()
+
+    def test_remove_display_closes_its_connections(self):
+        self.control.add_display(51, ":50")
+        client, server = connect(self.server, self._display_path(51))
+
+        self.control.remove_display(51)
+        self.assertEqual(self.control.list_displays(), {})
+        self.assertFalse(os.path.exists(self._display_path(51)))
+        self.assertEqual(client.recv(4), b"")
+        client.close()
+        server.close()
+
+    def test_requests_sent_before_close_are_delivered(self):
+        self.control.add_display(51, ":50")
+        client, server = connect(self.server, self._display_path(51))
+        # More than the server socket holds, so the proxy still has some queued
+        # when it sees the client close.
+        requests = NO_OPERATION * 2**19
+        client.sendall(requests)
+        client.close()
+        time.sleep(0.5)
+
+        received = bytearray()
+        while True:
+            data = server.recv(2**16)
+            if not data:
+                break
+            received += data
+        self.assertEqual(bytes(received), requests)
+        server.close()
+
+    def test_stats(self):
+        self.control.add_display(51, ":50")
+        client, server = connect(self.server, self._display_path(51))
+        client.sendall(NO_OPERATION * 3)
+        self.assertEqual(server.recv(12), NO_OPERATION * 3)
+
+        (stats,) = self.control.stats()
+        self.assertEqual(stats["proxy_display"], 51)
+        self.assertEqual(stats["requests"]["codes"], {"127": 3})
+        self.assertEqual(stats["queued_to_server"], 0)
+        client.close()
+        server.close()
+
+    def test_input_is_sent_to_window_owner(self):
+        self.control.add_display(51, ":50")
+        client, server = connect(self.server, self._display_path(51))
+        window = RESOURCE_ID_BASE | 5
+        # Two GetInputFocus requests, of which the server has answered the first.
+        client.sendall(struct.pack("BxH", 43, 1) * 2)
+        self.assertEqual(server.recv(8), struct.pack("BxH", 43, 1) * 2)
+        reply = struct.pack("BBHI", 1, 0, 1, 0) + bytes(24)
+        server.sendall(reply)
+        self.assertEqual(client.recv(32), reply)
+
+        self.control.send_input(
+            51,
+            window,
+            [
+                {
+                    "type": "key_press",
+                    "detail": 38,
+                    "x": 1,
+                    "y": 2,
+                    "root_x": 3,
+                    "root_y": 4,
+                }
+            ],
+        )
+        code, detail, sequence_num, _, root, event_window = struct.unpack_from(
+            "BBHIII", client.recv(32)
+        )
+        self.assertEqual(
+            (code, detail, root, event_window), (2, 38, ROOT_WINDOW, window)
+        )
+        # The event only vouches for the requests the server has answered.
+        self.assertEqual(sequence_num, 1)
+
+        # Windows owned by other clients don't get the events.
+        self.control.send_input(
+            51, 5, [{"type": "motion", "x": 1, "y": 2, "root_x": 3, "root_y": 4}]
+        )
+        client.setblocking(False)
+        self.assertRaises(BlockingIOError, client.recv, 32)
+        client.close()
+        server.close()
+
+    def test_conflicting_add_fails(self):
+        self.control.add_display(51, ":50")
+        self.assertRaises(RuntimeError, self.control.add_display, 51, ":49")
+        # Re-adding the same display is a no-op.
+        self.control.add_display(51, ":50")
+
+    def test_concurrent_calls_get_their_own_responses(self):
+        self.control.add_display(51, ":50")
+        errors = []
+
+        def call(method, expected):
+            try:
+                for _ in range(200):
+                    self.assertEqual(method(), expected)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [
+            threading.Thread(
+                target=call, args=(self.control.list_displays, {51: ":50"})
+            ),
+            threading.Thread(target=call, args=(self.control.stats, [])),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_second_service_refuses_live_control_socket(self):
+        result = subprocess.run(
+            [sys.executable, "-m", "bounce_rl.x_proxy.proxy_main"]
+            + ["--socket_dir", self.socket_dir, "--control_socket", self.control_path],
+            cwd=project_root(),
+            capture_output=True,
+        )
+        self.assertNotEqual(result.returncode, 0)
+        self.assertEqual(self.control.list_displays(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
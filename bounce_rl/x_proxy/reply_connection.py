@@ -1,132 +1,155 @@
+import functools
 import logging
 import socket
 import struct
-from typing import Iterable, Tuple
+from typing import Dict, Iterable, Optional, Tuple
 
-from bounce_rl.x_proxy import anc_data_util, x_overrides
+from bounce_rl.x_proxy import framer, request_connection, x_overrides
+from bounce_rl.x_proxy.message_stream import Handler, MessageStream
+from bounce_rl.x_proxy.output_queue import OutputQueue
 
-GENERIC_EVENT_CODE = 35
 
+def _filter_event(handler):
+    """Adapts an event handler, which returns True to filter its event, to the
+    MessageStream handler convention."""
 
-class ReplyStream:
-    def __init__(
-        self, socket: socket.socket, request_codes: dict[int, int], conn_id: int
-    ):
-        self.socket = socket
-        self.end = 0
-        self.queued_bytes = bytearray()
-        self.connected = False
-        self.request_codes = request_codes
-        self.conn_id = conn_id
+    @functools.wraps(handler)
+    def handle(event: memoryview) -> Optional[bytes]:
+        if handler(event):
+            return b""
+        return None
+
+    return handle
 
-        self.reply_handlers = x_overrides.ReplyHandlerTable()
-        self.event_handlers = x_overrides.EventHandlerTable()
 
-    def _take_from_queue(self, n: int) -> memoryview:
-        v = memoryview(self.queued_bytes)[self.end : self.end + n]
-        self.end += n
-        return v
+# Shared by every connection the proxy serves.
+REPLY_HANDLERS = x_overrides.ReplyHandlerTable()
+EVENT_HANDLERS = {
+    code: _filter_event(handler)
+    for code, handler in x_overrides.EventHandlerTable().items()
+}
 
-    def _remaining_bytes(self) -> int:
-        return len(self.queued_bytes) - self.end
 
-    def _replace_last_message(self, msg_len: int, new_msg: bytes) -> None:
-        logging.debug("Replacing last reply")
-        self.queued_bytes = (
-            self.queued_bytes[: self.end - msg_len]
-            + new_msg
-            + self.queued_bytes[self.end :]
+class ReplyStream(MessageStream):
+    def __init__(self, output: OutputQueue, request_codes: bytearray, conn_id: int):
+        super().__init__(output)
+        self.request_codes = request_codes
+        self.conn_id = conn_id
+
+        self.framer = framer.ReplyFramer(request_codes, bytearray(256), bytearray(256))
+        self.reply_handlers = REPLY_HANDLERS
+        self.event_handlers = EVENT_HANDLERS
+
+        # Filled in from the setup reply. Windows created by this connection's
+        # client have IDs in resource_id_base | resource_id_mask.
+        self.resource_id_base: Optional[int] = None
+        self.resource_id_mask = 0
+        self.root = 0
+        # The window relative pointer position QueryPointer replies report.
+        self.pointer: Optional[Tuple[int, int]] = None
+
+    @property
+    def reply_handlers(self) -> Dict[int, Handler]:
+        return self._reply_handlers
+
+    @reply_handlers.setter
+    def reply_handlers(self, handlers: Dict[int, Handler]) -> None:
+        self._reply_handlers = handlers
+        self.framer.handled_replies[:] = framer.handled_mask(handlers)
+
+    @property
+    def event_handlers(self) -> Dict[int, Handler]:
+        return self._event_handlers
+
+    @event_handlers.setter
+    def event_handlers(self, handlers: Dict[int, Handler]) -> None:
+        self._event_handlers = handlers
+        self.framer.handled_events[:] = framer.handled_mask(handlers)
+
+    def owns(self, window: int) -> bool:
+        return (
+            self.resource_id_base is not None
+            and window & ~self.resource_id_mask == self.resource_id_base
         )
-        self.end = self.end - msg_len + len(new_msg)
 
-    def _handle_connection(self) -> None:
-        n = len(self.queued_bytes)
-        if n < 8:
-            return
-        code, major, minor, additional_data_len = struct.unpack(
-            "BxHHH", self.queued_bytes[:8]
+    @property
+    def sequence(self) -> int:
+        """The sequence number of the last message from the server."""
+        return self.framer.sequence
+
+    def set_pointer(self, x: int, y: int) -> None:
+        """Reports (x, y) to the client's QueryPointer requests from now on."""
+        if self.pointer is None:
+            self.reply_handlers = {
+                **self.reply_handlers,
+                x_overrides.QUERY_POINTER: self._query_pointer_reply,
+            }
+        self.pointer = (x, y)
+
+    def _query_pointer_reply(self, reply: memoryview) -> Optional[bytes]:
+        return x_overrides.OverrideQueryPointerReply(reply, *self.pointer)
+
+    def _setup_reply(self, reply: memoryview) -> Optional[bytes]:
+        if len(reply) < 40:
+            return None
+        self.resource_id_base, self.resource_id_mask = struct.unpack_from(
+            "II", reply, 12
         )
-        assert code == 1, "Client received unexpected connection code " + str(code)
-        total_len = 8 + additional_data_len * 4
-        if n >= total_len:
-            logging.info("Client finished setup")
-            self.end += total_len
-            self.connected = True
+        vendor_len, _, _, n_formats = struct.unpack_from("HHBB", reply, 24)
+        root_offset = 40 + request_connection.pad(vendor_len) + 8 * n_formats
+        if len(reply) >= root_offset + 4:
+            self.root = struct.unpack_from("I", reply, root_offset)[0]
+        return None
+
+    def _frame(self, pos: int) -> Optional[Tuple[int, Optional[Handler]]]:
+        if self.filled - pos < 8:
+            return None
+        if not self.connected:
+            code, major, minor, additional_data_len = struct.unpack_from(
+                "BxHHH", self.buffer, pos
+            )
+            assert code == 1, "Client received unexpected connection code " + str(code)
+            return 8 + additional_data_len * 4, self._setup_reply
 
-    def consume(self, data: bytearray, anc_data: Tuple):
-        logging.debug("Consuming %d reply bytes", len(data))
+        msg_len, code, key = self.framer.frame(self.buffer, pos, self.filled)
+        if code == 0:
+            return msg_len, None
+        elif code == 1:
+            return msg_len, self._reply_handlers.get(key)
+        return msg_len, self._event_handlers.get(key)
 
-        self.queued_bytes += data
+    def _on_message(self, pos: int) -> None:
         if not self.connected:
-            self._handle_connection()
+            logging.info("Client finished setup")
+            self.connected = True
+            return
 
-        while self.connected and len(self.queued_bytes) - self.end >= 32:
-            code, detail, sequence_num, extra_length = struct.unpack(
-                "BBHI", self.queued_bytes[self.end : self.end + 8]
-            )
-            is_event = code > 1
-            is_reply = code == 1
-            is_error = code == 0
-
-            logging.debug(
-                "Reply conn %d, serial %d, code %d, extra_len %d, remaining %d",
-                self.conn_id,
-                sequence_num,
-                code,
-                extra_length,
-                self._remaining_bytes(),
-            )
+        code = self.buffer[pos]
+        self.framer.record(code, struct.unpack_from("H", self.buffer, pos + 2)[0])
+        if code == 0:
+            logging.info("X11 Error: %d", self.buffer[pos + 1])
+        elif code > 1:
+            # Unset the send event bit.
+            self.buffer[pos] = code & 0x7F
 
-            if is_error:
-                logging.info(f"X11 Error: {code}")
-                self._take_from_queue(32)
-            elif is_reply:
-                msg_len = 32 + 4 * extra_length
-                if self._remaining_bytes() < msg_len:
-                    break
-
-                opcode = self.request_codes.get(sequence_num, -1)
-                reply = self._take_from_queue(msg_len)
-                if opcode in self.reply_handlers:
-                    new_reply = self.reply_handlers[opcode](reply)
-                    if new_reply is not None:
-                        self._replace_last_message(msg_len, new_reply)
-            elif is_event:
-                if code != GENERIC_EVENT_CODE:
-                    extra_length = 0
-                msg_len = 32 + 4 * extra_length
-
-                # Unset the send event bit.
-                self.queued_bytes[0] &= 0x7F
-
-                if self._remaining_bytes() < msg_len:
-                    break
-
-                event = self._take_from_queue(msg_len)
-                if code in self.event_handlers:
-                    should_filter = self.event_handlers[code](event)
-                    if should_filter:
-                        self._replace_last_message(msg_len, b"")
-
-        to_send = memoryview(self.queued_bytes)[: self.end]
-        self.socket.sendmsg([to_send], anc_data)
-        self.queued_bytes = self.queued_bytes[self.end :]
-        self.end = 0
+    def _scan(self, pos: int) -> Tuple[int, int]:
+        if not self.connected:
+            return pos, 0
+        return self.framer.scan(self.buffer, pos, self.filled)
 
 
 class ReplyConnection:
-    def __init__(
-        self, socket: socket.socket, request_codes: dict[int, int], conn_id: int
-    ):
-        self.socket = socket
-        self.reply_stream = ReplyStream(socket, request_codes, conn_id)
+    def __init__(self, output: OutputQueue, request_codes: bytearray, conn_id: int):
+        self.output = output
+        self.reply_stream = ReplyStream(output, request_codes, conn_id)
+
+    def recv(self, sock: socket.socket) -> int:
+        return self.reply_stream.recv(sock)
 
     def sendmsg(self, buffers: Iterable[bytearray], anc_data: Tuple):
-        buffer = bytearray()
         for buf in buffers:
-            buffer += buf
-        self.reply_stream.consume(buffer, anc_data)
-        anc_data_util.cleanup_anc_data(anc_data)
+            self.reply_stream.consume(buf, anc_data)
+            anc_data = ()
 
     def get_socket(self) -> socket.socket:
-        return self.reply_stream.socket
+        return self.output.socket
@@ -0,0 +1,52 @@
+"""Synthetic core input events that the proxy writes into clients' reply streams."""
+
+import struct
+import time
+
+KEY_PRESS = 2
+KEY_RELEASE = 3
+BUTTON_PRESS = 4
+BUTTON_RELEASE = 5
+MOTION_NOTIFY = 6
+
+EVENT_CODES = {
+    "key_press": KEY_PRESS,
+    "key_release": KEY_RELEASE,
+    "button_press": BUTTON_PRESS,
+    "button_release": BUTTON_RELEASE,
+    "motion": MOTION_NOTIFY,
+}
+
+# Key, button and motion events share one layout.
+INPUT_EVENT = struct.Struct("<BBHIIIIhhhhHBx")
+
+
+def input_event(
+    code: int,
+    detail: int,
+    sequence_num: int,
+    root: int,
+    window: int,
+    x: int,
+    y: int,
+    root_x: int,
+    root_y: int,
+    state: int,
+) -> bytes:
+    """Returns a core input event for a pointer at (x, y) in the window."""
+    timestamp = int(time.monotonic() * 1000) & 0xFFFFFFFF
+    return INPUT_EVENT.pack(
+        code,
+        detail,
+        sequence_num & 0xFFFF,
+        timestamp,
+        root,
+        window,
+        0,
+        root_x,
+        root_y,
+        x,
+        y,
+        state,
+        1,
+    )
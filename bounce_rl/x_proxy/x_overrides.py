@@ -20,28 +20,33 @@ def RequestHandlerTable() -> Dict[int, Callable[[memoryview], Optional[bytes]]]:
 
 
 def ReplyHandlerTable() -> Dict[int, Callable[[memoryview], Optional[bytes]]]:
-    return {QUERY_POINTER: HandleQueryPointerReply}
+    # QueryPointer replies are only rewritten for displays given a pointer, see
+    # ReplyStream.set_pointer.
+    return {}
 
 
 def EventHandlerTable() -> Dict[int, Callable[[memoryview], Optional[bytes]]]:
     return {}
 
 
-def HandleQueryPointerReply(reply: memoryview) -> Optional[bytes]:
+def OverrideQueryPointerReply(reply: memoryview, x: int, y: int) -> Optional[bytes]:
+    """Rewrites a QueryPointer reply to put the pointer at (x, y) relative to the
+    queried window."""
     root, child, rx, ry, wx, wy = struct.unpack(
-        "IIHHHH",
+        "IIhhhh",
         reply[8:24],
     )
-    print("Query pointer real pos:", hex(root), hex(child), rx, ry, wx, wy)
+    logging.debug(
+        "Query pointer real pos: %#x %#x %d %d %d %d", root, child, rx, ry, wx, wy
+    )
     # Write a new cursor position.
     tl, tr = rx - wx, ry - wy
-    x, y = 500, 200
     nrx = tl + x
     nry = tr + y
-    nwx = tl + x
-    nwy = tr + y
-    print("Query pointer fake pos:", nrx, nry, nwx, nwy)
-    reply[16:24] = struct.pack("HHHH", nrx, nry, nwx, nwy)
+    nwx = x
+    nwy = y
+    logging.debug("Query pointer fake pos: %d %d %d %d", nrx, nry, nwx, nwy)
+    reply[16:24] = struct.pack("hhhh", nrx, nry, nwx, nwy)
     return None
 
 
@@ -74,8 +79,9 @@ def HandleChangeWindowAttributesRequest(request: memoryview) -> Optional[bytes]:
     # Add the override redirect attribute.
     update_mask = struct.unpack("I", request[8:12])[0]
     logging.debug(
-        f"Change window attributes, update_mask: {update_mask}, "
-        f"and result: {update_mask & OVERRIDE_REDIRECT}"
+        "Change window attributes, update_mask: %d, and result: %d",
+        update_mask,
+        update_mask & OVERRIDE_REDIRECT,
     )
     if update_mask & OVERRIDE_REDIRECT:
         logging.debug("Overriding redirect on changed window!")
@@ -90,4 +96,4 @@ def HandleChangeWindowAttributesRequest(request: memoryview) -> Optional[bytes]:
 
 def HandleQueryPointerRequest(request: memoryview) -> Optional[bytes]:
     window = struct.unpack("I", request[4:8])[0]
-    print("Query pointer window: ", hex(window))
+    logging.debug("Query pointer window: %#x", window)
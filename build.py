@@ -16,7 +16,11 @@ def build(setup_kwargs):
                     library_dirs=["meson_build/bounce_rl/core/image_capture/"],
                     include_dirs=[numpy.get_include()],
                     runtime_library_dirs=["$ORIGIN"],
-                )
+                ),
+                Extension(
+                    "bounce_rl.x_proxy.native_framer",
+                    ["bounce_rl/x_proxy/native_framer.pyx"],
+                ),
             ],
             build_dir="cython_build",
         ),